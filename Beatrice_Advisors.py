@@ -1,11 +1,23 @@
 import streamlit as st
-from beatrice_helpers import load_metrics_data, load_post_data, calculate_totals, calculate_average_engagement
+from beatrice_helpers import load_metrics_data, load_post_data, calculate_period_metrics, metric_delta
+from beatrice_helpers import coverage_caption
 from beatrice_helpers import create_overview_chart, create_follower_chart, create_unique_visitors_chart
 from beatrice_helpers import create_total_clicks_chart, create_total_impressions_chart, create_reposts_chart, display_manual_entry_form
+from beatrice_helpers import watch_data_versions, display_anomaly_alert, display_post_lift
+from beatrice_helpers import display_posting_patterns, refresh_after_write
 from kpi_generator import display_kpi_generator
+from deck_export import display_batch_export
+from exports import display_data_export
 import webbrowser
 import pandas as pd
 import database as db
+import workspace_cache
+import derived_metrics
+import anomalies
+import forecasting
+import attribution
+import cadence
+from instrumentation import span
 
 
 
@@ -17,12 +29,14 @@ def display_beatrice():
         unsafe_allow_html=True
     )
 
-    tabs = st.tabs(["Account Metrics", "Post Metrics", "Database Management", KPI Generator])
-    # Initialize database if it doesn't exist
-    if not db.db_exists():
-        db.init_db()
+    tabs = st.tabs(["Account Metrics", "Post Metrics", "Database Management", "KPI Generator"])
+    # Initialize the database, creating any tables missing from older database files
+    db.init_db()
+    # Pick up data saved by other sessions without waiting for an interaction
+    watch_data_versions(workspace)
     with tabs[3]:
-        display_kpi_generator()
+        display_kpi_generator(workspace)
+        display_batch_export()
     with tabs[2]:
         st.subheader("Mass Data Upload")
         with st.expander(label="Upload Data"):
@@ -43,6 +57,7 @@ def display_beatrice():
                     db.save_visitor_metrics(visitor_metrics_df, workspace)
                     db.save_content_metrics(content_metrics_df, workspace)
                     db.save_posts_data(post_df, workspace)
+                    refresh_after_write(workspace)
 
                     st.success("Data saved to database successfully!")
                 else:
@@ -51,6 +66,10 @@ def display_beatrice():
         st.subheader("Enter A New Record")
         with st.expander("Manual Entry"):
             display_manual_entry_form(workspace)
+
+        st.subheader("Export Data")
+        with st.expander("Download Data"):
+            display_data_export(workspace, key_prefix="ba_export")
     with st.sidebar.popover(label="Graph Styles", use_container_width=True):
         primary_color = st.color_picker("Primary Color", "#10045A", key="default_primary")
         secondary_color = st.color_picker("Secondary Color", "#025139", key="default_Secondary")
@@ -65,13 +84,15 @@ def display_beatrice():
         visitor_metrics_df = load_metrics_data(visitors_file)
         content_metrics_df = load_metrics_data(content_file)
         post_df = load_post_data(content_file)
+        # Uploaded files go through the same calendar alignment as cached database frames
+        new_followers_df = workspace_cache.align_to_calendar(new_followers_df)
+        visitor_metrics_df = workspace_cache.align_to_calendar(visitor_metrics_df)
+        content_metrics_df = workspace_cache.align_to_calendar(content_metrics_df)
         data_source = "files"
 
     elif has_data:
-        new_followers_df = db.load_followers_data(workspace)
-        visitor_metrics_df = db.load_visitor_metrics(workspace)
-        content_metrics_df = db.load_content_metrics(workspace)
-        post_df = db.load_posts_data(workspace)
+        new_followers_df, visitor_metrics_df, content_metrics_df, post_df = workspace_cache.load_workspace(
+            workspace)
         data_source = "database"
     # If no data is available, show error
     else:
@@ -81,57 +102,127 @@ def display_beatrice():
     with tabs[0]:
         st.subheader("Growth Overview")
         time_horizon = st.radio(label="Time Horizon", options=["LTD", "YTD", "MTD", "QTD"], horizontal=True)
-        total_new_followers, total_unique_visitors, total_impressions, total_clicks, total_reposts = calculate_totals(
-            new_followers_df, visitor_metrics_df, content_metrics_df, time_horizon)
-        average_engagement = calculate_average_engagement(content_metrics_df, time_horizon)
+        # Totals for the period and for the windows it is compared with, in one pass
+        period_metrics = calculate_period_metrics(new_followers_df, visitor_metrics_df, content_metrics_df,
+                                                  time_horizon)
+        st.caption(coverage_caption(new_followers_df, visitor_metrics_df, content_metrics_df, time_horizon))
+        overlay_choice = st.multiselect("Chart Overlays", list(derived_metrics.OVERLAYS), key="ba_overlays")
+        show_anomalies = st.toggle("Flag Anomalies", value=True, key="ba_anomalies")
+        show_forecast = st.toggle("Show Forecast", value=False, key="ba_forecast")
 
         nf_col, uv_col, ti_col = st.columns(3)
         tc_col, tr_col, ae_col = st.columns(3)
 
         with nf_col:
-            st.metric(label="Total New Followers", value=f"{total_new_followers:,}", border=True)
+            st.metric(label="Total New Followers", value=f"{period_metrics['new_followers']['current']:,}",
+                      delta=metric_delta(period_metrics['new_followers'], time_horizon), border=True)
         with uv_col:
-            st.metric(label="Total Unique Visitors", value=f"{total_unique_visitors:,}", border=True)
+            st.metric(label="Total Unique Visitors", value=f"{period_metrics['unique_visitors']['current']:,}",
+                      delta=metric_delta(period_metrics['unique_visitors'], time_horizon), border=True)
         with ti_col:
-            st.metric(label="Total Impressions", value=f"{total_impressions:,}", border=True)
+            st.metric(label="Total Impressions", value=f"{period_metrics['impressions']['current']:,}",
+                      delta=metric_delta(period_metrics['impressions'], time_horizon), border=True)
         with tc_col:
-            st.metric(label="Total Clicks", value=f"{total_clicks:,}", border=True)
+            st.metric(label="Total Clicks", value=f"{period_metrics['clicks']['current']:,}",
+                      delta=metric_delta(period_metrics['clicks'], time_horizon), border=True)
         with tr_col:
-            st.metric(label="Total Reposts", value=f"{total_reposts:,}", border=True)
+            st.metric(label="Total Reposts", value=f"{period_metrics['reposts']['current']:,}",
+                      delta=metric_delta(period_metrics['reposts'], time_horizon), border=True)
         with ae_col:
-            st.metric(label="Average Engagement", value=f"{round(average_engagement * 100, 2)}%", border=True)
+            st.metric(label="Average Engagement",
+                      value=f"{round(period_metrics['engagement']['current'] * 100, 2)}%",
+                      delta=metric_delta(period_metrics['engagement'], time_horizon, points=True), border=True)
+
+        # Derived series are cached per data version, uploaded files are derived on the fly
+        if data_source == "database":
+            derived_followers, derived_visitors, derived_content = derived_metrics.load_derived_workspace(workspace)
+        else:
+            derived_followers, derived_visitors, derived_content = (
+                derived_metrics.derive_metrics(df)
+                for df in (new_followers_df, visitor_metrics_df, content_metrics_df)
+            )
+
+        follower_overlays = derived_metrics.select_overlays(derived_followers, 'Total followers', overlay_choice)
+        visitor_overlays = derived_metrics.select_overlays(derived_visitors, 'Total unique visitors (total)',
+                                                           overlay_choice)
+        clicks_overlays = derived_metrics.select_overlays(derived_content, 'Clicks (total)', overlay_choice)
+        impressions_overlays = derived_metrics.select_overlays(derived_content, 'Unique impressions (organic)',
+                                                               overlay_choice)
+        reposts_overlays = derived_metrics.select_overlays(derived_content, 'Reposts (total)', overlay_choice)
+
+        # Stored flags are read once per update, uploaded files are scored on the fly
+        if data_source == "database":
+            anomaly_flags = anomalies.get_anomaly_flags(workspace)
+        else:
+            anomaly_flags = pd.concat([
+                anomalies.detect_anomalies(df, anomalies.ANOMALY_METRICS[table_name])
+                for table_name, df in (("new_followers", new_followers_df), ("visitor_metrics", visitor_metrics_df),
+                                       ("content_metrics", content_metrics_df))
+            ], ignore_index=True)
+        if not show_anomalies:
+            anomaly_flags = anomaly_flags.iloc[0:0]
+        display_anomaly_alert(anomaly_flags, content_metrics_df.index.max())
+        follower_flags = anomalies.select_flags(anomaly_flags, 'Total followers')
+        visitor_flags = anomalies.select_flags(anomaly_flags, 'Total unique visitors (total)')
+        clicks_flags = anomalies.select_flags(anomaly_flags, 'Clicks (total)')
+        impressions_flags = anomalies.select_flags(anomaly_flags, 'Unique impressions (organic)')
+
+        # Models are refitted only when a table's data version changes, uploaded files are fitted on the fly
+        follower_forecast = impressions_forecast = None
+        if show_forecast and data_source == "database":
+            follower_forecast = forecasting.forecast_frame(
+                forecasting.get_model(workspace, "new_followers", 'Total followers'))
+            impressions_forecast = forecasting.forecast_frame(
+                forecasting.get_model(workspace, "content_metrics", 'Unique impressions (organic)'))
+        elif show_forecast:
+            follower_forecast = forecasting.forecast_frame(forecasting.fit_frame(new_followers_df, 'Total followers'))
+            impressions_forecast = forecasting.forecast_frame(
+                forecasting.fit_frame(content_metrics_df, 'Unique impressions (organic)'))
 
         overview_chart = create_overview_chart(new_followers_df, visitor_metrics_df, content_metrics_df,
                                                primary_color=primary_color, secondary_color=secondary_color,
                                                period=time_horizon)
         follower_chart = create_follower_chart(new_followers_df, period=time_horizon, primary_color=primary_color,
-                                               secondary_color=secondary_color)
+                                               secondary_color=secondary_color,
+                                               overlays=follower_overlays,
+                                               anomalies=follower_flags,
+                                               forecast=follower_forecast)
         unique_visitors_chart = create_unique_visitors_chart(visitor_metrics_df, period=time_horizon,
                                                              primary_color=primary_color,
-                                                             secondary_color=secondary_color)
+                                                             secondary_color=secondary_color,
+                                                             overlays=visitor_overlays,
+                                                             anomalies=visitor_flags)
         total_clicks_chart = create_total_clicks_chart(content_metrics_df, period=time_horizon,
-                                                       primary_color=primary_color, secondary_color=secondary_color)
+                                                       primary_color=primary_color, secondary_color=secondary_color,
+                                                       overlays=clicks_overlays,
+                                                       anomalies=clicks_flags)
         total_impressions_chart = create_total_impressions_chart(content_metrics_df, period=time_horizon,
                                                                  primary_color=primary_color,
-                                                                 secondary_color=secondary_color)
+                                                                 secondary_color=secondary_color,
+                                                                 overlays=impressions_overlays,
+                                                                 anomalies=impressions_flags,
+                                                                 forecast=impressions_forecast)
         reposts_chart = create_reposts_chart(content_metrics_df, period=time_horizon, primary_color=primary_color,
-                                             secondary_color=secondary_color)
-
-        nf_chart_col, uv_chart_col = st.columns(2)
-        tc_chart_col, ti_chart_col = st.columns(2)
-        tr_chart_col, temp_col = st.columns(2)
-
-        with nf_chart_col:
-            st.write(follower_chart)
-        with uv_chart_col:
-            st.write(unique_visitors_chart)
-        with tc_chart_col:
-            st.write(total_clicks_chart)
-        with ti_chart_col:
-            st.write(total_impressions_chart)
-        with tr_chart_col:
-            st.write(reposts_chart)
-        st.write(overview_chart)
+                                             secondary_color=secondary_color,
+                                             overlays=reposts_overlays)
+
+        # Plotly figures are serialized when written to the page
+        with span("render.charts"):
+            nf_chart_col, uv_chart_col = st.columns(2)
+            tc_chart_col, ti_chart_col = st.columns(2)
+            tr_chart_col, temp_col = st.columns(2)
+
+            with nf_chart_col:
+                st.write(follower_chart)
+            with uv_chart_col:
+                st.write(unique_visitors_chart)
+            with tc_chart_col:
+                st.write(total_clicks_chart)
+            with ti_chart_col:
+                st.write(total_impressions_chart)
+            with tr_chart_col:
+                st.write(reposts_chart)
+            st.write(overview_chart)
 
     # Display post metrics
     with tabs[1]:
@@ -164,7 +255,26 @@ def display_beatrice():
             with pe_col:
                 st.metric(label="Engagement rate", value=f"{selected_post['Engagement rate']:.2%}", border=True)
 
+            # Stored attribution is read once per refresh, uploaded files are joined on the fly
+            if data_source == "database":
+                post_attribution = attribution.get_post_attribution(workspace)
+            else:
+                post_attribution = attribution.attribute_posts(post_df, content_metrics_df)
+            display_post_lift(post_attribution, post_title)
+
             if st.button("View Post"):
                 webbrowser.open(f"{selected_post['Post link']}")
+
+            st.subheader("Posting Patterns")
+            heatmap_layout = st.radio("Heatmap Columns", list(cadence.HEATMAP_LAYOUTS), horizontal=True,
+                                      key="ba_heatmap_layout")
+            # Aggregated in SQLite once per posts version, uploaded files are grouped on the fly
+            if data_source == "database":
+                heatmap_cells = cadence.get_posting_heatmap(workspace, heatmap_layout)
+                cadence_rows = cadence.get_posting_cadence(workspace)
+            else:
+                heatmap_cells = cadence.posting_heatmap_frame(post_df, heatmap_layout)
+                cadence_rows = cadence.posting_cadence_frame(post_df)
+            display_posting_patterns(heatmap_cells, cadence_rows, heatmap_layout, "ba", primary_color)
         else:
             st.error("No posts data available")
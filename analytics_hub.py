@@ -0,0 +1,267 @@
+"""
+Command-line entry point for batch jobs that do not need the Streamlit UI
+
+Runs in its own process at a lower CPU priority, so cron jobs do not slow
+down interactive sessions. Everything goes through database.py, so open
+sessions pick up the changes through the data versions.
+
+Usage (from the repository root):
+    python -m analytics_hub ingest exports/                    # one subdirectory per workspace
+    python -m analytics_hub ingest downloads/*.xls --workspace "Beatrice Advisors"
+    python -m analytics_hub rebuild --workspace "Christina Lewis"
+    python -m analytics_hub export --workspace "Beatrice Advisors" --format xlsx --output data.xlsx
+    python -m analytics_hub report --year 2025 --periods YTD QTD --output decks.zip
+    python -m analytics_hub vacuum
+    python -m analytics_hub maintain --full-check                # checkpoint, vacuum, optimize, check, backup
+    python -m analytics_hub watch shared/                      # ingest new exports as they arrive
+"""
+import argparse
+import datetime as dt
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import database as db
+import anomalies
+import attribution
+import exports
+import maintenance
+from beatrice_helpers import load_metrics_data, load_post_data
+from deck_export import EXPORT_PERIODS, export_decks
+
+EXPORT_EXTENSIONS = (".xls", ".xlsx")
+
+# Export kinds, with a column only that kind of export has and the function that saves it
+EXPORT_KINDS = {
+    "followers": ("Total followers", db.save_followers_data),
+    "visitors": ("Total unique visitors (total)", db.save_visitor_metrics),
+    "content": ("Unique impressions (organic)", db.save_content_metrics)
+}
+
+# Added to the process's nice value, batch jobs give way to the Streamlit server
+BATCH_NICE = 10
+
+
+def find_exports(paths):
+    """Expand files and directories to the LinkedIn export files below them, in sorted order"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, name) for name in names
+                          if name.lower().endswith(EXPORT_EXTENSIONS) and not name.startswith("~$")]
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def parse_export(path, db_path=None):
+    """
+    Read one LinkedIn export, run in a worker process
+
+    Parameters:
+    path (str): The .xls or .xlsx file
+    db_path (str): Database path, for worker processes that do not share the caller's settings
+
+    Returns:
+    tuple: (path, kind, metrics frame, posts frame or None, error message or None)
+    """
+    if db_path:
+        db.DB_PATH = db_path
+    try:
+        df = load_metrics_data(path)
+        for kind, (column, _) in EXPORT_KINDS.items():
+            if column in df.columns:
+                posts = load_post_data(path) if kind == "content" else None
+                return path, kind, df, posts, None
+        return path, None, None, None, "None of the required sheets have been found"
+    except Exception as e:
+        return path, None, None, None, str(e)
+
+
+def ingest(paths, workspace=None, max_workers=None):
+    """
+    Parse LinkedIn exports in parallel and save them
+
+    Files are parsed in worker processes and saved one after the other from
+    this process, as SQLite takes one writer at a time. Afterwards the anomaly
+    flags and post attribution of every touched workspace are brought up to
+    date, so the next page load does not have to.
+
+    Parameters:
+    paths (list): Export files and directories of them
+    workspace (str): Workspace of every file, by default the name of the directory each file is in
+    max_workers (int): Number of worker processes, defaults to one per CPU
+
+    Returns:
+    tuple: Number of files saved and a list of (path, error) for files that failed
+    """
+    files = find_exports(paths)
+    if not files:
+        return 0, []
+
+    db.init_db()
+    saved = 0
+    failed = []
+    touched = set()
+    max_workers = max_workers or min(len(files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for path, kind, df, posts, error in executor.map(parse_export, files, [db.DB_PATH] * len(files)):
+            if error is not None:
+                failed.append((path, error))
+                print(f"failed  {path}: {error}", file=sys.stderr)
+                continue
+            file_workspace = workspace or os.path.basename(os.path.dirname(os.path.abspath(path)))
+            EXPORT_KINDS[kind][1](df, file_workspace)
+            if posts is not None and not posts.empty:
+                db.save_posts_data(posts, file_workspace)
+            touched.add(file_workspace)
+            saved += 1
+            print(f"saved   {path}: {len(df)} {kind} rows to {file_workspace}")
+
+    for name in sorted(touched):
+        rebuild_rollups(name, full=False)
+    return saved, failed
+
+
+def rebuild_rollups(workspace, full=True):
+    """Bring the anomaly flags and post attribution of a workspace up to date, from scratch when full"""
+    flags = anomalies.update_anomalies(workspace, full=full)
+    posts = attribution.refresh_attribution(workspace, full=full)
+    print(f"rollups {workspace}: {flags} anomaly flags, {posts} posts attributed")
+
+
+def rebuild(workspaces):
+    """
+    Rebuild the snapshots, anomaly flags and post attribution of workspaces from SQLite
+
+    Parameters:
+    workspaces (list): Workspace names, every workspace in the database when empty
+    """
+    db.init_db()
+    for workspace in workspaces or db.get_workspaces():
+        for table_name in db.LOAD_QUERIES:
+            rows = db.refresh_snapshot(table_name, workspace)
+            print(f"snapshot {workspace} {table_name}: {len(rows)} rows")
+        rebuild_rollups(workspace)
+
+
+def print_database_stats(stats):
+    """Print the page statistics of maintenance.database_stats"""
+    print(f"file {stats['file_bytes'] / 2 ** 20:,.1f} MB, write-ahead log {stats['wal_bytes'] / 2 ** 20:,.1f} MB, "
+          f"{stats['page_count']:,} pages of {stats['page_size']:,} bytes, {stats['free_pages']:,} free "
+          f"({stats['free_ratio']:.1%}), auto_vacuum {stats['auto_vacuum']}, journal {stats['journal_mode']}")
+    for table in stats["tables"]:
+        print(f"  {table['name']:<40} {table['pages']:>8,} pages {table['bytes'] / 2 ** 20:>8,.2f} MB "
+              f"{table['fill']:>6.1%} full {table['fragmentation']:>6.1%} fragmented")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="analytics_hub", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help=f"Database file, defaults to {db.DB_PATH}")
+    parser.add_argument("--nice", type=int, default=BATCH_NICE,
+                        help="Lower the CPU priority by this much, 0 to keep it (ignored on Windows)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Save LinkedIn export files to the database")
+    ingest_parser.add_argument("paths", nargs="+",
+                               help="Export files, or directories with one subdirectory per workspace")
+    ingest_parser.add_argument("--workspace", help="Save every file to this workspace")
+    ingest_parser.add_argument("--workers", type=int, help="Parallel parsing processes, defaults to one per CPU")
+
+    rebuild_parser = commands.add_parser("rebuild", help="Rebuild snapshots, anomaly flags and post attribution")
+    rebuild_parser.add_argument("--workspace", action="append", default=[], help="Repeat for several, default all")
+
+    export_parser = commands.add_parser("export", help="Export a workspace's data as CSV or Excel")
+    export_parser.add_argument("--workspace", required=True)
+    export_parser.add_argument("--table", choices=list(exports.EXPORT_TABLES), help="One table, default all")
+    export_parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    export_parser.add_argument("--output", help="Output file, named after the workspace by default")
+
+    report_parser = commands.add_parser("report", help="Build KPI and chart decks")
+    report_parser.add_argument("--workspace", action="append", default=[], help="Repeat for several, default all")
+    report_parser.add_argument("--year", type=int, default=dt.date.today().year, help="Performance year")
+    report_parser.add_argument("--periods", nargs="+", choices=EXPORT_PERIODS, default=["YTD", "QTD"])
+    report_parser.add_argument("--combined", action="store_true",
+                               help="One deck instead of a zip with one per workspace")
+    report_parser.add_argument("--output", help="Output file, named after the year by default")
+
+    commands.add_parser("vacuum", help="Reclaim free space and refresh the query planner statistics")
+
+    maintain_parser = commands.add_parser("maintain", help="Checkpoint, vacuum, optimize, check and back up")
+    maintain_parser.add_argument("--no-backup", action="store_true", help="Skip the backup")
+    maintain_parser.add_argument("--backup-dir", default=maintenance.BACKUP_DIR)
+    maintain_parser.add_argument("--full-check", action="store_true", help="Full integrity check instead of quick")
+    maintain_parser.add_argument("--stats", action="store_true", help="Only print the page statistics")
+
+    watch_parser = commands.add_parser("watch", help="Ingest new export files as they appear in a folder")
+    watch_parser.add_argument("folder", help="Folder with one subdirectory per workspace")
+    watch_parser.add_argument("--workspace", help="Save every file to this workspace")
+    watch_parser.add_argument("--interval", type=float, help="Seconds between scans")
+    watch_parser.add_argument("--debounce", type=float, help="Seconds a file must stay unchanged before it is read")
+    watch_parser.add_argument("--once", action="store_true", help="Scan once instead of until interrupted")
+
+    args = parser.parse_args(argv)
+    if args.db:
+        db.DB_PATH = args.db
+    if args.nice and hasattr(os, "nice"):
+        os.nice(args.nice)
+
+    if args.command == "ingest":
+        saved, failed = ingest(args.paths, args.workspace, args.workers)
+        print(f"{saved} files saved, {len(failed)} failed")
+        return 1 if failed else 0
+
+    if args.command == "rebuild":
+        rebuild(args.workspace)
+        return 0
+
+    if args.command == "export":
+        if args.table:
+            export = exports.export_table(args.table, args.workspace, args.format)
+        else:
+            export = exports.export_workspace(args.workspace, args.format)
+        output = args.output or exports.export_file_name(args.workspace, args.table, args.format)
+        with export, open(output, "wb") as f:
+            shutil.copyfileobj(export, f)
+        print(f"wrote {output}")
+        return 0
+
+    if args.command == "report":
+        workspaces = args.workspace or db.get_workspaces()
+        deck = export_decks(workspaces, args.year, args.periods, combined=args.combined)
+        output = args.output or f"performance_projections_{args.year}.{'pptx' if args.combined else 'zip'}"
+        with open(output, "wb") as f:
+            f.write(deck.getvalue())
+        print(f"wrote {output} for {len(workspaces)} workspaces")
+        return 0
+
+    if args.command == "vacuum":
+        size_before, size_after = db.vacuum_database()
+        print(f"database {size_before / 2 ** 20:,.1f} MB -> {size_after / 2 ** 20:,.1f} MB")
+        return 0
+
+    if args.command == "maintain":
+        db.init_db()
+        if not args.stats:
+            report = maintenance.run_maintenance(not args.no_backup, args.full_check, args.backup_dir, convert=True)
+            for task, result in report.items():
+                if task != "errors":
+                    print(f"{task}: {result}")
+            for task, error in report["errors"].items():
+                print(f"failed  {task}: {error}", file=sys.stderr)
+        print_database_stats(maintenance.database_stats())
+        return 1 if not args.stats and (report["errors"] or report.get("integrity_problems")) else 0
+
+    if args.command == "watch":
+        # watcher builds on the ingest helpers of this module
+        import watcher
+        poll = watcher.POLL_SECONDS if args.interval is None else args.interval
+        debounce = watcher.DEBOUNCE_SECONDS if args.debounce is None else args.debounce
+        watcher.watch(args.folder, args.workspace, poll, debounce, once=args.once)
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
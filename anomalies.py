@@ -0,0 +1,272 @@
+import sqlite3
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+import database as db
+import workspace_cache
+from workspace_cache import GAP_COLUMN, align_to_calendar
+from instrumentation import timed, record_cache_hit
+
+# Daily series checked for spikes and drops, per table
+ANOMALY_METRICS = {
+    "new_followers": ["Total followers"],
+    "visitor_metrics": ["Total unique visitors (total)", "Total page views (total)"],
+    "content_metrics": ["Unique impressions (organic)", "Clicks (total)"]
+}
+
+# Trailing days the level and spread of a day are measured against
+BASELINE_DAYS = 28
+# Earlier weeks the same weekday is compared with for the day-of-week pattern
+SEASONAL_WEEKS = 8
+# Observed days needed in the baseline window before a day is scored
+MIN_HISTORY_DAYS = 14
+# Same-weekday values needed before the day-of-week pattern is applied
+MIN_SEASONAL_SAMPLES = 4
+
+# Days scoring at least this far from the baseline are flagged, in robust standard deviations
+ANOMALY_THRESHOLD = 3.5
+# Scales a median absolute deviation to a standard deviation for normally distributed data
+MAD_SCALE = 1.4826
+# Lower bound for the spread, so flat series such as days without follower gains do not flag every change
+MIN_SPREAD = 1.0
+
+# Days counted as recent for the alert shown above the charts
+ALERT_DAYS = 7
+
+# (workspace, anomaly_flags data version) -> flags frame, one entry per workspace
+_flags_cache = {}
+# workspace -> data versions the last update ran at, so unchanged workspaces skip the watermark query
+_checked_versions = {}
+_lock = threading.Lock()
+
+
+def _lagged(values, rows, lags):
+    """Matrix with the value lags[j] days before rows[i] in cell (i, j), NaN before the first day"""
+    positions = rows[:, None] - lags[None, :]
+    lagged = values[np.maximum(positions, 0)]
+    lagged[positions < 0] = np.nan
+    return lagged
+
+
+def score_days(values, rows):
+    """
+    Robust anomaly scores for selected days of a daily series
+
+    Each day is compared with the median of the BASELINE_DAYS before it,
+    shifted by its weekday's offset from the median of the last SEASONAL_WEEKS
+    weeks. The distance is divided by the median absolute deviation of the
+    baseline window, so a single earlier spike neither moves the baseline nor
+    hides the next one.
+
+    Parameters:
+    values (ndarray): Daily values on a regular calendar, gaps as NaN
+    rows (ndarray): Positions of the days to score
+
+    Returns:
+    tuple: Expected values and scores for the rows, NaN where the history is too short
+    """
+    with warnings.catch_warnings():
+        # Windows without any observed day give all-NaN slices, which end up as NaN scores
+        warnings.simplefilter("ignore", RuntimeWarning)
+        recent = _lagged(values, rows, np.arange(1, BASELINE_DAYS + 1))
+        level = np.nanmedian(recent, axis=1)
+        spread = np.nanmedian(np.abs(recent - level[:, None]), axis=1) * MAD_SCALE
+
+        seasonal = _lagged(values, rows, 7 * np.arange(1, SEASONAL_WEEKS + 1))
+        season = _lagged(values, rows, np.arange(1, 7 * SEASONAL_WEEKS + 1))
+        weekday_offset = np.nanmedian(seasonal, axis=1) - np.nanmedian(season, axis=1)
+        weekday_offset = np.where(np.sum(~np.isnan(seasonal), axis=1) >= MIN_SEASONAL_SAMPLES, weekday_offset, 0.0)
+
+    expected = level + weekday_offset
+    scores = (values[rows] - expected) / np.maximum(spread, MIN_SPREAD)
+    short = np.sum(~np.isnan(recent), axis=1) < MIN_HISTORY_DAYS
+    expected[short] = np.nan
+    scores[short] = np.nan
+    return expected, scores
+
+
+def _day_numbers(index):
+    return index.values.astype("datetime64[D]").astype(np.int64)
+
+
+def detect_anomalies(df, columns, start_day=None):
+    """
+    Find anomalous days in the metric columns of a daily frame
+
+    Parameters:
+    df (DataFrame): A daily metrics frame, aligned to the calendar if it is not already
+    columns (list): The columns to check
+    start_day (int): Only score days from this day number on, all days when None
+
+    Returns:
+    DataFrame: One row per flagged day with metric, date, value, expected and score columns
+    """
+    df = align_to_calendar(df)
+    flags = []
+    if df.empty:
+        return pd.DataFrame(flags, columns=["metric", "date", "value", "expected", "score"])
+
+    observed = ~df[GAP_COLUMN].to_numpy()
+    days = _day_numbers(df.index)
+    rows = np.flatnonzero(observed if start_day is None else observed & (days >= start_day))
+    for column in columns:
+        if column not in df.columns or not len(rows):
+            continue
+        values = np.where(observed, df[column].to_numpy(dtype=np.float64, na_value=np.nan), np.nan)
+        expected, scores = score_days(values, rows)
+        hits = np.abs(scores) >= ANOMALY_THRESHOLD
+        for row, value, expect, score in zip(rows[hits], values[rows][hits], expected[hits], scores[hits]):
+            flags.append((column, df.index[row], float(value), float(expect), float(score)))
+    return pd.DataFrame(flags, columns=["metric", "date", "value", "expected", "score"])
+
+
+def _read_watermarks(c, workspace):
+    c.execute("SELECT table_name, last_day, day_count, version FROM anomaly_watermarks WHERE workspace = ?",
+              (workspace,))
+    return {table_name: (last_day, day_count, version) for table_name, last_day, day_count, version in c.fetchall()}
+
+
+@timed
+def update_anomalies(workspace, full=False):
+    """
+    Score the days added or revised in a workspace since the last update and store the flags
+
+    Each table keeps a watermark with the last day scored, the number of days
+    up to it and the data version it was scored at. Tables whose version has
+    not moved since their watermark are skipped, tables without one are
+    scored from the start. Otherwise the days from the earliest day the writes
+    since the watermark touched are scored again, scores only look back so
+    the days before it keep theirs. When those writes are no longer logged,
+    or days up to the watermark were added or deleted without being logged,
+    the table is scored again from the start.
+
+    Parameters:
+    workspace (str): The workspace name
+    full (bool): Score every day again, ignoring the watermarks
+
+    Returns:
+    int: Number of flags written
+    """
+    versions = db.get_data_versions(workspace)
+    with _lock:
+        if not full and _checked_versions.get(workspace) == versions:
+            return 0
+
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        c = conn.cursor()
+        watermarks = {} if full else _read_watermarks(c, workspace)
+
+        updates = []
+        for table_name, columns in ANOMALY_METRICS.items():
+            version = versions.get(table_name, 0)
+            last_day, day_count, seen_version = watermarks.get(table_name, (None, 0, None))
+            # Tables without a watermark were never scored, whatever their version
+            if seen_version is not None and version == seen_version:
+                continue
+
+            df = workspace_cache.get_frame(workspace, table_name, version)
+            days = _day_numbers(df.index[~df[GAP_COLUMN]]) if not df.empty else np.array([], dtype=np.int64)
+            start_day = None
+            if last_day is not None and np.searchsorted(days, last_day, side="right") == day_count:
+                changed_day = db.first_changed_day(c, table_name, workspace, seen_version, version)
+                if changed_day is not None:
+                    start_day = min(changed_day, last_day + 1)
+            flags = detect_anomalies(df, columns, start_day)
+            new_last_day = int(days[-1]) if len(days) else None
+            updates.append((table_name, start_day, flags, new_last_day, len(days), version))
+
+        written = 0
+        if updates:
+            c.execute("BEGIN")
+            for table_name, start_day, flags, last_day, day_count, version in updates:
+                if start_day is None:
+                    c.execute("DELETE FROM anomaly_flags WHERE workspace = ? AND table_name = ?", (workspace, table_name))
+                else:
+                    c.execute("DELETE FROM anomaly_flags WHERE workspace = ? AND table_name = ? AND day >= ?",
+                              (workspace, table_name, start_day))
+                c.executemany(
+                    '''INSERT OR REPLACE INTO anomaly_flags (workspace, table_name, metric, day, value, expected, score)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    [(workspace, table_name, metric, db.to_day(date), value, expected, score)
+                     for metric, date, value, expected, score in flags.itertuples(index=False, name=None)]
+                )
+                c.execute(
+                    '''INSERT OR REPLACE INTO anomaly_watermarks (workspace, table_name, last_day, day_count, version)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    (workspace, table_name, last_day, day_count, version)
+                )
+                written += len(flags)
+            db.bump_data_version(c, "anomaly_flags", workspace)
+            conn.commit()
+        conn.close()
+
+        with _lock:
+            _checked_versions[workspace] = db.get_data_versions(workspace)
+        return written
+    except sqlite3.Error:
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        return 0
+
+
+def get_anomaly_flags(workspace, version=None):
+    """
+    Get the stored flags of a workspace, read once per anomaly_flags data version
+
+    Parameters:
+    workspace (str): The workspace name
+    version (int): The current 'anomaly_flags' data version, looked up when not given
+
+    Returns:
+    DataFrame: Flags with metric, date, value, expected and score columns, oldest first
+    """
+    if version is None:
+        version = db.get_data_versions(workspace).get("anomaly_flags", 0)
+
+    key = (workspace, version)
+    with _lock:
+        flags = _flags_cache.get(key)
+    record_cache_hit("anomalies.flags", flags is not None)
+    if flags is not None:
+        return flags
+
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        flags = pd.read_sql(
+            '''SELECT metric, day AS date, value, expected, score FROM anomaly_flags
+               WHERE workspace = ? ORDER BY day, metric''',
+            conn, params=(workspace,)
+        )
+        conn.close()
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        if 'conn' in locals():
+            conn.close()
+        flags = pd.DataFrame(columns=["metric", "date", "value", "expected", "score"])
+    flags["date"] = pd.to_datetime(flags["date"].astype("int64"), unit="D")
+
+    with _lock:
+        for stale_key in [k for k in _flags_cache if k[0] == workspace]:
+            del _flags_cache[stale_key]
+        _flags_cache[key] = flags
+    return flags
+
+
+def select_flags(flags, column):
+    """
+    Pick the flags of one metric for a chart
+
+    Returns:
+    DataFrame: The value and score of each flagged day, indexed by date
+    """
+    return flags.loc[flags["metric"] == column, ["date", "value", "score"]].set_index("date")
+
+
+def recent_flags(flags, latest, days=ALERT_DAYS):
+    """Flags of the last days up to and including the latest date, newest first"""
+    if flags.empty or pd.isna(latest):
+        return flags.iloc[0:0]
+    cutoff = pd.Timestamp(latest).normalize() - pd.Timedelta(days=days - 1)
+    return flags[flags["date"] >= cutoff].sort_values(["date", "metric"], ascending=[False, True])
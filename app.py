@@ -1,6 +1,9 @@
 import streamlit as st
 from Beatrice_Advisors import display_beatrice
 from Christina_Lewis import display_christina
+from beatrice_helpers import display_timing_panel, display_database_health
+import instrumentation
+import maintenance
 
 st.set_page_config(
     page_title="Data Metrics Visualization",
@@ -14,12 +17,26 @@ def app():
         #
         # )
         workspace = st.selectbox("Workspace", options=["Beatrice Advisors", "Christina Lewis"])
+        show_timings = st.toggle("Show Timings", key="show_timings")
+        show_database_health = st.toggle("Show Database Health", key="show_database_health")
         st.divider()
 
-    if workspace == "Beatrice Advisors":
-        display_beatrice()
-    else:
-        display_christina()
+    instrumentation.start_rerun(workspace)
+    try:
+        if workspace == "Beatrice Advisors":
+            display_beatrice()
+        else:
+            display_christina()
+    finally:
+        rerun_summary = instrumentation.finish_rerun(log=show_timings)
+
+    # After the page, which creates the tables, so the run can be logged
+    maintenance.start_scheduled_maintenance()
+
+    if show_timings:
+        display_timing_panel(rerun_summary)
+    if show_database_health:
+        display_database_health()
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -0,0 +1,254 @@
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+import database as db
+import workspace_cache
+from workspace_cache import GAP_COLUMN, align_to_calendar
+from instrumentation import timed, record_cache_hit
+
+# Days from a post's created date, the date included, whose daily totals are attributed to it
+ATTRIBUTION_DAYS = 7
+
+# Daily content columns summed per post, by their post_attribution column
+ATTRIBUTION_COLUMNS = {
+    "impressions": "Unique impressions (organic)",
+    "clicks": "Clicks (total)",
+    "reposts": "Reposts (total)"
+}
+
+ATTRIBUTION_FIELDS = (list(ATTRIBUTION_COLUMNS) + ["observed_days"]
+                      + [f"baseline_{name}" for name in ATTRIBUTION_COLUMNS] + ["baseline_days"])
+
+# (workspace, post_attribution data version) -> attribution frame, one entry per workspace
+_attribution_cache = {}
+# workspace -> data versions the last refresh ran at, so unchanged workspaces skip the watermark query
+_checked_versions = {}
+_lock = threading.Lock()
+
+
+def attribute_days(created_days, content_days, content_values, window=ATTRIBUTION_DAYS):
+    """
+    Sum daily totals over the window after each post and the window before it
+
+    Both windows of every post are found with searchsorted on the sorted
+    content days and summed from one prefix sum per column, so the join
+    costs O((posts + days) log days) instead of posts x days.
+
+    Parameters:
+    created_days (ndarray): Day number each post was created
+    content_days (ndarray): Sorted day numbers of the observed content days
+    content_values (dict): Mapping of ATTRIBUTION_COLUMNS key to the values of those days
+    window (int): Days per window
+
+    Returns:
+    dict: Mapping of ATTRIBUTION_FIELDS name to an array with one value per post
+    """
+    created_days = np.asarray(created_days, dtype=np.int64)
+    after_start = np.searchsorted(content_days, created_days, side="left")
+    after_end = np.searchsorted(content_days, created_days + window, side="left")
+    before_start = np.searchsorted(content_days, created_days - window, side="left")
+
+    fields = {}
+    for name, values in content_values.items():
+        prefix = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(values, out=prefix[1:])
+        fields[name] = prefix[after_end] - prefix[after_start]
+        fields[f"baseline_{name}"] = prefix[after_start] - prefix[before_start]
+    fields["observed_days"] = after_end - after_start
+    fields["baseline_days"] = after_start - before_start
+    return fields
+
+
+def _content_arrays(content_df):
+    """Day numbers and attributed column values of the observed days of a content frame"""
+    content_df = align_to_calendar(content_df)
+    if content_df.empty:
+        return np.array([], dtype=np.int64), {name: np.array([], dtype=np.int64) for name in ATTRIBUTION_COLUMNS}
+    content_df = content_df[~content_df[GAP_COLUMN]]
+    days = content_df.index.values.astype("datetime64[D]").astype(np.int64)
+    values = {name: content_df[column].to_numpy(dtype=np.int64, na_value=0)
+              for name, column in ATTRIBUTION_COLUMNS.items()}
+    return days, values
+
+
+@timed
+def attribute_posts(post_df, content_df):
+    """
+    Attribute daily content totals to the posts of a frame, for data that is not stored
+
+    Parameters:
+    post_df (DataFrame): Posts indexed by title with a 'Created date' column
+    content_df (DataFrame): Daily content metrics
+
+    Returns:
+    DataFrame: ATTRIBUTION_FIELDS columns indexed by post title, posts without a created date are left out
+    """
+    created = pd.to_datetime(post_df["Created date"], errors="coerce").dropna()
+    created_days = created.values.astype("datetime64[D]").astype(np.int64)
+    days, values = _content_arrays(content_df)
+    return pd.DataFrame(attribute_days(created_days, days, values), index=created.index,
+                        columns=ATTRIBUTION_FIELDS)
+
+
+@timed
+def refresh_attribution(workspace, full=False):
+    """
+    Bring the stored attribution of a workspace's posts up to date
+
+    A watermark keeps the last content day, the number of content days up to
+    it and the content and posts data versions of the last refresh. Posts that
+    are new or whose created date changed are attributed, and when content
+    changed, so are the posts whose windows reach the earliest content day the
+    writes since the watermark touched. Posts that were removed lose their
+    rows. When those writes are no longer logged, or content days up to the
+    watermark were added or deleted without being logged, every post is
+    attributed again.
+
+    Parameters:
+    workspace (str): The workspace name
+    full (bool): Attribute every post again, ignoring the watermark
+
+    Returns:
+    int: Number of posts attributed
+    """
+    versions = db.get_data_versions(workspace)
+    with _lock:
+        if not full and _checked_versions.get(workspace) == versions:
+            return 0
+
+    content_version = versions.get("content_metrics", 0)
+    posts_version = versions.get("posts", 0)
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        c = conn.cursor()
+        c.execute("SELECT last_day, day_count, content_version, posts_version FROM attribution_watermarks "
+                  "WHERE workspace = ?", (workspace,))
+        state = None if full else c.fetchone()
+        if state is not None and state[2:] == (content_version, posts_version):
+            conn.close()
+            with _lock:
+                _checked_versions[workspace] = versions
+            return 0
+
+        content_df = workspace_cache.get_frame(workspace, "content_metrics", content_version)
+        days, values = _content_arrays(content_df)
+        posts = pd.read_sql(
+            "SELECT post_title, created_day FROM posts WHERE workspace = ? AND created_day IS NOT NULL",
+            conn, params=(workspace,)
+        )
+        stored = pd.read_sql("SELECT post_title, created_day FROM post_attribution WHERE workspace = ?",
+                             conn, params=(workspace,))
+
+        changed_day = None
+        if state is not None and state[2] != content_version:
+            changed_day = db.first_changed_day(c, "content_metrics", workspace, state[2], content_version)
+        rebuild = (state is None or state[0] is None
+                   or np.searchsorted(days, state[0], side="right") != state[1]
+                   or (state[2] != content_version and changed_day is None))
+        if rebuild:
+            targets = posts
+            removed = stored["post_title"]
+        else:
+            merged = posts.merge(stored, on="post_title", how="left", suffixes=("", "_stored"))
+            changed = merged["created_day"] != merged["created_day_stored"]
+            if changed_day is not None:
+                # Windows that reach the first revised day, the baseline window ends where the post's begins
+                changed |= merged["created_day"] + ATTRIBUTION_DAYS > changed_day
+            targets = posts[changed.to_numpy()]
+            removed = stored.loc[~stored["post_title"].isin(posts["post_title"]), "post_title"]
+
+        fields = attribute_days(targets["created_day"].to_numpy(), days, values)
+        rows = [
+            (workspace, title, int(created_day), *(int(fields[name][i]) for name in ATTRIBUTION_FIELDS))
+            for i, (title, created_day) in enumerate(targets.itertuples(index=False, name=None))
+        ]
+
+        c.execute("BEGIN")
+        if rebuild:
+            c.execute("DELETE FROM post_attribution WHERE workspace = ?", (workspace,))
+        else:
+            c.executemany("DELETE FROM post_attribution WHERE workspace = ? AND post_title = ?",
+                          [(workspace, title) for title in removed])
+        c.executemany(
+            f"INSERT OR REPLACE INTO post_attribution (workspace, post_title, created_day, "
+            f"{', '.join(ATTRIBUTION_FIELDS)}) VALUES ({', '.join('?' * (len(ATTRIBUTION_FIELDS) + 3))})",
+            rows
+        )
+        c.execute(
+            '''INSERT OR REPLACE INTO attribution_watermarks
+               (workspace, last_day, day_count, content_version, posts_version) VALUES (?, ?, ?, ?, ?)''',
+            (workspace, int(days[-1]) if len(days) else None, len(days), content_version, posts_version)
+        )
+        db.bump_data_version(c, "post_attribution", workspace)
+        conn.commit()
+        conn.close()
+
+        with _lock:
+            _checked_versions[workspace] = db.get_data_versions(workspace)
+        return len(rows)
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        return 0
+
+
+def get_post_attribution(workspace, version=None):
+    """
+    Get the stored attribution of a workspace's posts, read once per post_attribution data version
+
+    Parameters:
+    workspace (str): The workspace name
+    version (int): The current 'post_attribution' data version, looked up when not given
+
+    Returns:
+    DataFrame: ATTRIBUTION_FIELDS columns indexed by post title
+    """
+    if version is None:
+        version = db.get_data_versions(workspace).get("post_attribution", 0)
+
+    key = (workspace, version)
+    with _lock:
+        attribution = _attribution_cache.get(key)
+    record_cache_hit("attribution.posts", attribution is not None)
+    if attribution is not None:
+        return attribution
+
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        attribution = pd.read_sql(
+            f"SELECT post_title, {', '.join(ATTRIBUTION_FIELDS)} FROM post_attribution WHERE workspace = ?",
+            conn, params=(workspace,), index_col="post_title"
+        )
+        conn.close()
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        if 'conn' in locals():
+            conn.close()
+        attribution = pd.DataFrame(columns=ATTRIBUTION_FIELDS)
+
+    with _lock:
+        for stale_key in [k for k in _attribution_cache if k[0] == workspace]:
+            del _attribution_cache[stale_key]
+        _attribution_cache[key] = attribution
+    return attribution
+
+
+def post_lifts(attribution):
+    """
+    Daily averages in each post's window against the window before it
+
+    Parameters:
+    attribution (DataFrame): From get_post_attribution or attribute_posts
+
+    Returns:
+    DataFrame: One column per ATTRIBUTION_COLUMNS key, 0.1 for 10% more per day than before the post,
+               NaN when either window has no data or nothing happened before the post
+    """
+    after_days = attribution["observed_days"].astype(float).where(attribution["observed_days"] > 0)
+    before_days = attribution["baseline_days"].astype(float).where(attribution["baseline_days"] > 0)
+    lifts = {}
+    for name in ATTRIBUTION_COLUMNS:
+        before = (attribution[f"baseline_{name}"] / before_days).where(lambda rate: rate > 0)
+        lifts[name] = attribution[name] / after_days / before - 1
+    return pd.DataFrame(lifts, index=attribution.index, dtype=float)
@@ -1,9 +1,18 @@
 import pandas as pd
+import numpy as np
 import datetime as dt
 import streamlit as st
 import plotly.graph_objects as go
 import database as db
-
+import workspace_cache
+import anomalies
+import attribution
+import cadence
+import maintenance
+from workspace_cache import GAP_COLUMN
+from instrumentation import timed
+
+@timed
 def load_metrics_data(file):
     with pd.ExcelFile(file) as xls:
 
@@ -28,6 +37,7 @@ def load_metrics_data(file):
             df = pd.DataFrame()
     return df
 
+@timed
 def load_post_data(content_file):
     with pd.ExcelFile(content_file) as xls:
 
@@ -41,6 +51,7 @@ def load_post_data(content_file):
             df = pd.DataFrame()
     return df
 
+@timed
 def resample(df,period_type=None):
    """Filter dataframe based on time period (YTD, MTD, QTD)"""
    today = dt.date.today()
@@ -55,6 +66,7 @@ def resample(df,period_type=None):
    return df[df.index.date >= start_date]
 
 
+@timed
 def calculate_totals(new_followers_df, unique_visitors_df, content_metrics_df, period=None):
    """Calculate total metrics for a given period"""
    # Filter data based on the specified period
@@ -72,15 +84,313 @@ def calculate_totals(new_followers_df, unique_visitors_df, content_metrics_df, p
    total_reposts = cm_df["Reposts (total)"].sum()
    return total_new_followers, total_unique_visitors, total_impressions, total_clicks, total_reposts
 
+@timed
 def calculate_average_engagement(content_metrics_df, period=None):
-   """Calculate average engagement rate for a given period"""
+   """Calculate average engagement rate for a given period, over the days that have data"""
    if period in ['YTD', 'MTD', 'QTD']:
        cm_df = resample(content_metrics_df, period)
    else:
        cm_df = content_metrics_df
-   return cm_df["Engagement rate (total)"].mean()
+   return observed(cm_df, "Engagement rate (total)").mean()
+
+
+def observed(df, column):
+   """Values of a column with calendar gaps as NaN, so charts break their lines and means skip them"""
+   if GAP_COLUMN in df.columns:
+       return df[column].where(~df[GAP_COLUMN])
+   return df[column]
+
+
+@timed
+def calculate_coverage(df, period=None):
+   """
+   Count the days of a period that have data
+
+   Parameters:
+   df (DataFrame): A daily frame, aligned to the calendar or not
+   period (str): 'YTD', 'MTD', 'QTD' or None for all data
+
+   Returns:
+   tuple: (observed_days, calendar_days) between the first and last day with data in the period
+   """
+   if period in ['YTD', 'MTD', 'QTD']:
+       df = resample(df, period)
+   if df.empty:
+       return 0, 0
+   if GAP_COLUMN in df.columns:
+       return int((~df[GAP_COLUMN]).sum()), len(df)
+   days = df.index.normalize().unique()
+   return len(days), (days.max() - days.min()).days + 1
+
+
+# Summed columns behind the metric cards, by the frame they come from
+PERIOD_SUM_COLUMNS = {
+    "followers": {"new_followers": "Total followers"},
+    "visitors": {"unique_visitors": "Total unique visitors (total)"},
+    "content": {"impressions": "Unique impressions (organic)", "clicks": "Clicks (total)",
+                "reposts": "Reposts (total)"}
+}
+
+
+def _shift_year(date, years=-1):
+   """The same calendar day in another year, Feb 29 becomes Feb 28"""
+   try:
+       return date.replace(year=date.year + years)
+   except ValueError:
+       return date.replace(year=date.year + years, day=28)
+
+
+def period_windows(period, today=None):
+   """
+   First and last day of a period's current window and of the windows it is compared with
+
+   The previous window covers as many days of the previous period as have passed
+   in the current one, e.g. April 1-15 for a QTD view on July 15.
+
+   Parameters:
+   period (str): 'YTD', 'MTD', 'QTD', anything else means all data
+   today (date): Last day of the current window, defaults to today
+
+   Returns:
+   dict: 'current', 'previous' and 'last_year' mapped to (start, end) dates, with only
+         'current' = (None, None) for all data
+   """
+   today = today or dt.date.today()
+   if period == 'YTD':
+       start = dt.date(today.year, 1, 1)
+       previous_start = None
+   elif period == 'MTD':
+       start = dt.date(today.year, today.month, 1)
+       previous_start = (start - dt.timedelta(days=1)).replace(day=1)
+   elif period == 'QTD':
+       start = dt.date(today.year, ((today.month - 1) // 3) * 3 + 1, 1)
+       previous_start = (start - dt.timedelta(days=1)).replace(day=1)
+       previous_start = previous_start.replace(month=previous_start.month - 2)
+   else:
+       return {"current": (None, None)}
 
+   last_year = (_shift_year(start), _shift_year(today))
+   if period == 'YTD':
+       # The previous year-to-date window is last year's
+       previous = last_year
+   else:
+       previous = (previous_start, min(previous_start + (today - start), start - dt.timedelta(days=1)))
+   return {"current": (start, today), "previous": previous, "last_year": last_year}
+
+
+def _window_sums(df, columns, windows):
+   """
+   Sums of columns over every window from a single prefix sum
+
+   Returns:
+   ndarray: One row per window and one column per entry of columns
+   """
+   if df.empty:
+       return np.zeros((len(windows), len(columns)))
+   if not df.index.is_monotonic_increasing:
+       df = df.sort_index()
+   prefix = np.zeros((len(df) + 1, len(columns)))
+   # Blank cells count as zero, one NaN would otherwise carry into every later prefix sum
+   np.cumsum(df[columns].to_numpy(dtype=np.float64, na_value=0.0), axis=0, out=prefix[1:])
+
+   index = df.index.values
+   one_day = np.timedelta64(1, "D")
+   starts = np.array([index[0] if start is None else np.datetime64(start, "ns") for start, _ in windows])
+   ends = np.array([index[-1] if end is None else np.datetime64(end, "ns") for _, end in windows])
+   first = np.searchsorted(index, starts, side="left")
+   after_last = np.searchsorted(index, ends + one_day, side="left")
+   return prefix[after_last] - prefix[first]
+
+
+@timed
+def calculate_period_metrics(new_followers_df, unique_visitors_df, content_metrics_df, period=None, today=None):
+   """
+   Card metrics for a period and for the windows it is compared with, computed together
+
+   Every frame gets one prefix sum, and every window of every metric is two
+   searchsorted lookups into it. Frames are used as loaded, aligned or not.
+
+   Parameters:
+   period (str): 'YTD', 'MTD', 'QTD', anything else means all data without comparisons
+   today (date): Last day of the current window, defaults to today
+
+   Returns:
+   dict: Metric ('new_followers', 'unique_visitors', 'impressions', 'clicks', 'reposts', 'engagement')
+         mapped to a dict of window name ('current', 'previous', 'last_year') to value
+   """
+   windows = period_windows(period, today)
+   names = list(windows)
+   bounds = list(windows.values())
+   metrics = {}
+
+   frames = {"followers": new_followers_df, "visitors": unique_visitors_df, "content": content_metrics_df}
+   for frame_name, columns in PERIOD_SUM_COLUMNS.items():
+       sums = _window_sums(frames[frame_name], list(columns.values()), bounds)
+       for position, metric in enumerate(columns):
+           metrics[metric] = {name: int(round(sums[row, position])) for row, name in enumerate(names)}
+
+   # Average engagement over the days with data, from the summed rates and the count of those days
+   if content_metrics_df.empty:
+       engagement = pd.DataFrame(columns=["rate", "days"])
+   else:
+       rates = observed(content_metrics_df, "Engagement rate (total)")
+       engagement = pd.DataFrame({"rate": rates.fillna(0), "days": rates.notna()})
+   sums = _window_sums(engagement, ["rate", "days"], bounds)
+   metrics["engagement"] = {
+       name: sums[row, 0] / sums[row, 1] if sums[row, 1] else float("nan") for row, name in enumerate(names)
+   }
+   return metrics
+
+
+def _change(current, comparison, points=False):
+   if comparison != comparison or current != current:
+       return None
+   if points:
+       return f"{(current - comparison) * 100:+.2f} pp"
+   if comparison == 0:
+       return f"{current - comparison:+,}"
+   return f"{(current - comparison) / comparison:+.1%}"
+
+
+def metric_delta(values, period, points=False):
+   """
+   Delta text for a metric card comparing the current window with the previous one and last year
+
+   Parameters:
+   values (dict): One metric of calculate_period_metrics
+   period (str): The period shown on the cards
+   points (bool): Show the change in percentage points, for rates
+
+   Returns:
+   str: e.g. '+4.2% vs prior QTD, -1.0% vs last year', or None without comparisons
+   """
+   if "previous" not in values:
+       return None
+   parts = []
+   previous = _change(values["current"], values["previous"], points)
+   if previous is not None:
+       parts.append(f"{previous} vs prior {period}")
+   # For YTD the previous period is last year's, so it is only shown once
+   if period != 'YTD':
+       last_year = _change(values["current"], values["last_year"], points)
+       if last_year is not None:
+           parts.append(f"{last_year} vs last year")
+   return ", ".join(parts) or None
+
+
+def coverage_caption(new_followers_df, unique_visitors_df, content_metrics_df, period=None):
+   """One line describing the missing days of each daily series in a period"""
+   parts = []
+   for label, df in [("Followers", new_followers_df), ("Visitors", unique_visitors_df),
+                     ("Content", content_metrics_df)]:
+       observed_days, calendar_days = calculate_coverage(df, period)
+       if calendar_days == 0:
+           parts.append(f"{label}: no data")
+       elif observed_days == calendar_days:
+           parts.append(f"{label}: every day")
+       else:
+           parts.append(f"{label}: {observed_days / calendar_days:.0%} of days "
+                        f"({calendar_days - observed_days} missing)")
+   return "Coverage - " + ", ".join(parts)
+
+
+def display_anomaly_alert(flags, latest):
+   """
+   Warn about the days flagged within the last anomalies.ALERT_DAYS days of data
+
+   Parameters:
+   flags (DataFrame): Flags from anomalies.get_anomaly_flags or anomalies.detect_anomalies
+   latest (Timestamp): The most recent date with data
+   """
+   recent = anomalies.recent_flags(flags, latest)
+   if recent.empty:
+       return
+   lines = [
+       f"- {row.metric} on {row.date:%m/%d/%Y}: {row.value:,.0f} "
+       f"({'above' if row.score > 0 else 'below'} the expected {row.expected:,.0f})"
+       for row in recent.itertuples()
+   ]
+   st.warning(f"Unusual days in the last {anomalies.ALERT_DAYS} days:\n" + "\n".join(lines))
+
+
+# Line styles of overlay traces, in the order the overlays are listed
+OVERLAY_DASHES = ["dot", "dash", "longdash", "dashdot"]
+
+
+def add_overlay_traces(fig, overlays, period=None, color="#025139"):
+    """
+    Add derived series to a chart as dashed lines
+
+    Cumulative series go on a second y axis and are rebased to start at the
+    beginning of the period.
 
+    Parameters:
+    fig (Figure): The chart to add to
+    overlays (DataFrame): Series named after the overlay, e.g. from derived_metrics.select_overlays
+    period (str): 'YTD', 'MTD', 'QTD' or None for all data
+    color (str): Line color of the overlays
+    """
+    if overlays is None or overlays.empty:
+        return
+    shown = resample(overlays, period) if period in ['YTD', 'MTD', 'QTD'] else overlays
+    for position, name in enumerate(shown.columns):
+        values = shown[name]
+        secondary = name == "Cumulative"
+        if secondary and len(shown) < len(overlays):
+            # Subtract the total reached before the period so the line starts from zero
+            values = values - overlays[name].iloc[len(overlays) - len(shown) - 1]
+        fig.add_trace(
+            go.Scatter(x=shown.index.date, y=values, mode='lines', name=name,
+                       line=dict(color=color, width=2, dash=OVERLAY_DASHES[position % len(OVERLAY_DASHES)]),
+                       yaxis="y2" if secondary else "y"))
+        if secondary:
+            fig.update_layout(yaxis2=dict(overlaying="y", side="right", showgrid=False,
+                                          tickfont=dict(family="Manrope, sans-serif", size=12, color="darkgray")))
+
+
+def add_anomaly_markers(fig, flags, period=None):
+    """
+    Mark flagged days on a chart
+
+    Parameters:
+    fig (Figure): The chart to add to
+    flags (DataFrame): Value and score of each flagged day, e.g. from anomalies.select_flags
+    period (str): 'YTD', 'MTD', 'QTD' or None for all data
+    """
+    if flags is None or flags.empty:
+        return
+    shown = resample(flags, period)
+    if shown.empty:
+        return
+    # Spikes and drops get different symbols so they can be told apart without hovering
+    symbols = np.where(shown["score"] > 0, "triangle-up", "triangle-down")
+    fig.add_trace(
+        go.Scatter(x=shown.index.date, y=shown["value"], mode='markers', name="Anomaly",
+                   marker=dict(color="#c0392b", size=12, symbol=symbols, line=dict(color="white", width=1))))
+
+
+def add_forecast_traces(fig, forecast, color="#025139"):
+    """
+    Add a forecast with its prediction band to a chart
+
+    Parameters:
+    fig (Figure): The chart to add to
+    forecast (DataFrame): 'Forecast', 'Lower' and 'Upper' columns indexed by date, e.g. from forecasting.forecast_frame
+    color (str): Hex color of the forecast line, the band uses it translucent
+    """
+    if forecast is None or forecast.empty:
+        return
+    red, green, blue = (int(color.lstrip("#")[i:i + 2], 16) for i in (0, 2, 4))
+    dates = forecast.index.date
+    fig.add_trace(go.Scatter(x=dates, y=forecast["Upper"], mode='lines', line=dict(width=0), showlegend=False,
+                             name="Forecast high"))
+    fig.add_trace(go.Scatter(x=dates, y=forecast["Lower"], mode='lines', line=dict(width=0), fill='tonexty',
+                             fillcolor=f"rgba({red}, {green}, {blue}, 0.15)", name="Forecast low"))
+    fig.add_trace(go.Scatter(x=dates, y=forecast["Forecast"], mode='lines', name="Forecast",
+                             line=dict(color=color, width=2, dash="dot")))
+
+
+@timed
 def create_overview_chart(new_followers_df, unique_visitors_df, content_metrics_df,primary_color = "#10045a",secondary_color = "#025139", period=None):
     fig = go.Figure()
 
@@ -96,22 +406,22 @@ def create_overview_chart(new_followers_df, unique_visitors_df, content_metrics_
 
     # Add the "New Followers" trace
     fig.add_trace(
-        go.Scatter(x=nf_df.index.date, y=nf_df['Total followers'], mode='markers+lines', name="New Followers", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
+        go.Scatter(x=nf_df.index.date, y=observed(nf_df, 'Total followers'), mode='markers+lines', name="New Followers", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
 
     # Add the "Unique Visitors" trace
     fig.add_trace(
-        go.Scatter(x=uv_df.index.date, y=uv_df['Total unique visitors (total)'], mode='markers+lines', name="Unique Visitors", line=dict(color=f"{secondary_color}", width=2), marker=dict(symbol="circle", size=6)))
+        go.Scatter(x=uv_df.index.date, y=observed(uv_df, 'Total unique visitors (total)'), mode='markers+lines', name="Unique Visitors", line=dict(color=f"{secondary_color}", width=2), marker=dict(symbol="circle", size=6)))
     #
     # # Add the "Content Metrics" trace
     fig.add_trace(
-        go.Scatter(x=cm_df.index.date, y=cm_df['Unique impressions (organic)'], mode='markers+lines', name="Unique Impressions", line=dict(color="#025139", width=2), marker=dict(symbol="circle", size=6)))
+        go.Scatter(x=cm_df.index.date, y=observed(cm_df, 'Unique impressions (organic)'), mode='markers+lines', name="Unique Impressions", line=dict(color="#025139", width=2), marker=dict(symbol="circle", size=6)))
 
     fig.add_trace(
-        go.Scatter(x=cm_df.index.date, y=cm_df['Clicks (total)'], mode='markers+lines',
+        go.Scatter(x=cm_df.index.date, y=observed(cm_df, 'Clicks (total)'), mode='markers+lines',
                    name="Total CLicks", line=dict(color="#510D6E", width=2), marker=dict(symbol="circle", size=6)))
 
     fig.add_trace(
-        go.Scatter(x=cm_df.index.date, y=cm_df['Reposts (total)'], mode='markers+lines',
+        go.Scatter(x=cm_df.index.date, y=observed(cm_df, 'Reposts (total)'), mode='markers+lines',
                    name="Reposts", line=dict(color="#63281F", width=2), marker=dict(symbol="circle", size=6)))
 
     # Update layout and trace styling
@@ -145,7 +455,8 @@ def create_overview_chart(new_followers_df, unique_visitors_df, content_metrics_
 
     return fig
 
-def create_follower_chart(new_followers_df, custom=False, post_date = dt.date(2001, 1, 1),period=None, primary_color = "#10045a",secondary_color = "#025139"):
+@timed
+def create_follower_chart(new_followers_df, custom=False, post_date = dt.date(2001, 1, 1),period=None, primary_color = "#10045a",secondary_color = "#025139", overlays=None, anomalies=None, forecast=None):
     fig = go.Figure()
 
     # Resample data based on period (if provided)
@@ -156,8 +467,14 @@ def create_follower_chart(new_followers_df, custom=False, post_date = dt.date(20
 
     # Add the "New Followers" trace
     fig.add_trace(
-        go.Scatter(x=nf_df.index.date, y=nf_df['Total followers'], mode='markers+lines', name="New Followers", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
+        go.Scatter(x=nf_df.index.date, y=observed(nf_df, 'Total followers'), mode='markers+lines', name="New Followers", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
 
+    # Derived series chosen on the page, such as rolling averages
+    add_overlay_traces(fig, overlays, period, secondary_color)
+    # Days flagged by the anomaly detection
+    add_anomaly_markers(fig, anomalies, period)
+    # Projection past the last day with data
+    add_forecast_traces(fig, forecast, secondary_color)
 
     # Update layout and trace styling
     fig.update_layout(
@@ -191,7 +508,8 @@ def create_follower_chart(new_followers_df, custom=False, post_date = dt.date(20
     return fig
 
 
-def create_unique_visitors_chart(unique_visitors_df, period=None,primary_color = "#10045a",secondary_color = "#025139"):
+@timed
+def create_unique_visitors_chart(unique_visitors_df, period=None,primary_color = "#10045a",secondary_color = "#025139", overlays=None, anomalies=None):
     fig = go.Figure()
 
     # Resample data based on period (if provided)
@@ -203,8 +521,12 @@ def create_unique_visitors_chart(unique_visitors_df, period=None,primary_color =
 
     # Add the "Unique Visitors" trace
     fig.add_trace(
-        go.Scatter(x=uv_df.index.date, y=uv_df['Total unique visitors (total)'], mode='markers+lines', name="Unique Visitors", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
+        go.Scatter(x=uv_df.index.date, y=observed(uv_df, 'Total unique visitors (total)'), mode='markers+lines', name="Unique Visitors", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
 
+    # Derived series chosen on the page, such as rolling averages
+    add_overlay_traces(fig, overlays, period, secondary_color)
+    # Days flagged by the anomaly detection
+    add_anomaly_markers(fig, anomalies, period)
 
     # Update layout and trace styling
     fig.update_layout(
@@ -238,7 +560,8 @@ def create_unique_visitors_chart(unique_visitors_df, period=None,primary_color =
     return fig
 
 
-def create_total_clicks_chart(content_metrics_df, period=None,primary_color = "#10045a",secondary_color = "#025139"):
+@timed
+def create_total_clicks_chart(content_metrics_df, period=None,primary_color = "#10045a",secondary_color = "#025139", overlays=None, anomalies=None):
     fig = go.Figure()
 
     # Resample data based on period (if provided)
@@ -248,9 +571,14 @@ def create_total_clicks_chart(content_metrics_df, period=None,primary_color = "#
         cm_df = content_metrics_df
 
     fig.add_trace(
-        go.Scatter(x=cm_df.index.date, y=cm_df['Clicks (total)'], mode='markers+lines',
+        go.Scatter(x=cm_df.index.date, y=observed(cm_df, 'Clicks (total)'), mode='markers+lines',
                    name="Total CLicks", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
 
+    # Derived series chosen on the page, such as rolling averages
+    add_overlay_traces(fig, overlays, period, secondary_color)
+    # Days flagged by the anomaly detection
+    add_anomaly_markers(fig, anomalies, period)
+
     # Update layout and trace styling
     fig.update_layout(
         title= f"Total Clicks {period}",
@@ -285,7 +613,8 @@ def create_total_clicks_chart(content_metrics_df, period=None,primary_color = "#
 
 
 
-def create_total_impressions_chart(content_metrics_df, period=None,primary_color = "#10045a",secondary_color = "#025139"):
+@timed
+def create_total_impressions_chart(content_metrics_df, period=None,primary_color = "#10045a",secondary_color = "#025139", overlays=None, anomalies=None, forecast=None):
     fig = go.Figure()
 
     # Resample data based on period (if provided)
@@ -297,8 +626,14 @@ def create_total_impressions_chart(content_metrics_df, period=None,primary_color
     #
     # # Add the "Content Metrics" trace
     fig.add_trace(
-        go.Scatter(x=cm_df.index.date, y=cm_df['Unique impressions (organic)'], mode='markers+lines', name="Unique Impressions", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
+        go.Scatter(x=cm_df.index.date, y=observed(cm_df, 'Unique impressions (organic)'), mode='markers+lines', name="Unique Impressions", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
 
+    # Derived series chosen on the page, such as rolling averages
+    add_overlay_traces(fig, overlays, period, secondary_color)
+    # Days flagged by the anomaly detection
+    add_anomaly_markers(fig, anomalies, period)
+    # Projection past the last day with data
+    add_forecast_traces(fig, forecast, secondary_color)
 
     # Update layout and trace styling
     fig.update_layout(
@@ -332,7 +667,8 @@ def create_total_impressions_chart(content_metrics_df, period=None,primary_color
     return fig
 
 
-def create_reposts_chart(content_metrics_df, period=None,primary_color = "#10045a",secondary_color = "#025139"):
+@timed
+def create_reposts_chart(content_metrics_df, period=None,primary_color = "#10045a",secondary_color = "#025139", overlays=None):
     fig = go.Figure()
 
     # Resample data based on period (if provided)
@@ -342,9 +678,12 @@ def create_reposts_chart(content_metrics_df, period=None,primary_color = "#10045
         cm_df = content_metrics_df
 
     fig.add_trace(
-        go.Scatter(x=cm_df.index.date, y=cm_df['Reposts (total)'], mode='markers+lines',
+        go.Scatter(x=cm_df.index.date, y=observed(cm_df, 'Reposts (total)'), mode='markers+lines',
                    name="Reposts", line=dict(color=f"{primary_color}", width=2), marker=dict(symbol="circle", size=6)))
 
+    # Derived series chosen on the page, such as rolling averages
+    add_overlay_traces(fig, overlays, period, secondary_color)
+
     # Update layout and trace styling
     fig.update_layout(
         title= f"Reposts {period}",
@@ -377,6 +716,190 @@ def create_reposts_chart(content_metrics_df, period=None,primary_color = "#10045
     return fig
 
 
+# Values a posting heatmap can be colored by
+HEATMAP_VALUES = {"Median engagement": "median_engagement", "Posts": "posts"}
+
+
+@timed
+def create_posting_heatmap(cells, layout="Week of Year", color_by="Median engagement", primary_color="#10045a"):
+    """
+    Heatmap of posting activity by weekday and week of year or month
+
+    Parameters:
+    cells (DataFrame): From cadence.get_posting_heatmap or cadence.posting_heatmap_frame
+    layout (str): One of cadence.HEATMAP_LAYOUTS
+    color_by (str): One of HEATMAP_VALUES
+    primary_color (str): Color of the highest values
+    """
+    values = cadence.heatmap_grid(cells, layout, HEATMAP_VALUES[color_by])
+    posts = cadence.heatmap_grid(cells, layout, "posts")
+    engagement = cadence.heatmap_grid(cells, layout, "median_engagement")
+    rate = color_by == "Median engagement"
+
+    fig = go.Figure(go.Heatmap(
+        z=values.to_numpy(dtype=float), x=cadence.HEATMAP_LAYOUTS[layout]["names"], y=values.index,
+        colorscale=[[0, "#ffffff"], [1, primary_color]], hoverongaps=False,
+        customdata=np.dstack([posts.to_numpy(dtype=float), engagement.to_numpy(dtype=float)]),
+        hovertemplate="%{y}, " + cadence.HEATMAP_LAYOUTS[layout]["label"] + " %{x}<br>"
+                      "Posts: %{customdata[0]}<br>Median engagement: %{customdata[1]:.2%}<extra></extra>",
+        colorbar=dict(tickformat=".1%" if rate else ",d")
+    ))
+
+    fig.update_layout(
+        title=f"{color_by} by Weekday and {cadence.HEATMAP_LAYOUTS[layout]['label']}",
+        xaxis_title=cadence.HEATMAP_LAYOUTS[layout]["label"],
+        font=dict(family="Manrope, sans-serif", size=14, color="black"),
+        title_font=dict(family="PT Serif, serif", size=20, color="#10045A"),
+        paper_bgcolor="white",
+        plot_bgcolor="white",
+        xaxis=dict(tickfont=dict(family="Manrope, sans-serif", size=12, color="darkgray")),
+        yaxis=dict(tickfont=dict(family="Manrope, sans-serif", size=12, color="darkgray"), autorange="reversed")
+    )
+    return fig
+
+
+def display_posting_patterns(cells, cadence_rows, layout, key_prefix, primary_color="#10045a"):
+    """
+    Display the posting heatmap and the engagement of each weekly posting cadence
+
+    Parameters:
+    cells (DataFrame): Heatmap cells for the layout
+    cadence_rows (DataFrame): From cadence.get_posting_cadence or cadence.posting_cadence_frame
+    layout (str): One of cadence.HEATMAP_LAYOUTS
+    key_prefix (str): Prefix of the widget keys
+    primary_color (str): Color of the highest heatmap values
+    """
+    if cells.empty:
+        st.caption("No posts with a created date yet")
+        return
+    color_by = st.radio("Color By", list(HEATMAP_VALUES), horizontal=True, key=f"{key_prefix}_heatmap_color")
+    st.plotly_chart(create_posting_heatmap(cells, layout, color_by, primary_color), use_container_width=True)
+
+    cadence_table = cadence_rows.rename(columns={
+        "posts_per_week": "Posts per Week", "weeks": "Weeks", "posts": "Posts",
+        "median_engagement": "Median Engagement"
+    })
+    cadence_table["Posts per Week"] = [
+        f"{count}+" if count == cadence.CADENCE_CAP else str(count) for count in cadence_table["Posts per Week"]
+    ]
+    st.dataframe(cadence_table, hide_index=True, use_container_width=True,
+                 column_config={"Median Engagement": st.column_config.NumberColumn(format="percent")})
+
+
+LIFT_METRICS = {"impressions": "Impressions", "clicks": "Clicks", "reposts": "Reposts"}
+
+
+def display_post_lift(post_attribution, post_title):
+    """
+    Display the account's daily totals after a post and their change against the days before it
+
+    Parameters:
+    post_attribution (DataFrame): From attribution.get_post_attribution or attribution.attribute_posts
+    post_title (str): The selected post
+    """
+    window = attribution.ATTRIBUTION_DAYS
+    selected = post_attribution[post_attribution.index == post_title]
+    if selected.empty or not selected.iloc[0]["observed_days"]:
+        st.caption(f"No daily content data in the {window} days from this post's created date")
+        return
+
+    row = selected.iloc[0]
+    lifts = attribution.post_lifts(post_attribution).rename(columns=LIFT_METRICS)
+    lift_row = lifts[lifts.index == post_title].iloc[0]
+    st.caption(f"Account totals of the {window} days from the created date, changes are per day against the "
+               f"{window} days before it")
+    for column, (name, label) in zip(st.columns(len(LIFT_METRICS)), LIFT_METRICS.items()):
+        with column:
+            st.metric(label=f"{label}, first {window} days", value=f"{int(row[name]):,}",
+                      delta=None if pd.isna(lift_row[label]) else f"{lift_row[label]:+.1%}", border=True)
+
+    with st.expander("Lift of All Posts"):
+        st.dataframe(lifts.sort_values("Impressions", ascending=False),
+                     column_config={label: st.column_config.NumberColumn(format="percent")
+                                    for label in LIFT_METRICS.values()},
+                     use_container_width=True)
+
+
+def changed_rows(original, edited):
+    """
+    Rows of an edited grid that are new or differ from the original
+
+    Parameters:
+    original (DataFrame): The frame passed to st.data_editor
+    edited (DataFrame): The frame st.data_editor returned
+
+    Returns:
+    DataFrame: The new and edited rows, keeping their grid index
+    """
+    is_new = ~edited.index.isin(original.index)
+    existing = edited.loc[~is_new]
+    before = original.loc[existing.index, existing.columns]
+    differs = (existing.ne(before) & ~(existing.isna() & before.isna())).any(axis=1)
+    return edited.loc[is_new | edited.index.isin(differs[differs].index)]
+
+
+def display_entry_grid(workspace, table_name):
+    """
+    Display an editable grid for adding and correcting many entries of a table at once
+
+    Parameters:
+    workspace (str): The workspace name
+    table_name (str): The table to edit
+    """
+    key_prefix = workspace.lower().replace(' ', '_')
+    columns = db.MANUAL_ENTRY_COLUMNS[table_name]
+
+    grid_message = st.session_state.pop(f"{key_prefix}_grid_message", None)
+    if grid_message:
+        st.success(grid_message)
+
+    column_config = {}
+    for column, kind in columns.items():
+        label = column.replace("_", " ").capitalize()
+        if kind == "date":
+            column_config[column] = st.column_config.DateColumn(label, format="YYYY-MM-DD")
+        elif kind == "count":
+            column_config[column] = st.column_config.NumberColumn(label, min_value=0, step=1)
+        elif kind == "rate":
+            column_config[column] = st.column_config.NumberColumn(label, min_value=0.0, max_value=1.0,
+                                                                  format="%.4f")
+        else:
+            column_config[column] = st.column_config.TextColumn(label)
+
+    # The most recent month is shown so it can be corrected, new rows are added at the bottom
+    original = db.get_recent_entries(table_name, workspace)
+    grid_version = st.session_state.get(f"{key_prefix}_grid_version", 0)
+    edited = st.data_editor(
+        original,
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config=column_config,
+        key=f"{key_prefix}_entry_grid_{table_name}_{grid_version}"
+    )
+    changes = changed_rows(original, edited)
+    st.caption(f"{len(changes)} new or edited rows. Rows removed from the grid are not deleted, "
+               f"use Remove Entry for that.")
+
+    if st.button("Save Rows", key=f"{key_prefix}_grid_save", disabled=changes.empty):
+        saved, errors = db.add_manual_entries(table_name, changes, workspace)
+        if errors:
+            st.error(f"No rows were saved, {len(errors)} problems need fixing first")
+            st.dataframe(
+                pd.DataFrame(
+                    [("All" if row is None else row + 1, message) for row, message in errors],
+                    columns=["Row", "Problem"]
+                ),
+                hide_index=True,
+                use_container_width=True
+            )
+        else:
+            refresh_after_write(workspace, table_name)
+            st.session_state[f"{key_prefix}_grid_version"] = grid_version + 1
+            st.session_state[f"{key_prefix}_grid_message"] = f"Saved {saved} rows to {table_name}"
+            st.rerun()
+
+
 def display_manual_entry_form(workspace):
     """
     Display a form that allows users to manually add or remove entries in database tables
@@ -394,9 +917,18 @@ def display_manual_entry_form(workspace):
             ["new_followers", "visitor_metrics", "content_metrics", "posts"],
             key=f"{workspace.lower().replace(' ', '_')}_table_select_add"
         )
+        entry_mode = st.radio(
+            "Entry Mode",
+            ["Single Entry", "Grid"],
+            horizontal=True,
+            key=f"{workspace.lower().replace(' ', '_')}_entry_mode"
+        )
 
         # Create form based on selected table
-        if table_name == "new_followers":
+        if entry_mode == "Grid":
+            display_entry_grid(workspace, table_name)
+
+        elif table_name == "new_followers":
             with st.form(key=f"{workspace.lower().replace(' ', '_')}_followers_form"):
                 st.write("Add New Followers Entry")
                 date = st.date_input("Date", key=f"{workspace.lower().replace(' ', '_')}_followers_date")
@@ -411,6 +943,7 @@ def display_manual_entry_form(workspace):
                     }
                     success = db.add_manual_entry(table_name, data, workspace)
                     if success:
+                        refresh_after_write(workspace, table_name)
                         st.success(f"Successfully added entry to {table_name}")
                     else:
                         st.error("Failed to add entry to database")
@@ -433,6 +966,7 @@ def display_manual_entry_form(workspace):
                     }
                     success = db.add_manual_entry(table_name, data, workspace)
                     if success:
+                        refresh_after_write(workspace, table_name)
                         st.success(f"Successfully added entry to {table_name}")
                     else:
                         st.error("Failed to add entry to database")
@@ -465,6 +999,7 @@ def display_manual_entry_form(workspace):
                     }
                     success = db.add_manual_entry(table_name, data, workspace)
                     if success:
+                        refresh_after_write(workspace, table_name)
                         st.success(f"Successfully added entry to {table_name}")
                     else:
                         st.error("Failed to add entry to database")
@@ -514,66 +1049,92 @@ def display_manual_entry_form(workspace):
                         }
                         success = db.add_manual_entry(table_name, data, workspace)
                         if success:
+                            refresh_after_write(workspace, table_name)
                             st.success(f"Successfully added entry to {table_name}")
                         else:
                             st.error("Failed to add entry to database")
 
     # Tab for removing entries
     with tab2:
+        key_prefix = workspace.lower().replace(' ', '_')
+
+        # Result of a delete or undo from the previous run, which ended with a rerun
+        delete_message = st.session_state.pop(f"{key_prefix}_delete_message", None)
+        if delete_message:
+            st.success(delete_message)
+
         # Select the table to remove data from
         removal_table = st.selectbox(
             "Select Table",
             ["new_followers", "visitor_metrics", "content_metrics", "posts"],
-            key=f"{workspace.lower().replace(' ', '_')}_table_select_remove"
+            key=f"{key_prefix}_table_select_remove"
         )
 
         removal_method = st.radio(
             "Removal Method",
-            ["Delete Single Entry", "Delete Date Range"],
-            key=f"{workspace.lower().replace(' ', '_')}_removal_method"
+            ["Delete Entries", "Delete Date Range"],
+            key=f"{key_prefix}_removal_method"
         )
 
-        if removal_method == "Delete Single Entry":
-            # Get entries to show in the selection dropdown
-            entries = db.get_entries(removal_table, workspace)
+        if removal_method == "Delete Entries":
+            # Keyset cursors of the pages visited so far, starting over when another table is selected
+            cursors_key = f"{key_prefix}_entry_cursors"
+            if st.session_state.get(f"{key_prefix}_entry_table") != removal_table:
+                st.session_state[f"{key_prefix}_entry_table"] = removal_table
+                st.session_state[cursors_key] = [None]
+            cursors = st.session_state[cursors_key]
+            entries, next_cursor = db.get_entries_page(removal_table, workspace, cursors[-1])
+
+            if not entries and len(cursors) > 1:
+                # Everything on this page was deleted, step back to the previous one
+                cursors.pop()
+                st.rerun()
 
             if entries:
-                # Format entries for display based on table type
-                if removal_table == "new_followers":
-                    entry_options = [f"ID: {entry[0]} - Date: {entry[1]} - Followers: {entry[2]}" for entry in entries]
-                elif removal_table == "visitor_metrics":
-                    entry_options = [f"ID: {entry[0]} - Date: {entry[1]} - Visitors: {entry[2]}" for entry in entries]
-                elif removal_table == "content_metrics":
-                    entry_options = [f"ID: {entry[0]} - Date: {entry[1]} - Impressions: {entry[2]}" for entry in
-                                     entries]
-                elif removal_table == "posts":
-                    entry_options = [f"ID: {entry[0]} - Title: {entry[1]} - Date: {entry[2]}" for entry in entries]
-
-                selected_entry = st.selectbox(
-                    "Select Entry to Delete",
-                    options=entry_options,
-                    key=f"{workspace.lower().replace(' ', '_')}_entry_select"
+                page = pd.DataFrame(entries, columns=["ID"] + db.ENTRY_COLUMNS[removal_table])
+                page.insert(0, "Select", False)
+                # The delete count is part of the key so selections do not carry over to the rows that move up
+                editor_version = st.session_state.get(f"{key_prefix}_entry_version", 0)
+                edited_page = st.data_editor(
+                    page,
+                    hide_index=True,
+                    use_container_width=True,
+                    disabled=[column for column in page.columns if column != "Select"],
+                    column_config={
+                        column: column.replace("_", " ").capitalize() for column in db.ENTRY_COLUMNS[removal_table]
+                    },
+                    key=f"{key_prefix}_entry_editor_{removal_table}_{len(cursors)}_{editor_version}"
                 )
-
-                # Extract the ID from the selected entry
-                entry_id = int(selected_entry.split(" - ")[0].replace("ID: ", ""))
-
-                if st.button("Delete Selected Entry", key=f"{workspace.lower().replace(' ', '_')}_delete_single"):
-                    # Confirm deletion
-                    confirm = st.warning("Are you sure you want to delete this entry? This action cannot be undone.")
-                    confirm_col1, confirm_col2 = st.columns(2)
-                    with confirm_col1:
-                        if st.button("Yes, Delete", key=f"{workspace.lower().replace(' ', '_')}_confirm_delete"):
-                            success = db.delete_entry(removal_table, entry_id)
-                            if success:
-                                st.success(f"Entry deleted successfully!")
-                                # Force refresh by rerunning the app
-                                st.experimental_rerun()
-                            else:
-                                st.error("Failed to delete entry from database")
-                    with confirm_col2:
-                        if st.button("Cancel", key=f"{workspace.lower().replace(' ', '_')}_cancel_delete"):
-                            st.experimental_rerun()
+                selected_ids = edited_page.loc[edited_page["Select"], "ID"].tolist()
+
+                newer_col, page_col, older_col = st.columns([1, 2, 1])
+                with newer_col:
+                    if st.button("Newer", key=f"{key_prefix}_entry_newer", disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with page_col:
+                    st.caption(f"Page {len(cursors)}")
+                with older_col:
+                    if st.button("Older", key=f"{key_prefix}_entry_older", disabled=next_cursor is None):
+                        cursors.append(next_cursor)
+                        st.rerun()
+
+                if st.button("Delete Selected Entries", key=f"{key_prefix}_delete_single", disabled=not selected_ids):
+                    batch_id, deleted, error = db.delete_entries(
+                        rowids={removal_table: selected_ids},
+                        description=f"{len(selected_ids)} {removal_table} entries"
+                    )
+                    if batch_id is not None:
+                        refresh_after_write(workspace, removal_table)
+                        st.session_state[f"{key_prefix}_entry_version"] = editor_version + 1
+                        st.session_state[f"{key_prefix}_delete_message"] = \
+                            f"Deleted {deleted[removal_table]} entries from {removal_table}"
+                        # Force refresh by rerunning the app
+                        st.rerun()
+                    elif error is not None:
+                        st.error(f"Failed to delete entries from database: {error}")
+                    else:
+                        st.info("The selected entries were already deleted")
             else:
                 st.warning(f"No entries found in {removal_table} for {workspace}")
 
@@ -581,32 +1142,158 @@ def display_manual_entry_form(workspace):
             # Date range selection
             start_date = st.date_input(
                 "Start Date",
-                key=f"{workspace.lower().replace(' ', '_')}_range_start"
+                key=f"{key_prefix}_range_start"
             )
             end_date = st.date_input(
                 "End Date",
-                key=f"{workspace.lower().replace(' ', '_')}_range_end"
+                key=f"{key_prefix}_range_end"
             )
 
-            if st.button("Delete Date Range", key=f"{workspace.lower().replace(' ', '_')}_delete_range"):
-                # Confirm deletion
-                confirm = st.warning(
-                    f"Are you sure you want to delete all entries between {start_date.strftime('%Y-%m-%d')} and {end_date.strftime('%Y-%m-%d')}? This action cannot be undone.")
-                confirm_col1, confirm_col2 = st.columns(2)
-                with confirm_col1:
-                    if st.button("Yes, Delete Range", key=f"{workspace.lower().replace(' ', '_')}_confirm_range"):
-                        deleted_count = db.delete_entries_by_date_range(
-                            removal_table,
-                            workspace,
-                            start_date.strftime('%Y-%m-%d'),
-                            end_date.strftime('%Y-%m-%d')
-                        )
-                        if deleted_count > 0:
-                            st.success(f"Successfully deleted {deleted_count} entries from {removal_table}")
-                            # Force refresh by rerunning the app
-                            st.experimental_rerun()
-                        else:
-                            st.info(f"No entries found in the specified date range")
-                with confirm_col2:
-                    if st.button("Cancel Range Delete", key=f"{workspace.lower().replace(' ', '_')}_cancel_range"):
-                        st.experimental_rerun()
\ No newline at end of file
+            if st.button("Delete Date Range", key=f"{key_prefix}_delete_range"):
+                batch_id, deleted, error = db.delete_entries(
+                    ranges=[(removal_table, workspace, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))],
+                    description=f"{removal_table} from {start_date.strftime('%Y-%m-%d')} "
+                                f"to {end_date.strftime('%Y-%m-%d')}"
+                )
+                if batch_id is not None:
+                    refresh_after_write(workspace, removal_table)
+                    st.session_state[f"{key_prefix}_delete_message"] = \
+                        f"Successfully deleted {deleted[removal_table]} entries from {removal_table}"
+                    # Force refresh by rerunning the app
+                    st.rerun()
+                elif error is not None:
+                    st.error(f"Failed to delete entries from database: {error}")
+                else:
+                    st.info(f"No entries found in the specified date range")
+
+        # Deleted rows stay in the undo log, so recent deletes can be put back
+        undo_batches = db.get_undo_batches(workspace)
+        if undo_batches:
+            st.markdown("**Recent Deletes**")
+            for batch_id, description, deleted_at, row_count in undo_batches:
+                description_col, undo_col = st.columns([4, 1])
+                with description_col:
+                    st.write(f"{deleted_at.replace('T', ' ')} - {description} ({row_count} rows)")
+                with undo_col:
+                    if st.button("Undo", key=f"{key_prefix}_undo_{batch_id}"):
+                        restored = db.undo_delete(batch_id)
+                        refresh_after_write(workspace)
+                        st.session_state[f"{key_prefix}_delete_message"] = f"Restored {restored} entries"
+                        st.rerun()
+
+def refresh_after_write(workspace, table_name=None):
+    """
+    Drop the cached frames a write made stale and update the rollups of the days it added or revised
+
+    Every write of the app goes through here, so pages only read the stored
+    anomaly flags and post attribution. The command line and the watcher
+    update them in analytics_hub.rebuild_rollups.
+
+    Parameters:
+    workspace (str): The workspace that was written
+    table_name (str): The table that was written, all tables when None
+    """
+    workspace_cache.invalidate(workspace, table_name)
+    anomalies.update_anomalies(workspace)
+    attribution.refresh_attribution(workspace)
+
+
+# Seconds between checks for data written by other sessions
+DATA_POLL_SECONDS = 10
+
+
+@st.fragment(run_every=DATA_POLL_SECONDS)
+def _data_version_probe(workspace, seen_key):
+    # Only this fragment reruns on the timer, the whole page only when the data changed
+    if db.get_data_versions(workspace) != st.session_state.get(seen_key):
+        st.rerun()
+
+
+def watch_data_versions(workspace):
+    """
+    Rerun the page whenever another session or process writes data for the workspace
+
+    The versions seen by this run are remembered and a timed fragment compares
+    them with the database. On a change the page reruns, and the workspace cache
+    reloads only the tables whose version moved.
+
+    Parameters:
+    workspace (str): The workspace name
+    """
+    seen_key = f"{workspace.lower().replace(' ', '_')}_data_versions"
+    st.session_state[seen_key] = db.get_data_versions(workspace)
+    _data_version_probe(workspace, seen_key)
+
+
+def display_timing_panel(rerun_summary):
+    """
+    Display the timings recorded during the last rerun in the sidebar
+
+    Parameters:
+    rerun_summary (dict): The result of instrumentation.finish_rerun()
+    """
+    if not rerun_summary:
+        return
+
+    with st.sidebar.expander("Timings", expanded=True):
+        st.caption(f"Rerun took {rerun_summary['total_seconds'] * 1000:,.0f} ms")
+        cache_report = workspace_cache.memory_report()
+        st.caption(f"Frame cache holds {cache_report['total_bytes'] / 2 ** 20:,.1f} MB "
+                   f"of {cache_report['budget_bytes'] / 2 ** 20:,.0f} MB across "
+                   f"{len(cache_report['workspaces'])} workspaces")
+        if not rerun_summary["records"]:
+            st.write("Nothing was recorded")
+            return
+
+        timings = pd.DataFrame(rerun_summary["records"])
+        timings["total_ms"] = (timings["total_seconds"] * 1000).round(1)
+        timings["max_ms"] = (timings["max_seconds"] * 1000).round(1)
+        st.dataframe(
+            timings[["name", "calls", "total_ms", "max_ms", "rows", "cache_hits", "cache_misses"]],
+            hide_index=True,
+            use_container_width=True
+        )
+
+
+def display_database_health():
+    """Display the page statistics of the database and the last maintenance run in the sidebar"""
+    with st.sidebar.expander("Database Health", expanded=True):
+        if st.button("Run Maintenance Now", key="run_maintenance"):
+            with st.spinner("Running maintenance..."):
+                report = maintenance.run_maintenance()
+            for task, error in report["errors"].items():
+                st.error(f"{task} failed: {error}")
+            if report.get("integrity_problems"):
+                st.error(f"Integrity check found {len(report['integrity_problems'])} problems")
+
+        run_info = maintenance.last_run()
+        if run_info is None:
+            st.caption("Maintenance has not run yet")
+        else:
+            started_at, seconds, report = run_info
+            status = "with errors" if report["errors"] or report.get("integrity_problems") else "without problems"
+            st.caption(f"Last maintenance {started_at.replace('T', ' ')}, {seconds:,.1f} s, {status}")
+
+        stats = maintenance.database_stats()
+        st.caption(f"{stats['file_bytes'] / 2 ** 20:,.1f} MB file, {stats['wal_bytes'] / 2 ** 20:,.1f} MB log, "
+                   f"{stats['free_pages']:,} of {stats['page_count']:,} pages free ({stats['free_ratio']:.1%})")
+        if stats["auto_vacuum"] != "incremental":
+            st.caption("Scheduled maintenance cannot return free pages until the file is rewritten once. "
+                       "Saves wait while that runs.")
+            if st.button("Rewrite Database File", key="convert_database"):
+                with st.spinner("Rewriting the database file..."):
+                    report = maintenance.run_maintenance(backup=False, convert=True)
+                for task, error in report["errors"].items():
+                    st.error(f"{task} failed: {error}")
+                if not report["errors"]:
+                    st.rerun()
+        if stats["tables"]:
+            tables = pd.DataFrame(stats["tables"])
+            tables["MB"] = (tables["bytes"] / 2 ** 20).round(2)
+            tables["fill"] = (tables["fill"] * 100).round(1)
+            tables["fragmentation"] = (tables["fragmentation"] * 100).round(1)
+            st.dataframe(
+                tables[["name", "pages", "MB", "fill", "fragmentation"]],
+                hide_index=True,
+                use_container_width=True
+            )
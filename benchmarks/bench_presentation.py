@@ -0,0 +1,105 @@
+"""
+Benchmark KPI table rendering in create_presentation
+
+Compares the pre-built cell XML path in kpi_generator against the previous
+implementation that styled every cell through python-pptx's object layer.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_presentation --rows 100 500 1000
+"""
+import argparse
+import json
+import time
+from pptx.util import Inches, Pt
+from pptx.dml.color import RGBColor
+from pptx.enum.text import PP_ALIGN, MSO_VERTICAL_ANCHOR
+from kpi_generator import new_presentation, add_titled_slide, add_kpi_slide, save_presentation, KPI_ROWS_PER_SLIDE
+
+
+def legacy_add_table(slide, table_data):
+    """Cell-by-cell styling as create_presentation did it before the pre-built XML path"""
+    rows, cols = len(table_data), len(table_data[0])
+    table = slide.shapes.add_table(rows, cols, Inches(1), Inches(1.5), Inches(11.67), Inches(5.09)).table
+    table.columns[0].width = Inches(2)
+    table.columns[3].width = Inches(2)
+
+    for row_idx, row in enumerate(table_data):
+        for col_idx, cell in enumerate(row):
+            cell_obj = table.cell(row_idx, col_idx)
+            text_frame = cell_obj.text_frame
+            text_frame.vertical_anchor = MSO_VERTICAL_ANCHOR.MIDDLE
+            text_frame.clear()
+            p = text_frame.add_paragraph()
+            p.text = str(cell)
+            p.alignment = PP_ALIGN.CENTER
+            font = p.font
+            font.name = "Manrope"
+            if row_idx == 0:
+                font.bold = True
+                font.size = Pt(14)
+                font.color.rgb = RGBColor(255, 255, 255)
+                cell_obj.fill.solid()
+                cell_obj.fill.fore_color.rgb = RGBColor(
+                    16 if col_idx < 3 else 2,
+                    4 if col_idx < 3 else 81,
+                    90 if col_idx < 3 else 57
+                )
+            else:
+                font.size = Pt(12)
+                font.color.rgb = RGBColor(0, 0, 0)
+                cell_obj.fill.solid()
+                cell_obj.fill.fore_color.rgb = (
+                    RGBColor(255, 255, 255) if row_idx % 2 == 0 else RGBColor(211, 211, 211)
+                )
+
+
+def legacy_add_kpi_slide(prs, table_data, rows_per_slide=KPI_ROWS_PER_SLIDE):
+    header, body = table_data[0], table_data[1:]
+    for start in range(0, max(len(body), 1), rows_per_slide):
+        slide = add_titled_slide(prs, "Performance and Projections Data")
+        legacy_add_table(slide, [header] + body[start:start + rows_per_slide])
+
+
+def synthetic_table(rows):
+    header = ["KPI", "2024 Actual", "2024 MTD", "2025 Projected", "Goal Progress"]
+    return [header] + [[f"KPI {i}", f"{i * 13:,}", f"{i:,}", f"{i * 15:,}", f"{100 * 13 / 15:.1f}%"]
+                       for i in range(rows)]
+
+
+def time_render(add_slides, table_data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        prs = new_presentation()
+        add_slides(prs, table_data)
+        save_presentation(prs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(row_counts, repeat=3):
+    results = []
+    for rows in row_counts:
+        table_data = synthetic_table(rows)
+        legacy = time_render(legacy_add_kpi_slide, table_data, repeat)
+        prebuilt = time_render(lambda prs, data: add_kpi_slide(prs, 2024, 2025, data), table_data, repeat)
+        results.append({
+            "benchmark": "create_presentation_table",
+            "rows": rows,
+            "legacy_seconds": round(legacy, 4),
+            "prebuilt_xml_seconds": round(prebuilt, 4),
+            "speedup": round(legacy / prebuilt, 2)
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
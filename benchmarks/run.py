@@ -0,0 +1,344 @@
+"""
+Benchmark suite for ingest, loading, aggregation, charts and presentations
+
+Builds a throwaway database from synthetic LinkedIn-shaped workspaces, times
+the hot paths of the app and writes the results as JSON so runs from
+different commits can be compared.
+
+Usage (from the repository root):
+    python -m benchmarks.run --size small --output bench_small.json
+    python -m benchmarks.run --daily-rows 100000 --posts 10000 --workspaces 20
+    python -m benchmarks.run --size medium --compare bench_before.json
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import database as db
+import workspace_cache
+import derived_metrics
+import anomalies
+import forecasting
+import attribution
+from beatrice_helpers import load_metrics_data, load_post_data, calculate_totals, calculate_average_engagement
+from beatrice_helpers import calculate_period_metrics
+from beatrice_helpers import create_overview_chart, create_follower_chart, create_unique_visitors_chart
+from beatrice_helpers import create_total_clicks_chart, create_total_impressions_chart, create_reposts_chart
+from kpi_generator import build_kpi_table, create_presentation
+from benchmarks import synthetic
+
+# Total daily rows per table and total posts, spread evenly across the workspaces
+SIZES = {
+    "small": {"daily_rows": 1_000, "posts": 100, "workspaces": 2, "xlsx_days": 365},
+    "medium": {"daily_rows": 100_000, "posts": 10_000, "workspaces": 20, "xlsx_days": 2_000},
+    "large": {"daily_rows": 1_000_000, "posts": 100_000, "workspaces": 100, "xlsx_days": 10_000}
+}
+
+PERIODS = ["LTD", "YTD", "QTD", "MTD"]
+
+
+def measure(name, fn, repeat=3, rows=None):
+    """Run fn repeat times and return its timing record"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    record = {
+        "name": name,
+        "best_seconds": round(min(times), 6),
+        "mean_seconds": round(sum(times) / len(times), 6),
+        "repeat": repeat
+    }
+    if rows is not None:
+        record["rows"] = rows
+    return record
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_ingest(workspace_frames):
+    results = []
+    start = time.perf_counter()
+    total_rows = 0
+    for workspace, frames in workspace_frames.items():
+        db.save_followers_data(frames["followers"], workspace)
+        db.save_visitor_metrics(frames["visitors"], workspace)
+        db.save_content_metrics(frames["content"], workspace)
+        db.save_posts_data(frames["posts"], workspace)
+        total_rows += sum(len(df) for df in frames.values())
+    elapsed = time.perf_counter() - start
+    results.append({"name": "ingest.all_workspaces", "best_seconds": round(elapsed, 6),
+                    "mean_seconds": round(elapsed, 6), "repeat": 1, "rows": total_rows})
+
+    # Re-ingest of one workspace with every value revised, so each run writes all rows
+    # through INSERT OR REPLACE on existing keys, and once unchanged, which only compares the rows
+    workspace, frames = next(iter(workspace_frames.items()))
+    for name, save, key in [("save_followers_data", db.save_followers_data, "followers"),
+                            ("save_visitor_metrics", db.save_visitor_metrics, "visitors"),
+                            ("save_content_metrics", db.save_content_metrics, "content"),
+                            ("save_posts_data", db.save_posts_data, "posts")]:
+        df = frames[key]
+        results.append(measure(f"ingest.{name}", save_revisions(save, df, workspace), rows=len(df)))
+        save(df, workspace)
+        results.append(measure(f"ingest.{name}.unchanged", lambda: save(df, workspace), rows=len(df)))
+    return results
+
+
+def revised(df, run):
+    """Copy of an export frame with every numeric value moved by run"""
+    df = df.copy()
+    numeric = df.select_dtypes("number").columns
+    df[numeric] = df[numeric] + run
+    return df
+
+
+def save_revisions(save, df, workspace, repeat=3):
+    """Function saving a differently revised copy of df on each of its repeat calls, built before timing starts"""
+    revisions = iter([revised(df, run) for run in range(1, repeat + 1)])
+    return lambda: save(next(revisions), workspace)
+
+
+def bench_excel(directory, xlsx_days, posts, seed):
+    frames = synthetic.workspace_frames(xlsx_days, posts, seed=seed, workspace="Excel")
+    paths = synthetic.write_workspace_exports(directory, frames, prefix="excel")
+    return [
+        measure("excel.load_metrics_data.followers", lambda: load_metrics_data(paths["followers"]), repeat=1,
+                rows=xlsx_days),
+        measure("excel.load_metrics_data.visitors", lambda: load_metrics_data(paths["visitors"]), repeat=1,
+                rows=xlsx_days),
+        measure("excel.load_metrics_data.content", lambda: load_metrics_data(paths["content"]), repeat=1,
+                rows=xlsx_days),
+        measure("excel.load_post_data", lambda: load_post_data(paths["content"]), repeat=1, rows=posts)
+    ]
+
+
+def bench_loads(workspace, repeat, days, posts):
+    results = []
+    use_snapshots = db.USE_SNAPSHOTS
+    # "load" reads the columnar snapshots, "load_sql" goes through pd.read_sql on SQLite
+    for prefix, snapshots_enabled in [("load", True), ("load_sql", False)]:
+        db.USE_SNAPSHOTS = snapshots_enabled
+        try:
+            results += [
+                measure(f"{prefix}.load_followers_data", lambda: db.load_followers_data(workspace), repeat, rows=days),
+                measure(f"{prefix}.load_visitor_metrics", lambda: db.load_visitor_metrics(workspace), repeat,
+                        rows=days),
+                measure(f"{prefix}.load_content_metrics", lambda: db.load_content_metrics(workspace), repeat,
+                        rows=days),
+                measure(f"{prefix}.load_posts_data", lambda: db.load_posts_data(workspace), repeat, rows=posts)
+            ]
+        finally:
+            db.USE_SNAPSHOTS = use_snapshots
+    return results
+
+
+def bench_cold_loads(workspace, repeat):
+    """Load all four tables of a workspace with an empty frame cache, one table after the other and concurrently"""
+    results = []
+    use_snapshots = db.USE_SNAPSHOTS
+    load_workers = workspace_cache.LOAD_WORKERS
+
+    def cold_load():
+        workspace_cache.invalidate(workspace)
+        workspace_cache.load_workspace(workspace)
+
+    for source, snapshots_enabled in [("snapshots", True), ("sql", False)]:
+        for mode, workers in [("sequential", 1), ("concurrent", max(load_workers, 4))]:
+            db.USE_SNAPSHOTS = snapshots_enabled
+            workspace_cache.LOAD_WORKERS = workers
+            try:
+                results.append(measure(f"load_workspace.{source}.{mode}", cold_load, repeat))
+            finally:
+                db.USE_SNAPSHOTS = use_snapshots
+                workspace_cache.LOAD_WORKERS = load_workers
+    workspace_cache.invalidate(workspace)
+    return results
+
+
+def bench_memory(workspace, repeat):
+    """Time the dtype compaction of each table and record its memory before and after"""
+    results = []
+    for table_name, loader in workspace_cache.TABLE_LOADERS.items():
+        df = loader(workspace)
+        record = measure(f"compact_frame.{table_name}", lambda: workspace_cache.compact_frame(df), repeat,
+                         rows=len(df))
+        record["bytes_before"] = workspace_cache.frame_bytes(df)
+        record["bytes_after"] = workspace_cache.frame_bytes(workspace_cache.compact_frame(df))
+        results.append(record)
+    return results
+
+
+def bench_analytics(workspace, repeat):
+    followers = db.load_followers_data(workspace)
+    visitors = db.load_visitor_metrics(workspace)
+    content = db.load_content_metrics(workspace)
+    posts = db.load_posts_data(workspace)
+    results = []
+    for period in PERIODS:
+        results.append(measure(f"calculate_totals.{period}",
+                               lambda: calculate_totals(followers, visitors, content, period), repeat,
+                               rows=len(content)))
+        results.append(measure(f"calculate_average_engagement.{period}",
+                               lambda: calculate_average_engagement(content, period), repeat, rows=len(content)))
+        # Current, previous and last-year windows of every card metric together
+        results.append(measure(f"calculate_period_metrics.{period}",
+                               lambda: calculate_period_metrics(followers, visitors, content, period), repeat,
+                               rows=len(content)))
+
+    # Rolling, cumulative and growth series of every column, computed once per data version in the app
+    results.append(measure("derive_metrics.content_metrics", lambda: derived_metrics.derive_metrics(content), repeat,
+                           rows=len(content)))
+    # Scoring every day is what a first run or a rebuild does, later updates only score new days
+    results.append(measure("detect_anomalies.content_metrics",
+                           lambda: anomalies.detect_anomalies(content, anomalies.ANOMALY_METRICS["content_metrics"]),
+                           repeat, rows=len(content)))
+    results.append(measure("forecasting.fit_frame.followers",
+                           lambda: forecasting.fit_frame(followers, 'Total followers'), repeat, rows=len(followers)))
+    # Interval join of every post with the daily content totals around its created date
+    results.append(measure("attribute_posts", lambda: attribution.attribute_posts(posts, content), repeat,
+                           rows=len(posts)))
+
+    charts = {
+        "create_overview_chart": lambda period: create_overview_chart(followers, visitors, content, period=period),
+        "create_follower_chart": lambda period: create_follower_chart(followers, period=period),
+        "create_unique_visitors_chart": lambda period: create_unique_visitors_chart(visitors, period=period),
+        "create_total_clicks_chart": lambda period: create_total_clicks_chart(content, period=period),
+        "create_total_impressions_chart": lambda period: create_total_impressions_chart(content, period=period),
+        "create_reposts_chart": lambda period: create_reposts_chart(content, period=period)
+    }
+    for chart_name, build in charts.items():
+        for period in ["LTD", "YTD"]:
+            results.append(measure(f"chart.{chart_name}.{period}", lambda: build(period), repeat, rows=len(content)))
+            # Streamlit serializes every figure to JSON on each rerun
+            fig = build(period)
+            results.append(measure(f"chart_json.{chart_name}.{period}", fig.to_json, repeat, rows=len(content)))
+    return results
+
+
+def bench_presentation(workspace, repeat):
+    year = dt.date.today().year
+    table_data = build_kpi_table(workspace, year, year + 1)
+    return [
+        measure("kpi.build_kpi_table", lambda: build_kpi_table(workspace, year, year + 1), repeat),
+        measure("kpi.create_presentation", lambda: create_presentation(year, year + 1, table_data), repeat,
+                rows=len(table_data))
+    ]
+
+
+def run(daily_rows, posts, workspaces, xlsx_days, repeat=3, seed=0, skip_excel=False):
+    days_per_workspace = max(daily_rows // workspaces, 1)
+    posts_per_workspace = max(posts // workspaces, 1)
+    workspace_frames = {
+        f"Workspace {i:03d}": synthetic.workspace_frames(days_per_workspace, posts_per_workspace, seed=seed + i,
+                                                         workspace=f"Workspace {i:03d}")
+        for i in range(workspaces)
+    }
+    target = next(iter(workspace_frames))
+
+    original_db_path = db.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        db.DB_PATH = os.path.join(directory, "benchmark.db")
+        try:
+            db.init_db()
+            results = bench_ingest(workspace_frames)
+            results += bench_loads(target, repeat, days_per_workspace, posts_per_workspace)
+            results += bench_cold_loads(target, repeat)
+            results += bench_memory(target, repeat)
+            results += bench_analytics(target, repeat)
+            results += bench_presentation(target, repeat)
+            if not skip_excel:
+                results += bench_excel(directory, xlsx_days, posts_per_workspace, seed)
+        finally:
+            db.DB_PATH = original_db_path
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "daily_rows": daily_rows,
+            "posts": posts,
+            "workspaces": workspaces,
+            "days_per_workspace": days_per_workspace,
+            "posts_per_workspace": posts_per_workspace,
+            "xlsx_days": xlsx_days,
+            "repeat": repeat,
+            "seed": seed
+        },
+        "results": results
+    }
+
+
+def compare(previous, current, threshold=1.2):
+    """Print a side-by-side of two result files and return the names that regressed"""
+    previous_times = {r["name"]: r["best_seconds"] for r in previous["results"]}
+    regressions = []
+    print(f"{'benchmark':60} {'before':>10} {'after':>10} {'ratio':>7}")
+    for record in current["results"]:
+        before = previous_times.get(record["name"])
+        if before is None:
+            continue
+        after = record["best_seconds"]
+        ratio = after / before if before else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{record['name']:60} {before:10.4f} {after:10.4f} {ratio:7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(record["name"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=SIZES, default="small", help="Preset dataset size")
+    parser.add_argument("--daily-rows", type=int, help="Total daily rows per table across all workspaces")
+    parser.add_argument("--posts", type=int, help="Total posts across all workspaces")
+    parser.add_argument("--workspaces", type=int, help="Number of synthetic workspaces")
+    parser.add_argument("--xlsx-days", type=int, help="Rows in the synthetic LinkedIn xlsx exports")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-excel", action="store_true", help="Skip the xlsx parsing benchmarks")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    size = SIZES[args.size]
+    report = run(
+        daily_rows=args.daily_rows or size["daily_rows"],
+        posts=args.posts or size["posts"],
+        workspaces=args.workspaces or size["workspaces"],
+        xlsx_days=args.xlsx_days or size["xlsx_days"],
+        repeat=args.repeat,
+        seed=args.seed,
+        skip_excel=args.skip_excel
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Synthetic LinkedIn-shaped datasets for the benchmarks
+
+Frames are returned in the shape produced by beatrice_helpers.load_metrics_data
+and load_post_data, and the xlsx writers produce files those loaders accept.
+"""
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+
+def daily_index(days, end=None):
+    end = pd.Timestamp(end or dt.date.today())
+    return pd.date_range(end=end, periods=days, freq="D", name="Date")
+
+
+def followers_frame(days, rng, end=None):
+    index = daily_index(days, end)
+    return pd.DataFrame({"Total followers": rng.poisson(8, days)}, index=index)
+
+
+def visitor_frame(days, rng, end=None):
+    index = daily_index(days, end)
+    visitors = rng.poisson(40, days)
+    return pd.DataFrame({
+        "Total unique visitors (total)": visitors,
+        "Total page views (total)": visitors * 3 + rng.poisson(5, days)
+    }, index=index)
+
+
+def content_frame(days, rng, end=None):
+    index = daily_index(days, end)
+    # Weekday seasonality so the series look like real LinkedIn traffic
+    weekday_factor = np.where(index.dayofweek < 5, 1.0, 0.4)
+    impressions = rng.poisson(900 * weekday_factor)
+    clicks = rng.binomial(impressions, 0.03)
+    reactions = rng.binomial(impressions, 0.02)
+    reposts = rng.binomial(impressions, 0.002)
+    engagement = np.divide(clicks + reactions + reposts, impressions,
+                           out=np.zeros(days), where=impressions > 0)
+    return pd.DataFrame({
+        "Unique impressions (organic)": impressions,
+        "Clicks (total)": clicks,
+        "Reactions (total)": reactions,
+        "Reposts (total)": reposts,
+        "Engagement rate (total)": engagement
+    }, index=index)
+
+
+def posts_frame(posts, rng, days=365, end=None, workspace=""):
+    index = daily_index(days, end)
+    impressions = rng.poisson(2500, posts)
+    clicks = rng.binomial(impressions, 0.02)
+    likes = rng.binomial(impressions, 0.015)
+    comments = rng.binomial(impressions, 0.002)
+    reposts = rng.binomial(impressions, 0.001)
+    follows = rng.binomial(impressions, 0.001)
+    safe_impressions = np.maximum(impressions, 1)
+    titles = pd.Index([f"{workspace} post {i}: market update" for i in range(posts)], name="Post title")
+    return pd.DataFrame({
+        "Post link": [f"https://www.linkedin.com/feed/update/urn:li:activity:{7000000000000000000 + i}" for i in range(posts)],
+        "Created date": pd.to_datetime(rng.choice(index.values, posts)).to_pydatetime(),
+        "Impressions": impressions,
+        "Clicks": clicks,
+        "Click through rate (CTR)": clicks / safe_impressions,
+        "Likes": likes,
+        "Comments": comments,
+        "Reposts": reposts,
+        "Follows": follows,
+        "Engagement rate": (clicks + likes + comments + reposts) / safe_impressions
+    }, index=titles)
+
+
+def workspace_frames(days, posts, seed=0, workspace="", end=None):
+    """Generate the four frames for one workspace"""
+    rng = np.random.default_rng(seed)
+    return {
+        "followers": followers_frame(days, rng, end),
+        "visitors": visitor_frame(days, rng, end),
+        "content": content_frame(days, rng, end),
+        "posts": posts_frame(posts, rng, days=min(days, 3650), end=end, workspace=workspace)
+    }
+
+
+def _description_row(columns, text):
+    """LinkedIn puts a description line above the header of the Metrics and All posts sheets"""
+    return pd.DataFrame([[text] + [None] * (len(columns) - 1)], columns=columns)
+
+
+def write_followers_xlsx(path, df):
+    export = df.reset_index()
+    export["Sponsored followers"] = 0
+    export["Organic followers"] = export["Total followers"]
+    export["Date"] = export["Date"].dt.strftime("%m/%d/%Y")
+    export = export[["Date", "Sponsored followers", "Organic followers", "Total followers"]]
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        export.to_excel(writer, sheet_name="New followers", index=False)
+
+
+def write_visitors_xlsx(path, df):
+    export = df.reset_index()
+    export["Date"] = export["Date"].dt.strftime("%m/%d/%Y")
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        export.to_excel(writer, sheet_name="Visitor metrics", index=False)
+
+
+def write_content_xlsx(path, metrics_df, posts_df):
+    metrics = metrics_df.reset_index()
+    metrics["Date"] = metrics["Date"].dt.strftime("%m/%d/%Y")
+    posts = posts_df.reset_index()
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        metrics_description = _description_row(metrics.columns, "Aggregated content metrics")
+        metrics_description.to_excel(writer, sheet_name="Metrics", index=False, header=False)
+        metrics.to_excel(writer, sheet_name="Metrics", index=False, startrow=1)
+
+        posts_description = _description_row(posts.columns, "All posts")
+        posts_description.to_excel(writer, sheet_name="All posts", index=False, header=False)
+        posts.to_excel(writer, sheet_name="All posts", index=False, startrow=1)
+
+
+def write_workspace_exports(directory, frames, prefix="workspace"):
+    """
+    Write the three LinkedIn exports for one workspace
+
+    Returns:
+    dict: Paths of the followers, visitors and content files
+    """
+    paths = {
+        "followers": f"{directory}/{prefix}_followers.xlsx",
+        "visitors": f"{directory}/{prefix}_visitors.xlsx",
+        "content": f"{directory}/{prefix}_content.xlsx"
+    }
+    write_followers_xlsx(paths["followers"], frames["followers"])
+    write_visitors_xlsx(paths["visitors"], frames["visitors"])
+    write_content_xlsx(paths["content"], frames["content"], frames["posts"])
+    return paths
@@ -0,0 +1,183 @@
+import calendar
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+import database as db
+from instrumentation import timed, record_cache_hit
+
+# Heatmap column layouts, with the strftime format, the range of the column numbers and their names
+HEATMAP_LAYOUTS = {
+    "Week of Year": {"format": "%W", "columns": range(0, 54), "label": "Week",
+                     "names": [str(week) for week in range(0, 54)]},
+    "Month": {"format": "%m", "columns": range(1, 13), "label": "Month", "names": list(calendar.month_abbr)[1:]}
+}
+
+# Heatmap rows, Monday first, by strftime('%w') weekday number (Sunday = 0)
+WEEKDAYS = {1: "Mon", 2: "Tue", 3: "Wed", 4: "Thu", 5: "Fri", 6: "Sat", 0: "Sun"}
+
+# Weeks with at least this many posts share one cadence row
+CADENCE_CAP = 7
+
+HEATMAP_COLUMNS = ["weekday", "bucket", "posts", "median_engagement"]
+CADENCE_COLUMNS = ["posts_per_week", "weeks", "posts", "median_engagement"]
+
+# The median of each group from two middle rows of a window ordering, since SQLite has no MEDIAN.
+# Posts without an engagement rate sort last and are left out of the median but still counted.
+HEATMAP_QUERY = '''
+WITH cells AS (
+    SELECT CAST(strftime('%w', created_day * 86400, 'unixepoch') AS INTEGER) AS weekday,
+           CAST(strftime(?, created_day * 86400, 'unixepoch') AS INTEGER) AS bucket,
+           engagement_rate
+    FROM posts
+    WHERE workspace = ? AND created_day IS NOT NULL
+),
+ranked AS (
+    SELECT weekday, bucket, engagement_rate,
+           ROW_NUMBER() OVER (PARTITION BY weekday, bucket
+                              ORDER BY engagement_rate IS NULL, engagement_rate) AS position,
+           COUNT(engagement_rate) OVER (PARTITION BY weekday, bucket) AS rated
+    FROM cells
+)
+SELECT weekday, bucket, COUNT(*) AS posts,
+       AVG(CASE WHEN position IN ((rated + 1) / 2, (rated + 2) / 2) THEN engagement_rate END) AS median_engagement
+FROM ranked
+GROUP BY weekday, bucket
+'''
+
+# Weeks start on Monday, day 0 (1970-01-01) was a Thursday
+CADENCE_QUERY = '''
+WITH weekly AS (
+    SELECT engagement_rate, (created_day + 3) / 7 AS week,
+           MIN(COUNT(*) OVER (PARTITION BY (created_day + 3) / 7), ?) AS posts_per_week
+    FROM posts
+    WHERE workspace = ? AND created_day IS NOT NULL
+),
+ranked AS (
+    SELECT posts_per_week, week, engagement_rate,
+           ROW_NUMBER() OVER (PARTITION BY posts_per_week
+                              ORDER BY engagement_rate IS NULL, engagement_rate) AS position,
+           COUNT(engagement_rate) OVER (PARTITION BY posts_per_week) AS rated
+    FROM weekly
+)
+SELECT posts_per_week, COUNT(DISTINCT week) AS weeks, COUNT(*) AS posts,
+       AVG(CASE WHEN position IN ((rated + 1) / 2, (rated + 2) / 2) THEN engagement_rate END) AS median_engagement
+FROM ranked
+GROUP BY posts_per_week
+ORDER BY posts_per_week
+'''
+
+# (workspace, query name, posts data version) -> result frame
+_cache = {}
+_lock = threading.Lock()
+
+
+def _cached_query(workspace, name, query, params, columns, version):
+    """Run an aggregate over a workspace's posts once per posts data version"""
+    if version is None:
+        version = db.get_data_versions(workspace).get("posts", 0)
+
+    key = (workspace, name, version)
+    with _lock:
+        result = _cache.get(key)
+    record_cache_hit(f"cadence.{name}", result is not None)
+    if result is not None:
+        return result
+
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        result = pd.read_sql(query, conn, params=params)
+        conn.close()
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        if 'conn' in locals():
+            conn.close()
+        result = pd.DataFrame(columns=columns)
+
+    with _lock:
+        # Results of older versions can never be hit again
+        for stale_key in [k for k in _cache if k[:2] == key[:2]]:
+            del _cache[stale_key]
+        _cache[key] = result
+    return result
+
+
+@timed
+def get_posting_heatmap(workspace, layout="Week of Year", version=None):
+    """
+    Post counts and median engagement per weekday and week of year or month
+
+    One grouped query over the workspace's posts, so the result has at most
+    7 x 54 rows whatever the number of posts.
+
+    Parameters:
+    workspace (str): The workspace name
+    layout (str): One of HEATMAP_LAYOUTS
+    version (int): The 'posts' data version, looked up when not given
+
+    Returns:
+    DataFrame: HEATMAP_COLUMNS, one row per weekday and column that has posts
+    """
+    return _cached_query(workspace, f"heatmap.{layout}", HEATMAP_QUERY,
+                         (HEATMAP_LAYOUTS[layout]["format"], workspace), HEATMAP_COLUMNS, version)
+
+
+@timed
+def get_posting_cadence(workspace, version=None):
+    """
+    Median engagement of posts by the number of posts published in their week
+
+    Parameters:
+    workspace (str): The workspace name
+    version (int): The 'posts' data version, looked up when not given
+
+    Returns:
+    DataFrame: CADENCE_COLUMNS, one row per weekly post count up to CADENCE_CAP
+    """
+    return _cached_query(workspace, "cadence", CADENCE_QUERY, (CADENCE_CAP, workspace), CADENCE_COLUMNS, version)
+
+
+def _post_days(post_df):
+    created = pd.to_datetime(post_df["Created date"], errors="coerce")
+    rated = post_df.loc[created.notna(), "Engagement rate"].astype(float).to_numpy()
+    return created.dropna(), rated
+
+
+@timed
+def posting_heatmap_frame(post_df, layout="Week of Year"):
+    """Same as get_posting_heatmap for posts that are not stored, as one groupby over the frame"""
+    created, rates = _post_days(post_df)
+    if created.empty:
+        return pd.DataFrame(columns=HEATMAP_COLUMNS)
+    bucket = created.dt.strftime(HEATMAP_LAYOUTS[layout]["format"]).astype(int)
+    # strftime('%w') numbering, Sunday = 0
+    frame = pd.DataFrame({"weekday": (created.dt.dayofweek.to_numpy() + 1) % 7, "bucket": bucket.to_numpy(),
+                          "engagement_rate": rates})
+    grouped = frame.groupby(["weekday", "bucket"])["engagement_rate"]
+    return pd.DataFrame({"posts": grouped.size(), "median_engagement": grouped.median()}).reset_index()
+
+
+@timed
+def posting_cadence_frame(post_df):
+    """Same as get_posting_cadence for posts that are not stored"""
+    created, rates = _post_days(post_df)
+    if created.empty:
+        return pd.DataFrame(columns=CADENCE_COLUMNS)
+    days = created.to_numpy().astype("datetime64[D]").astype(np.int64)
+    frame = pd.DataFrame({"week": (days + 3) // 7, "engagement_rate": rates})
+    frame["posts_per_week"] = frame.groupby("week")["week"].transform("size").clip(upper=CADENCE_CAP)
+    grouped = frame.groupby("posts_per_week")
+    return pd.DataFrame({"weeks": grouped["week"].nunique(), "posts": grouped.size(),
+                         "median_engagement": grouped["engagement_rate"].median()}).reset_index()
+
+
+def heatmap_grid(cells, layout, value="median_engagement"):
+    """
+    Pivot heatmap cells to a weekday x column grid
+
+    Returns:
+    DataFrame: WEEKDAYS labels as rows, every column of the layout, NaN for cells without posts
+    """
+    grid = cells.pivot(index="weekday", columns="bucket", values=value) if not cells.empty else pd.DataFrame()
+    grid = grid.reindex(index=list(WEEKDAYS), columns=list(HEATMAP_LAYOUTS[layout]["columns"]))
+    grid.index = list(WEEKDAYS.values())
+    return grid
@@ -1,62 +1,73 @@
+import json
 import pandas as pd
 import sqlite3
 import os
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
+from instrumentation import timed, record_cache_hit
+import snapshots
 
 # Database path
 # DB_PATH = 'C:\\Users\\mRemfort\\PycharmProjects\\data_workspace - Database\\linkedin_analytics.db'
 DB_PATH = './linkedin_analytics.db'
 
+# Serve the load_* functions from memory-mapped Arrow snapshots that every write path refreshes.
+# SQLite stays the source of truth, snapshots are rebuilt from it whenever they are missing.
+USE_SNAPSHOTS = True
+
+@timed
 def db_exists():
     """Check if the database file exists"""
     return os.path.exists(DB_PATH)
 
 
-def init_db():
-    """Initialize the database with required tables if they don't exist"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+# Writes logged in data_changes per table and workspace, rollups further behind start over
+DATA_CHANGES_KEEP = 1000
 
-    # Create tables for each data type
-    c.execute('''
+# Minutes after which a claimed file that was never finished counts as abandoned by a watcher that died,
+# and can be claimed again
+CLAIM_TIMEOUT_MINUTES = 60
+
+# Version of the table layout, stored in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+# Dates are stored as INTEGER days since 1970-01-01
+TABLE_SCHEMAS = {
+    "new_followers": '''
     CREATE TABLE IF NOT EXISTS new_followers (
         workspace TEXT,
-        date TEXT,
+        day INTEGER,
         total_followers INTEGER,
-        PRIMARY KEY (workspace, date)
+        PRIMARY KEY (workspace, day)
     )
-    ''')
-
-    c.execute('''
+    ''',
+    "visitor_metrics": '''
     CREATE TABLE IF NOT EXISTS visitor_metrics (
         workspace TEXT,
-        date TEXT,
+        day INTEGER,
         total_unique_visitors INTEGER,
         total_page_views INTEGER,
-        PRIMARY KEY (workspace, date)
+        PRIMARY KEY (workspace, day)
     )
-    ''')
-
-    c.execute('''
+    ''',
+    "content_metrics": '''
     CREATE TABLE IF NOT EXISTS content_metrics (
         workspace TEXT,
-        date TEXT,
+        day INTEGER,
         unique_impressions INTEGER,
         clicks_total INTEGER,
         reactions_total INTEGER,
         reposts_total INTEGER,
         engagement_rate REAL,
-        PRIMARY KEY (workspace, date)
+        PRIMARY KEY (workspace, day)
     )
-    ''')
-
-    c.execute('''
+    ''',
+    "posts": '''
     CREATE TABLE IF NOT EXISTS posts (
         workspace TEXT,
         post_title TEXT,
         post_link TEXT,
-        created_date TEXT,
+        created_day INTEGER,
         impressions INTEGER,
         clicks INTEGER,
         click_through_rate REAL,
@@ -67,12 +78,311 @@ def init_db():
         engagement_rate REAL,
         PRIMARY KEY (workspace, post_title)
     )
-    ''')
+    ''',
+    "kpi_targets": '''
+    CREATE TABLE IF NOT EXISTS kpi_targets (
+        workspace TEXT,
+        year INTEGER,
+        kpi TEXT,
+        projected REAL,
+        PRIMARY KEY (workspace, year, kpi)
+    )
+    ''',
+    "undo_batches": '''
+    CREATE TABLE IF NOT EXISTS undo_batches (
+        batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workspace TEXT,
+        description TEXT,
+        deleted_at TEXT,
+        row_count INTEGER
+    )
+    ''',
+    "undo_log": '''
+    CREATE TABLE IF NOT EXISTS undo_log (
+        batch_id INTEGER,
+        table_name TEXT,
+        row_json TEXT
+    )
+    ''',
+    "data_versions": '''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        workspace TEXT,
+        table_name TEXT,
+        version INTEGER,
+        PRIMARY KEY (workspace, table_name)
+    )
+    ''',
+    "data_changes": '''
+    CREATE TABLE IF NOT EXISTS data_changes (
+        workspace TEXT,
+        table_name TEXT,
+        version INTEGER,
+        first_day INTEGER,
+        PRIMARY KEY (workspace, table_name, version)
+    )
+    ''',
+    "anomaly_flags": '''
+    CREATE TABLE IF NOT EXISTS anomaly_flags (
+        workspace TEXT,
+        table_name TEXT,
+        metric TEXT,
+        day INTEGER,
+        value REAL,
+        expected REAL,
+        score REAL,
+        PRIMARY KEY (workspace, metric, day)
+    )
+    ''',
+    "anomaly_watermarks": '''
+    CREATE TABLE IF NOT EXISTS anomaly_watermarks (
+        workspace TEXT,
+        table_name TEXT,
+        last_day INTEGER,
+        day_count INTEGER,
+        version INTEGER,
+        PRIMARY KEY (workspace, table_name)
+    )
+    ''',
+    "post_attribution": '''
+    CREATE TABLE IF NOT EXISTS post_attribution (
+        workspace TEXT,
+        post_title TEXT,
+        created_day INTEGER,
+        impressions INTEGER,
+        clicks INTEGER,
+        reposts INTEGER,
+        observed_days INTEGER,
+        baseline_impressions INTEGER,
+        baseline_clicks INTEGER,
+        baseline_reposts INTEGER,
+        baseline_days INTEGER,
+        PRIMARY KEY (workspace, post_title)
+    )
+    ''',
+    "attribution_watermarks": '''
+    CREATE TABLE IF NOT EXISTS attribution_watermarks (
+        workspace TEXT PRIMARY KEY,
+        last_day INTEGER,
+        day_count INTEGER,
+        content_version INTEGER,
+        posts_version INTEGER
+    )
+    ''',
+    "ingested_files": '''
+    CREATE TABLE IF NOT EXISTS ingested_files (
+        content_hash TEXT PRIMARY KEY,
+        path TEXT,
+        workspace TEXT,
+        kind TEXT,
+        error TEXT,
+        ingested_at TEXT
+    )
+    ''',
+    "maintenance_runs": '''
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at TEXT,
+        seconds REAL,
+        report TEXT
+    )
+    '''
+}
+
+TABLE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_undo_log_batch ON undo_log (batch_id, table_name)",
+    # Daily tables are browsed through their (workspace, day) primary key, posts need their own index
+    "CREATE INDEX IF NOT EXISTS idx_posts_workspace_created ON posts (workspace, created_day)"
+]
+
+# Views with the original 'YYYY-MM-DD' TEXT date columns, for ad-hoc queries and external tools
+DATE_VIEWS = [
+    '''CREATE VIEW IF NOT EXISTS v_new_followers AS
+       SELECT workspace, date(day * 86400, 'unixepoch') AS date, total_followers
+       FROM new_followers''',
+    '''CREATE VIEW IF NOT EXISTS v_visitor_metrics AS
+       SELECT workspace, date(day * 86400, 'unixepoch') AS date, total_unique_visitors, total_page_views
+       FROM visitor_metrics''',
+    '''CREATE VIEW IF NOT EXISTS v_content_metrics AS
+       SELECT workspace, date(day * 86400, 'unixepoch') AS date, unique_impressions, clicks_total,
+              reactions_total, reposts_total, engagement_rate
+       FROM content_metrics''',
+    '''CREATE VIEW IF NOT EXISTS v_posts AS
+       SELECT workspace, post_title, post_link, date(created_day * 86400, 'unixepoch') AS created_date,
+              impressions, clicks, click_through_rate, likes, comments, reposts, follows, engagement_rate
+       FROM posts'''
+]
+
+# TEXT date column replaced by an INTEGER day column in schema version 1
+DAY_COLUMNS = {
+    "new_followers": ("date", "day"),
+    "visitor_metrics": ("date", "day"),
+    "content_metrics": ("date", "day"),
+    "posts": ("created_date", "created_day")
+}
+
+
+def day_numbers(values):
+    """
+    Convert dates to INTEGER days since 1970-01-01
+
+    Parameters:
+    values (iterable): Datetimes, dates or date strings
+
+    Returns:
+    list: Day numbers, None where a value is missing or not a date
+    """
+    dates = pd.to_datetime(pd.Series(values), format="mixed", errors="coerce")
+    days = dates.to_numpy().astype("datetime64[D]").astype(np.int64).tolist()
+    if dates.isna().any():
+        return [day if present else None for day, present in zip(days, dates.notna())]
+    return days
+
+
+def to_day(value):
+    """Convert a single date, datetime or 'YYYY-MM-DD' string to its day number"""
+    return day_numbers([value])[0]
+
 
+def _migrate_dates_to_day_numbers(conn):
+    """Schema version 1: move the TEXT date columns to INTEGER day numbers"""
+    c = conn.cursor()
+    # sqlite3 does not open transactions for DDL, so begin one to make the migration all-or-nothing
+    c.execute("BEGIN")
+    for table_name, (date_column, day_column) in DAY_COLUMNS.items():
+        columns = [column[1] for column in c.execute(f"PRAGMA table_info({table_name})").fetchall()]
+        if date_column not in columns:
+            continue
+
+        rows = pd.read_sql(f"SELECT * FROM {table_name}", conn)
+        rows[date_column] = pd.Series(day_numbers(rows[date_column]), index=rows.index, dtype=object)
+        rows.rename(columns={date_column: day_column}, inplace=True)
+        rows = rows.astype(object).where(rows.notna(), None)
+
+        c.execute(f"ALTER TABLE {table_name} RENAME TO {table_name}_text_dates")
+        c.execute(TABLE_SCHEMAS[table_name])
+        c.executemany(
+            f"INSERT OR REPLACE INTO {table_name} ({', '.join(rows.columns)}) "
+            f"VALUES ({', '.join('?' * len(rows.columns))})",
+            rows.itertuples(index=False, name=None)
+        )
+        c.execute(f"DROP TABLE {table_name}_text_dates")
+    conn.commit()
+
+
+@timed
+def init_db():
+    """Initialize the database with required tables if they don't exist, migrating older layouts"""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+
+    # Readers no longer wait for the writer, and maintenance.py can return free pages without a full VACUUM.
+    # auto_vacuum only applies to new files here, existing ones switch over on their next VACUUM.
+    # auto_vacuum goes first, switching to WAL writes the header of a new file
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    c.execute("PRAGMA journal_mode = WAL")
+
+    c.execute("PRAGMA user_version")
+    if c.fetchone()[0] < 1:
+        _migrate_dates_to_day_numbers(conn)
+
+    # Create tables for each data type
+    for schema in TABLE_SCHEMAS.values():
+        c.execute(schema)
+    for index in TABLE_INDEXES:
+        c.execute(index)
+    for view in DATE_VIEWS:
+        c.execute(view)
+
+    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     conn.close()
 
 
+def bump_data_version(c, table_name, workspace, first_day=None):
+    """
+    Increase the data version of a table for a workspace
+
+    Called by every write path inside its own transaction, so the new version
+    becomes visible together with the data it describes. Writes to the dated
+    tables also log the earliest day they touched, see first_changed_day.
+
+    Parameters:
+    c (Cursor): Cursor of the writing connection
+    table_name (str): The table that was written
+    workspace (str): The workspace whose rows changed
+    first_day (int): Earliest day number added, changed or removed, None when not known
+    """
+    c.execute(
+        '''INSERT INTO data_versions (workspace, table_name, version) VALUES (?, ?, 1)
+           ON CONFLICT (workspace, table_name) DO UPDATE SET version = version + 1
+           RETURNING version''',
+        (workspace, table_name)
+    )
+    version = c.fetchone()[0]
+    if table_name in DAY_COLUMNS:
+        c.execute("INSERT OR REPLACE INTO data_changes (workspace, table_name, version, first_day) VALUES (?, ?, ?, ?)",
+                  (workspace, table_name, version, first_day))
+        c.execute("DELETE FROM data_changes WHERE workspace = ? AND table_name = ? AND version <= ?",
+                  (workspace, table_name, version - DATA_CHANGES_KEEP))
+
+
+def first_changed_day(c, table_name, workspace, since_version, version):
+    """
+    Get the earliest day touched by the writes after one data version up to another
+
+    Lets the stored rollups redo only the days from there on, also when a
+    write revised days long before their watermark.
+
+    Parameters:
+    c (Cursor): Cursor of any connection
+    table_name (str): One of the tables in DAY_COLUMNS
+    workspace (str): The workspace name
+    since_version (int): The version the rollup was computed at
+    version (int): The current version
+
+    Returns:
+    int: The day number, None when a write did not log its days or is no longer in the log
+    """
+    c.execute(
+        '''SELECT COUNT(*), COUNT(first_day), MIN(first_day) FROM data_changes
+           WHERE workspace = ? AND table_name = ? AND version > ? AND version <= ?''',
+        (workspace, table_name, since_version, version)
+    )
+    writes, logged_days, first_day = c.fetchone()
+    if writes != version - since_version or logged_days != writes:
+        return None
+    return first_day
+
+
+@timed
+def get_data_versions(workspace):
+    """
+    Get the current data version of every table of a workspace
+
+    Versions only ever increase, so comparing them with the ones seen earlier
+    tells which tables changed. This is a single primary key lookup and cheap
+    enough to poll.
+
+    Parameters:
+    workspace (str): The workspace name
+
+    Returns:
+    dict: Mapping of table name to version, tables never written are missing
+    """
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute("SELECT table_name, version FROM data_versions WHERE workspace = ?", (workspace,))
+        versions = dict(c.fetchall())
+        conn.close()
+        return versions
+    except sqlite3.Error:
+        # Database not initialized yet
+        if 'conn' in locals():
+            conn.close()
+        return {}
+
+
 # Helper function to safely convert values to integers or 0 if NaN
 def safe_int(value):
     if pd.isna(value) or np.isnan(value) if isinstance(value, float) else False:
@@ -87,6 +397,42 @@ def safe_float(value):
     return float(value)
 
 
+def _int_values(column):
+    """Column values as Python ints, with missing values as 0 like safe_int"""
+    return pd.to_numeric(column, errors='coerce').fillna(0).astype(np.int64).tolist()
+
+
+def _float_values(column):
+    """Column values as Python floats, with missing values as 0.0 like safe_float"""
+    return pd.to_numeric(column, errors='coerce').fillna(0.0).astype(np.float64).tolist()
+
+
+def _rows_with_days(dates, workspace, *columns):
+    """Build (workspace, day, *values) rows, skipping rows whose date is missing"""
+    return [(workspace, day, *values) for day, *values in zip(day_numbers(dates), *columns) if day is not None]
+
+
+def _first_changed_day(c, table_name, columns, rows):
+    """
+    Earliest day of (workspace, day, *values) rows that are new or differ from the stored ones
+
+    Exports repeat every day of their range, so this keeps a re-imported
+    export from counting as a change to all of its days.
+
+    Returns:
+    int: The day number, None when every row is already stored as it is
+    """
+    if not rows:
+        return None
+    days = [row[1] for row in rows]
+    c.execute(f"SELECT day, {', '.join(columns)} FROM {table_name} WHERE workspace = ? AND day BETWEEN ? AND ?",
+              (rows[0][0], min(days), max(days)))
+    stored = {row[0]: row[1:] for row in c.fetchall()}
+    changed = [row[1] for row in rows if stored.get(row[1]) != tuple(row[2:])]
+    return min(changed) if changed else None
+
+
+@timed
 def save_followers_data(df, workspace):
     """Save followers data to database"""
     if df.empty:
@@ -95,21 +441,26 @@ def save_followers_data(df, workspace):
     conn = sqlite3.connect(DB_PATH)
 
     # Convert dataframe to format expected by database
-    db_data = []
-    for idx, row in df.iterrows():
-        date_str = idx.strftime('%Y-%m-%d')
-        db_data.append((workspace, date_str, safe_int(row['Total followers'])))
+    db_data = _rows_with_days(df.index, workspace, _int_values(df['Total followers']))
 
     c = conn.cursor()
+    first_day = _first_changed_day(c, "new_followers", ["total_followers"], db_data)
+    if first_day is None:
+        # Everything is stored already, leave the version and the caches alone
+        conn.close()
+        return
     c.executemany(
-        'INSERT OR REPLACE INTO new_followers (workspace, date, total_followers) VALUES (?, ?, ?)',
+        'INSERT OR REPLACE INTO new_followers (workspace, day, total_followers) VALUES (?, ?, ?)',
         db_data
     )
 
+    bump_data_version(c, "new_followers", workspace, first_day)
     conn.commit()
     conn.close()
+    refresh_snapshot("new_followers", workspace)
 
 
+@timed
 def save_visitor_metrics(df, workspace):
     """Save visitor metrics data to database"""
     if df.empty:
@@ -118,26 +469,31 @@ def save_visitor_metrics(df, workspace):
     conn = sqlite3.connect(DB_PATH)
 
     # Convert dataframe to format expected by database
-    db_data = []
-    for idx, row in df.iterrows():
-        date_str = idx.strftime('%Y-%m-%d')
-        db_data.append((
-            workspace,
-            date_str,
-            safe_int(row['Total unique visitors (total)']),
-            safe_int(row['Total page views (total)'])
-        ))
+    db_data = _rows_with_days(
+        df.index,
+        workspace,
+        _int_values(df['Total unique visitors (total)']),
+        _int_values(df['Total page views (total)'])
+    )
 
     c = conn.cursor()
+    first_day = _first_changed_day(c, "visitor_metrics", ["total_unique_visitors", "total_page_views"], db_data)
+    if first_day is None:
+        # Everything is stored already, leave the version and the caches alone
+        conn.close()
+        return
     c.executemany(
-        'INSERT OR REPLACE INTO visitor_metrics (workspace, date, total_unique_visitors, total_page_views) VALUES (?, ?, ?, ?)',
+        'INSERT OR REPLACE INTO visitor_metrics (workspace, day, total_unique_visitors, total_page_views) VALUES (?, ?, ?, ?)',
         db_data
     )
 
+    bump_data_version(c, "visitor_metrics", workspace, first_day)
     conn.commit()
     conn.close()
+    refresh_snapshot("visitor_metrics", workspace)
 
 
+@timed
 def save_content_metrics(df, workspace):
     """Save content metrics data to database"""
     if df.empty:
@@ -146,31 +502,36 @@ def save_content_metrics(df, workspace):
     conn = sqlite3.connect(DB_PATH)
 
     # Convert dataframe to format expected by database
-    db_data = []
-    for idx, row in df.iterrows():
-        date_str = idx.strftime('%Y-%m-%d')
-        db_data.append((
-            workspace,
-            date_str,
-            safe_int(row['Unique impressions (organic)']),
-            safe_int(row['Clicks (total)']),
-            safe_int(row['Reactions (total)']),
-            safe_int(row['Reposts (total)']),
-            safe_float(row['Engagement rate (total)'])
-        ))
+    db_data = _rows_with_days(
+        df.index,
+        workspace,
+        _int_values(df['Unique impressions (organic)']),
+        _int_values(df['Clicks (total)']),
+        _int_values(df['Reactions (total)']),
+        _int_values(df['Reposts (total)']),
+        _float_values(df['Engagement rate (total)'])
+    )
 
     c = conn.cursor()
+    first_day = _first_changed_day(c, "content_metrics", ["unique_impressions", "clicks_total", "reactions_total", "reposts_total", "engagement_rate"], db_data)
+    if first_day is None:
+        # Everything is stored already, leave the version and the caches alone
+        conn.close()
+        return
     c.executemany(
         '''INSERT OR REPLACE INTO content_metrics 
-           (workspace, date, unique_impressions, clicks_total, reactions_total, reposts_total, engagement_rate) 
+           (workspace, day, unique_impressions, clicks_total, reactions_total, reposts_total, engagement_rate) 
            VALUES (?, ?, ?, ?, ?, ?, ?)''',
         db_data
     )
 
+    bump_data_version(c, "content_metrics", workspace, first_day)
     conn.commit()
     conn.close()
+    refresh_snapshot("content_metrics", workspace)
 
 
+@timed
 def save_posts_data(df, workspace):
     """Save posts data to database"""
     if df.empty:
@@ -179,70 +540,147 @@ def save_posts_data(df, workspace):
     conn = sqlite3.connect(DB_PATH)
 
     # Convert dataframe to format expected by database
-    db_data = []
-    for idx, row in df.iterrows():
-        post_title = idx
-        created_date = row['Created date'].strftime('%Y-%m-%d') if isinstance(row['Created date'], datetime) else row[
-            'Created date']
-
-        db_data.append((
-            workspace,
-            post_title,
-            str(row['Post link']),
-            created_date,
-            safe_int(row['Impressions']),
-            safe_int(row['Clicks']),
-            safe_float(row['Click through rate (CTR)']),
-            safe_int(row['Likes']),
-            safe_int(row['Comments']),
-            safe_int(row['Reposts']),
-            safe_int(row['Follows']),
-            safe_float(row['Engagement rate'])
-        ))
+    db_data = list(zip(
+        [workspace] * len(df),
+        df.index,
+        df['Post link'].astype(str),
+        day_numbers(df['Created date']),
+        _int_values(df['Impressions']),
+        _int_values(df['Clicks']),
+        _float_values(df['Click through rate (CTR)']),
+        _int_values(df['Likes']),
+        _int_values(df['Comments']),
+        _int_values(df['Reposts']),
+        _int_values(df['Follows']),
+        _float_values(df['Engagement rate'])
+    ))
 
     c = conn.cursor()
     c.executemany(
         '''INSERT OR REPLACE INTO posts 
-           (workspace, post_title, post_link, created_date, impressions, clicks, click_through_rate, 
+           (workspace, post_title, post_link, created_day, impressions, clicks, click_through_rate, 
             likes, comments, reposts, follows, engagement_rate) 
            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
         db_data
     )
 
+    bump_data_version(c, "posts", workspace)
     conn.commit()
     conn.close()
+    refresh_snapshot("posts", workspace)
 
 
-def load_followers_data(workspace):
-    """Load followers data from database"""
+# Columns read by the load_* functions and the day-number column converted to datetimes for each table
+LOAD_QUERIES = {
+    "new_followers": "SELECT day AS date, total_followers FROM new_followers WHERE workspace = ?",
+    "visitor_metrics": "SELECT day AS date, total_unique_visitors, total_page_views FROM visitor_metrics WHERE workspace = ?",
+    "content_metrics": '''SELECT day AS date, unique_impressions, clicks_total, reactions_total, reposts_total, engagement_rate 
+                          FROM content_metrics WHERE workspace = ?''',
+    "posts": '''SELECT post_title, post_link, created_day AS created_date, impressions, clicks, click_through_rate, 
+                likes, comments, reposts, follows, engagement_rate 
+                FROM posts WHERE workspace = ?'''
+}
+
+DATE_COLUMNS = {
+    "new_followers": "date",
+    "visitor_metrics": "date",
+    "content_metrics": "date",
+    "posts": "created_date"
+}
+
+
+def _read_sql_table(table_name, workspace):
+    """
+    Read a table for a workspace straight from SQLite, with its day numbers converted to datetime64
+
+    The rows and the table's data version are read in one transaction, so the
+    version is exactly the one the rows belong to.
+
+    Returns:
+    tuple: (DataFrame, data version of the table for the workspace)
+    """
     conn = sqlite3.connect(DB_PATH)
-    query = "SELECT date, total_followers FROM new_followers WHERE workspace = ?"
-    df = pd.read_sql(query, conn, params=(workspace,))
+    c = conn.cursor()
+    c.execute("BEGIN")
+    c.execute("SELECT version FROM data_versions WHERE workspace = ? AND table_name = ?", (workspace, table_name))
+    row = c.fetchone()
+    df = pd.read_sql(LOAD_QUERIES[table_name], conn, params=(workspace,))
+    conn.rollback()
     conn.close()
 
+    date_column = DATE_COLUMNS[table_name]
+    df[date_column] = pd.to_datetime(df[date_column], unit='D')
+    return df, row[0] if row else 0
+
+
+@timed
+def refresh_snapshot(table_name, workspace):
+    """
+    Re-materialize the columnar snapshot of a table for a workspace from SQLite
+
+    Parameters:
+    table_name (str): The name of the table
+    workspace (str): The workspace name
+
+    Returns:
+    DataFrame: The rows that were snapshotted
+    """
+    df, version = _read_sql_table(table_name, workspace)
+    if USE_SNAPSHOTS:
+        snapshots.write_snapshot(DB_PATH, table_name, workspace, df, version)
+    return df
+
+
+def _load_table(table_name, workspace, min_version=None):
+    """
+    Read a table for a workspace from its snapshot, falling back to SQLite when there is none
+
+    Writers bump the data version before they refresh the snapshot, and a
+    refresh can fail or come from another process. A snapshot older than
+    min_version is therefore treated as missing and rebuilt from SQLite, so
+    the rows are never older than the version the caller tags them with.
+
+    Parameters:
+    table_name (str): The name of the table
+    workspace (str): The workspace name
+    min_version (int): Oldest data version accepted, the table's current version when None
+    """
+    if not USE_SNAPSHOTS:
+        return _read_sql_table(table_name, workspace)[0]
+
+    if min_version is None:
+        min_version = get_data_versions(workspace).get(table_name, 0)
+    df = snapshots.read_snapshot(DB_PATH, table_name, workspace, min_version)
+    record_cache_hit(f"snapshot.{table_name}", df is not None)
+    if df is None:
+        df = refresh_snapshot(table_name, workspace)
+    return df
+
+
+@timed
+def load_followers_data(workspace, min_version=None):
+    """Load followers data from database"""
+    df = _load_table("new_followers", workspace, min_version)
+
     if df.empty:
         return pd.DataFrame()
 
     # Format dataframe to match expected structure
-    df['date'] = pd.to_datetime(df['date'])
     df.set_index('date', inplace=True)
     df.rename(columns={'total_followers': 'Total followers'}, inplace=True)
 
     return df
 
 
-def load_visitor_metrics(workspace):
+@timed
+def load_visitor_metrics(workspace, min_version=None):
     """Load visitor metrics from database"""
-    conn = sqlite3.connect(DB_PATH)
-    query = "SELECT date, total_unique_visitors, total_page_views FROM visitor_metrics WHERE workspace = ?"
-    df = pd.read_sql(query, conn, params=(workspace,))
-    conn.close()
+    df = _load_table("visitor_metrics", workspace, min_version)
 
     if df.empty:
         return pd.DataFrame()
 
     # Format dataframe to match expected structure
-    df['date'] = pd.to_datetime(df['date'])
     df.set_index('date', inplace=True)
     df.rename(columns={
         'total_unique_visitors': 'Total unique visitors (total)',
@@ -252,19 +690,15 @@ def load_visitor_metrics(workspace):
     return df
 
 
-def load_content_metrics(workspace):
+@timed
+def load_content_metrics(workspace, min_version=None):
     """Load content metrics from database"""
-    conn = sqlite3.connect(DB_PATH)
-    query = '''SELECT date, unique_impressions, clicks_total, reactions_total, reposts_total, engagement_rate 
-              FROM content_metrics WHERE workspace = ?'''
-    df = pd.read_sql(query, conn, params=(workspace,))
-    conn.close()
+    df = _load_table("content_metrics", workspace, min_version)
 
     if df.empty:
         return pd.DataFrame()
 
     # Format dataframe to match expected structure
-    df['date'] = pd.to_datetime(df['date'])
     df.set_index('date', inplace=True)
     df.rename(columns={
         'unique_impressions': 'Unique impressions (organic)',
@@ -277,14 +711,10 @@ def load_content_metrics(workspace):
     return df
 
 
-def load_posts_data(workspace):
+@timed
+def load_posts_data(workspace, min_version=None):
     """Load posts data from database"""
-    conn = sqlite3.connect(DB_PATH)
-    query = '''SELECT post_title, post_link, created_date, impressions, clicks, click_through_rate, 
-               likes, comments, reposts, follows, engagement_rate 
-               FROM posts WHERE workspace = ?'''
-    df = pd.read_sql(query, conn, params=(workspace,))
-    conn.close()
+    df = _load_table("posts", workspace, min_version)
 
     if df.empty:
         return pd.DataFrame()
@@ -304,12 +734,10 @@ def load_posts_data(workspace):
         'engagement_rate': 'Engagement rate'
     }, inplace=True)
 
-    # Convert date strings to datetime objects
-    df['Created date'] = pd.to_datetime(df['Created date'])
-
     return df
 
 
+@timed
 def has_workspace_data(workspace):
     """Check if data exists for a given workspace"""
     conn = sqlite3.connect(DB_PATH)
@@ -331,70 +759,201 @@ def has_workspace_data(workspace):
     return followers_count > 0 or visitors_count > 0 or content_count > 0
 
 
-def add_manual_entry(table_name, data_dict, workspace):
+@timed
+def get_workspaces():
     """
-    Add a manual entry to a specific table in the database
+    Get every workspace that has data in the database
+
+    Returns:
+    list: Workspace names in alphabetical order
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        '''SELECT workspace FROM new_followers
+           UNION SELECT workspace FROM visitor_metrics
+           UNION SELECT workspace FROM content_metrics
+           UNION SELECT workspace FROM posts
+           ORDER BY workspace'''
+    )
+    workspaces = [row[0] for row in c.fetchall()]
+    conn.close()
+    return workspaces
+
+
+# Columns written by manual entries and the kind of value each one takes.
+# 'date' columns are stored as day numbers, 'count' as non-negative integers and 'rate' as 0-1 floats.
+MANUAL_ENTRY_COLUMNS = {
+    "new_followers": {"date": "date", "total_followers": "count"},
+    "visitor_metrics": {"date": "date", "total_unique_visitors": "count", "total_page_views": "count"},
+    "content_metrics": {
+        "date": "date", "unique_impressions": "count", "clicks_total": "count", "reactions_total": "count",
+        "reposts_total": "count", "engagement_rate": "rate"
+    },
+    "posts": {
+        "post_title": "title", "post_link": "text", "created_date": "date", "impressions": "count",
+        "clicks": "count", "click_through_rate": "rate", "likes": "count", "comments": "count",
+        "reposts": "count", "follows": "count", "engagement_rate": "rate"
+    }
+}
+
+
+def validate_manual_entries(table_name, df):
+    """
+    Check manual entries column by column
+
+    Parameters:
+    table_name (str): The name of the table the rows are for
+    df (DataFrame): One row per entry with the MANUAL_ENTRY_COLUMNS of the table
+
+    Returns:
+    tuple: (values, errors) where values is a DataFrame of the converted columns and errors
+           is a list of (row label, message) tuples in row order
+    """
+    columns = MANUAL_ENTRY_COLUMNS[table_name]
+    values = pd.DataFrame(index=df.index)
+    problems = []
+    for column, kind in columns.items():
+        raw = df[column] if column in df.columns else pd.Series(None, index=df.index, dtype=object)
+        missing = raw.isna() | raw.astype(str).str.strip().eq("")
+
+        if kind == "date":
+            dates = pd.to_datetime(raw, format="mixed", errors="coerce")
+            values[column] = dates.dt.strftime("%Y-%m-%d")
+            problems.append((missing, f"{column} is required"))
+            problems.append((~missing & dates.isna(), f"{column} is not a date"))
+        elif kind in ("count", "rate"):
+            numbers = pd.to_numeric(raw, errors="coerce")
+            values[column] = numbers
+            problems.append((missing, f"{column} is required"))
+            problems.append((~missing & numbers.isna(), f"{column} is not a number"))
+            if kind == "count":
+                problems.append((numbers.notna() & (numbers != numbers.round()), f"{column} must be a whole number"))
+                problems.append((numbers < 0, f"{column} cannot be negative"))
+            else:
+                problems.append(((numbers < 0) | (numbers > 1), f"{column} must be between 0 and 1"))
+        else:
+            values[column] = raw.where(~missing, "").astype(str).str.strip()
+            if kind == "title":
+                problems.append((missing, f"{column} is required"))
+
+    # Rows with the same key would silently replace each other within the batch
+    key_column = "post_title" if table_name == "posts" else "date"
+    duplicated = values[key_column].notna() & values[key_column].ne("") & values[key_column].duplicated(keep="first")
+    problems.append((duplicated, f"{key_column} appears more than once"))
+
+    errors = []
+    for position, label in enumerate(df.index):
+        errors += [(label, message) for mask, message in problems if mask.iloc[position]]
+    return values, errors
+
+
+@timed
+def add_manual_entries(table_name, df, workspace):
+    """
+    Add or replace many manual entries in one transaction
+
+    Rows are validated first and nothing is written unless every row is valid.
 
     Parameters:
     table_name (str): The name of the table to add data to
-    data_dict (dict): Dictionary containing the data to add
+    df (DataFrame): One row per entry with the MANUAL_ENTRY_COLUMNS of the table
     workspace (str): The workspace name
 
     Returns:
-    bool: True if successful, False otherwise
+    tuple: (saved, errors) where saved is the number of rows written and errors is a list of
+           (row label, message) tuples, with a None label for errors that concern the whole batch
     """
+    if table_name not in MANUAL_ENTRY_COLUMNS:
+        return 0, [(None, f"Unknown table {table_name}")]
+    if df.empty:
+        return 0, []
+
+    values, errors = validate_manual_entries(table_name, df)
+    if errors:
+        return 0, errors
+
+    columns = MANUAL_ENTRY_COLUMNS[table_name]
+    db_columns = [DAY_COLUMNS[table_name][1] if kind == "date" else column for column, kind in columns.items()]
+    converted = []
+    for column, kind in columns.items():
+        if kind == "date":
+            converted.append(day_numbers(values[column]))
+        elif kind == "count":
+            converted.append(_int_values(values[column]))
+        elif kind == "rate":
+            converted.append(_float_values(values[column]))
+        else:
+            converted.append(values[column].tolist())
+
     try:
         conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
-
-        # Handle different table types
-        if table_name == "new_followers":
-            c.execute(
-                'INSERT OR REPLACE INTO new_followers (workspace, date, total_followers) VALUES (?, ?, ?)',
-                (workspace, data_dict['date'], data_dict['total_followers'])
-            )
-        elif table_name == "visitor_metrics":
-            c.execute(
-                '''INSERT OR REPLACE INTO visitor_metrics 
-                   (workspace, date, total_unique_visitors, total_page_views) 
-                   VALUES (?, ?, ?, ?)''',
-                (workspace, data_dict['date'], data_dict['total_unique_visitors'],
-                 data_dict['total_page_views'])
-            )
-        elif table_name == "content_metrics":
-            c.execute(
-                '''INSERT OR REPLACE INTO content_metrics 
-                   (workspace, date, unique_impressions, clicks_total, reactions_total, 
-                    reposts_total, engagement_rate) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                (workspace, data_dict['date'], data_dict['unique_impressions'],
-                 data_dict['clicks_total'], data_dict['reactions_total'],
-                 data_dict['reposts_total'], data_dict['engagement_rate'])
-            )
-        elif table_name == "posts":
-            c.execute(
-                '''INSERT OR REPLACE INTO posts 
-                   (workspace, post_title, post_link, created_date, impressions, clicks, 
-                    click_through_rate, likes, comments, reposts, follows, engagement_rate) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (workspace, data_dict['post_title'], data_dict['post_link'],
-                 data_dict['created_date'], data_dict['impressions'], data_dict['clicks'],
-                 data_dict['click_through_rate'], data_dict['likes'], data_dict['comments'],
-                 data_dict['reposts'], data_dict['follows'], data_dict['engagement_rate'])
-            )
-        else:
-            conn.close()
-            return False
-
+        c.executemany(
+            f"INSERT OR REPLACE INTO {table_name} (workspace, {', '.join(db_columns)}) "
+            f"VALUES ({', '.join('?' * (len(db_columns) + 1))})",
+            zip([workspace] * len(values), *converted)
+        )
+        days = [day for day in converted[db_columns.index(DAY_COLUMNS[table_name][1])] if day is not None]
+        bump_data_version(c, table_name, workspace, min(days) if days else None)
         conn.commit()
         conn.close()
-        return True
     except Exception as e:
-        if conn:
+        if 'conn' in locals():
             conn.close()
-        return False
+        return 0, [(None, f"Database error: {e}")]
+
+    refresh_snapshot(table_name, workspace)
+    return len(values), []
+
+
+@timed
+def add_manual_entry(table_name, data_dict, workspace):
+    """
+    Add a manual entry to a specific table in the database
+
+    Parameters:
+    table_name (str): The name of the table to add data to
+    data_dict (dict): Dictionary containing the data to add
+    workspace (str): The workspace name
+
+    Returns:
+    bool: True if successful, False otherwise
+    """
+    saved, errors = add_manual_entries(table_name, pd.DataFrame([data_dict]), workspace)
+    return saved == 1
+
+
+@timed
+def get_recent_entries(table_name, workspace, limit=31):
+    """
+    Get the most recent entries of a table with the MANUAL_ENTRY_COLUMNS, for editing
+
+    Parameters:
+    table_name (str): The name of the table
+    workspace (str): The workspace name
+    limit (int): Maximum number of entries to return
+
+    Returns:
+    DataFrame: The entries, oldest first, with dates as datetime64
+    """
+    columns = MANUAL_ENTRY_COLUMNS[table_name]
+    day_column = DAY_COLUMNS[table_name][1]
+    select = ", ".join(f"{day_column} AS {column}" if kind == "date" else column for column, kind in columns.items())
+    conn = sqlite3.connect(DB_PATH)
+    df = pd.read_sql(
+        f"SELECT * FROM (SELECT {select}, {day_column} AS sort_day, rowid AS sort_rowid FROM {table_name} "
+        f"WHERE workspace = ? ORDER BY {day_column} DESC, rowid DESC LIMIT ?) ORDER BY sort_day, sort_rowid",
+        conn, params=(workspace, limit)
+    )
+    conn.close()
+    df = df.drop(columns=["sort_day", "sort_rowid"])
+    date_column = DAY_COLUMNS[table_name][0]
+    df[date_column] = pd.to_datetime(df[date_column], unit='D')
+    return df
 
 
+@timed
 def get_table_structure(table_name):
     """
     Get the structure of a table to guide manual entry form creation
@@ -413,6 +972,86 @@ def get_table_structure(table_name):
     return columns
 
 
+# Columns shown when browsing a table's entries, after the rowid
+ENTRY_COLUMNS = {
+    "new_followers": ["date", "total_followers"],
+    "visitor_metrics": ["date", "total_unique_visitors", "total_page_views"],
+    "content_metrics": ["date", "unique_impressions", "clicks_total", "reactions_total", "reposts_total",
+                        "engagement_rate"],
+    "posts": ["post_title", "created_date", "impressions", "clicks", "likes", "comments", "reposts", "follows"]
+}
+
+# Entries per page in the Remove Entry browser
+ENTRY_PAGE_SIZE = 50
+
+
+@timed
+def get_entries_page(table_name, workspace, before=None, limit=ENTRY_PAGE_SIZE):
+    """
+    Get one page of entries from a table for a workspace, newest first
+
+    Pages are addressed by a keyset cursor instead of an OFFSET, so every page
+    is a range scan of the (workspace, day) index that costs the same at any depth.
+
+    Parameters:
+    table_name (str): The name of the table
+    workspace (str): The workspace name
+    before (tuple): The (day, rowid) cursor returned with the previous page, None for the first page
+    limit (int): Maximum number of entries to return
+
+    Returns:
+    tuple: (entries, next_cursor) where entries are (rowid, *ENTRY_COLUMNS[table_name]) tuples with dates
+           as 'YYYY-MM-DD' text, and next_cursor is None on the last page
+    """
+    if table_name not in ENTRY_COLUMNS:
+        return [], None
+    day_column = DAY_COLUMNS[table_name][1]
+    date_column = DAY_COLUMNS[table_name][0]
+    columns = ", ".join(
+        f"date({day_column} * 86400, 'unixepoch')" if column == date_column else column
+        for column in ENTRY_COLUMNS[table_name]
+    )
+
+    select = f"SELECT rowid, {day_column}, {columns} FROM {table_name} WHERE workspace = ?"
+    # Dated rows come first, rows without a date (only possible for posts) follow them.
+    # Days are not unique in posts, the rowid breaks ties so no row is skipped or repeated.
+    segments = []
+    if before is None or before[0] is not None:
+        condition = f" AND {day_column} IS NOT NULL"
+        params = [workspace]
+        if before is not None:
+            condition += f" AND ({day_column}, rowid) < (?, ?)"
+            params += list(before)
+        segments.append((select + condition + f" ORDER BY {day_column} DESC, rowid DESC LIMIT ?", params))
+    condition = f" AND {day_column} IS NULL"
+    params = [workspace]
+    if before is not None and before[0] is None:
+        condition += " AND rowid < ?"
+        params.append(before[1])
+    segments.append((select + condition + " ORDER BY rowid DESC LIMIT ?", params))
+
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        rows = []
+        for query, params in segments:
+            # One extra row tells whether there is another page
+            c.execute(query, params + [limit + 1 - len(rows)])
+            rows += c.fetchall()
+            if len(rows) > limit:
+                break
+        conn.close()
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        return [], None
+
+    page = rows[:limit]
+    next_cursor = (page[-1][1], page[-1][0]) if len(rows) > limit else None
+    return [(row[0], *row[2:]) for row in page], next_cursor
+
+
+@timed
 def get_entries(table_name, workspace, limit=100):
     """
     Get entries from a specific table for a workspace
@@ -431,22 +1070,22 @@ def get_entries(table_name, workspace, limit=100):
 
         if table_name == "new_followers":
             c.execute(
-                "SELECT rowid, date, total_followers FROM new_followers WHERE workspace = ? ORDER BY date DESC LIMIT ?",
+                "SELECT rowid, date(day * 86400, 'unixepoch'), total_followers FROM new_followers WHERE workspace = ? ORDER BY day DESC LIMIT ?",
                 (workspace, limit)
             )
         elif table_name == "visitor_metrics":
             c.execute(
-                "SELECT rowid, date, total_unique_visitors, total_page_views FROM visitor_metrics WHERE workspace = ? ORDER BY date DESC LIMIT ?",
+                "SELECT rowid, date(day * 86400, 'unixepoch'), total_unique_visitors, total_page_views FROM visitor_metrics WHERE workspace = ? ORDER BY day DESC LIMIT ?",
                 (workspace, limit)
             )
         elif table_name == "content_metrics":
             c.execute(
-                "SELECT rowid, date, unique_impressions, clicks_total, reactions_total, reposts_total, engagement_rate FROM content_metrics WHERE workspace = ? ORDER BY date DESC LIMIT ?",
+                "SELECT rowid, date(day * 86400, 'unixepoch'), unique_impressions, clicks_total, reactions_total, reposts_total, engagement_rate FROM content_metrics WHERE workspace = ? ORDER BY day DESC LIMIT ?",
                 (workspace, limit)
             )
         elif table_name == "posts":
             c.execute(
-                "SELECT rowid, post_title, created_date FROM posts WHERE workspace = ? ORDER BY created_date DESC LIMIT ?",
+                "SELECT rowid, post_title, date(created_day * 86400, 'unixepoch') FROM posts WHERE workspace = ? ORDER BY created_day DESC LIMIT ?",
                 (workspace, limit)
             )
         else:
@@ -462,32 +1101,203 @@ def get_entries(table_name, workspace, limit=100):
         return []
 
 
-def delete_entry(table_name, entry_id):
+# Tables whose rows can be deleted, and undone, through Database Management
+DELETABLE_TABLES = ["new_followers", "visitor_metrics", "content_metrics", "posts"]
+
+# Number of most recent delete batches kept in the undo log
+UNDO_KEEP_BATCHES = 50
+
+
+def _table_columns(c, table_name):
+    return [column[1] for column in c.execute(f"PRAGMA table_info({table_name})").fetchall()]
+
+
+@timed
+def delete_entries(rowids=None, ranges=None, description=None):
     """
-    Delete a specific entry from a table
+    Delete many entries in one transaction, keeping the deleted rows in the undo log
+
+    Each DELETE captures its rows with RETURNING, so every table is scanned once
+    and the count comes from the rows actually removed.
 
     Parameters:
-    table_name (str): The name of the table
-    entry_id (int): The rowid of the entry to delete
+    rowids (dict): Mapping of table name to a list of rowids to delete
+    ranges (list): (table_name, workspace, start_date, end_date) tuples, dates in 'YYYY-MM-DD' format
+    description (str): Shown next to the batch in the undo list
 
     Returns:
-    bool: True if successful, False otherwise
+    tuple: (batch_id, deleted, error) where deleted maps table name to the number of rows removed,
+           batch_id is None when nothing was deleted and error is the database error message, None
+           when the delete went through or simply matched no rows
     """
+    statements = []
+    for table_name, ids in (rowids or {}).items():
+        if table_name in DELETABLE_TABLES and ids:
+            statements.append((table_name, "rowid IN (SELECT value FROM json_each(?))",
+                               (json.dumps([int(rowid) for rowid in ids]),)))
+    for table_name, workspace, start_date, end_date in ranges or []:
+        if table_name in DELETABLE_TABLES:
+            day_column = DAY_COLUMNS[table_name][1]
+            statements.append((table_name, f"workspace = ? AND {day_column} BETWEEN ? AND ?",
+                               (workspace, to_day(start_date), to_day(end_date))))
+    if not statements:
+        return None, {}, None
+
     try:
         conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
+        c.execute("BEGIN")
+
+        deleted = {}
+        logged = []
+        # (table_name, workspace) -> earliest day deleted
+        refresh = {}
+        for table_name, where, params in statements:
+            columns = _table_columns(c, table_name)
+            c.execute(f"DELETE FROM {table_name} WHERE {where} RETURNING {', '.join(columns)}", params)
+            rows = [dict(zip(columns, row)) for row in c.fetchall()]
+            deleted[table_name] = deleted.get(table_name, 0) + len(rows)
+            # Serialized here rather than with json_object, which rounds REAL values to 15 digits
+            logged += [(table_name, json.dumps(row)) for row in rows]
+            day_column = DAY_COLUMNS[table_name][1]
+            for row in rows:
+                key = (table_name, row["workspace"])
+                days = [day for day in (refresh.get(key), row[day_column]) if day is not None]
+                refresh[key] = min(days) if days else None
+
+        if not logged:
+            conn.rollback()
+            conn.close()
+            return None, deleted, None
+
+        # A batch belongs to a workspace when all of its rows do
+        workspaces = {workspace for _, workspace in refresh}
+        batch_workspace = workspaces.pop() if len(workspaces) == 1 else None
+        c.execute("INSERT INTO undo_batches (workspace, description, deleted_at, row_count) VALUES (?, ?, ?, ?)",
+                  (batch_workspace, description, datetime.now().isoformat(timespec="seconds"), len(logged)))
+        batch_id = c.lastrowid
+        c.executemany("INSERT INTO undo_log (batch_id, table_name, row_json) VALUES (?, ?, ?)",
+                      [(batch_id, table_name, row_json) for table_name, row_json in logged])
+
+        # Forget the oldest batches so the log does not grow without bound
+        c.execute("SELECT batch_id FROM undo_batches ORDER BY batch_id DESC LIMIT 1 OFFSET ?",
+                  (UNDO_KEEP_BATCHES - 1,))
+        oldest_kept = c.fetchone()
+        if oldest_kept:
+            c.execute("DELETE FROM undo_log WHERE batch_id < ?", oldest_kept)
+            c.execute("DELETE FROM undo_batches WHERE batch_id < ?", oldest_kept)
+
+        for (table_name, workspace), first_day in refresh.items():
+            bump_data_version(c, table_name, workspace, first_day)
+        conn.commit()
+        conn.close()
+        for table_name, workspace in refresh:
+            refresh_snapshot(table_name, workspace)
+        return batch_id, deleted, None
+    except Exception as e:
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        return None, {}, f"Database error: {e}"
 
-        c.execute(f"DELETE FROM {table_name} WHERE rowid = ?", (entry_id,))
 
+@timed
+def undo_delete(batch_id):
+    """
+    Restore the rows of a delete batch and remove it from the undo log
+
+    Rows whose key has been added again since the delete are left as they are.
+
+    Parameters:
+    batch_id (int): The batch returned by delete_entries
+
+    Returns:
+    int: Number of rows restored
+    """
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute("BEGIN")
+
+        c.execute("SELECT DISTINCT table_name FROM undo_log WHERE batch_id = ?", (batch_id,))
+        table_names = [row[0] for row in c.fetchall() if row[0] in DELETABLE_TABLES]
+
+        restored = 0
+        # (table_name, workspace) -> earliest day restored
+        refresh = {}
+        for table_name in table_names:
+            columns = _table_columns(c, table_name)
+            values = ", ".join(f"json_extract(row_json, '$.{column}')" for column in columns)
+            c.execute(
+                f"INSERT OR IGNORE INTO {table_name} ({', '.join(columns)}) "
+                f"SELECT {values} FROM undo_log WHERE batch_id = ? AND table_name = ?",
+                (batch_id, table_name)
+            )
+            restored += c.rowcount
+            c.execute(f"SELECT json_extract(row_json, '$.workspace'), "
+                      f"MIN(json_extract(row_json, '$.{DAY_COLUMNS[table_name][1]}')) FROM undo_log "
+                      f"WHERE batch_id = ? AND table_name = ? GROUP BY 1", (batch_id, table_name))
+            refresh.update(((table_name, workspace), first_day) for workspace, first_day in c.fetchall())
+
+        c.execute("DELETE FROM undo_log WHERE batch_id = ?", (batch_id,))
+        c.execute("DELETE FROM undo_batches WHERE batch_id = ?", (batch_id,))
+        for (table_name, workspace), first_day in refresh.items():
+            bump_data_version(c, table_name, workspace, first_day)
         conn.commit()
         conn.close()
-        return True
+        for table_name, workspace in refresh:
+            refresh_snapshot(table_name, workspace)
+        return restored
     except Exception as e:
         if 'conn' in locals():
+            conn.rollback()
             conn.close()
-        return False
+        return 0
+
 
+@timed
+def get_undo_batches(workspace=None, limit=10):
+    """
+    Get the most recent delete batches that can still be undone
+
+    Parameters:
+    workspace (str): Only batches whose rows all belong to this workspace, all batches when None
+    limit (int): Maximum number of batches to return
+
+    Returns:
+    list: (batch_id, description, deleted_at, row_count) tuples, newest first
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if workspace is None:
+        c.execute("SELECT batch_id, description, deleted_at, row_count FROM undo_batches "
+                  "ORDER BY batch_id DESC LIMIT ?", (limit,))
+    else:
+        c.execute("SELECT batch_id, description, deleted_at, row_count FROM undo_batches WHERE workspace = ? "
+                  "ORDER BY batch_id DESC LIMIT ?", (workspace, limit))
+    batches = c.fetchall()
+    conn.close()
+    return batches
+
+
+@timed
+def delete_entry(table_name, entry_id):
+    """
+    Delete a specific entry from a table
+
+    Parameters:
+    table_name (str): The name of the table
+    entry_id (int): The rowid of the entry to delete
 
+    Returns:
+    bool: True if successful, False otherwise
+    """
+    batch_id, deleted, error = delete_entries(rowids={table_name: [entry_id]},
+                                       description=f"{table_name} entry {entry_id}")
+    return deleted.get(table_name, 0) > 0
+
+
+@timed
 def delete_entries_by_date_range(table_name, workspace, start_date, end_date):
     """
     Delete entries in a date range from a table
@@ -501,26 +1311,241 @@ def delete_entries_by_date_range(table_name, workspace, start_date, end_date):
     Returns:
     int: Number of entries deleted
     """
+    batch_id, deleted, error = delete_entries(ranges=[(table_name, workspace, start_date, end_date)],
+                                       description=f"{table_name} {start_date} to {end_date} for {workspace}")
+    return deleted.get(table_name, 0)
+
+@timed
+def get_data_years(workspace):
+    """
+    Get the years that have follower or visitor data for a workspace
+
+    Parameters:
+    workspace (str): The workspace name
+
+    Returns:
+    list: Years as integers, most recent first
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        '''SELECT DISTINCT CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER) AS year
+           FROM new_followers WHERE workspace = ?
+           UNION
+           SELECT DISTINCT CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER)
+           FROM visitor_metrics WHERE workspace = ?
+           ORDER BY year DESC''',
+        (workspace, workspace)
+    )
+    years = [row[0] for row in c.fetchall()]
+    conn.close()
+    return years
+
+
+@timed
+def get_kpi_actuals(workspace, year, as_of=None):
+    """
+    Get the yearly and month-to-date totals for the database-backed KPIs
+
+    Both windows for every KPI come from a single aggregate query that only
+    touches the (workspace, day) primary key ranges of the source tables.
+
+    Parameters:
+    workspace (str): The workspace name
+    year (int): The year to aggregate
+    as_of (date): Last day included, defaults to today for the current year and Dec 31 otherwise
+
+    Returns:
+    dict: Mapping of KPI key ('new_followers', 'unique_visitors', 'page_views') to an (actual, mtd) tuple
+    """
+    year = int(year)
+    if as_of is None:
+        today = datetime.today().date()
+        as_of = today if today.year == year else datetime(year, 12, 31).date()
+
+    start_day = to_day(datetime(year, 1, 1))
+    end_day = to_day(as_of)
+    month_start_day = to_day(as_of.replace(day=1))
+
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        '''SELECT kpi, SUM(value), SUM(CASE WHEN day >= ? THEN value ELSE 0 END)
+           FROM (
+               SELECT 'new_followers' AS kpi, day, total_followers AS value
+               FROM new_followers WHERE workspace = ? AND day BETWEEN ? AND ?
+               UNION ALL
+               SELECT 'unique_visitors', day, total_unique_visitors
+               FROM visitor_metrics WHERE workspace = ? AND day BETWEEN ? AND ?
+               UNION ALL
+               SELECT 'page_views', day, total_page_views
+               FROM visitor_metrics WHERE workspace = ? AND day BETWEEN ? AND ?
+           )
+           GROUP BY kpi''',
+        (month_start_day,
+         workspace, start_day, end_day,
+         workspace, start_day, end_day,
+         workspace, start_day, end_day)
+    )
+    actuals = {kpi: (0, 0) for kpi in ("new_followers", "unique_visitors", "page_views")}
+    for kpi, actual, mtd in c.fetchall():
+        actuals[kpi] = (actual or 0, mtd or 0)
+    conn.close()
+    return actuals
+
+
+@timed
+def load_kpi_targets(workspace, year):
+    """
+    Load the projected KPI targets for a workspace and year
+
+    Parameters:
+    workspace (str): The workspace name
+    year (int): The projection year
+
+    Returns:
+    dict: Mapping of KPI row name to projected value, rows without a target are missing
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT kpi, projected FROM kpi_targets WHERE workspace = ? AND year = ?", (workspace, int(year)))
+    targets = dict(c.fetchall())
+    conn.close()
+    return targets
+
+
+@timed
+def save_kpi_targets(workspace, year, targets):
+    """
+    Save projected KPI targets for a workspace and year
+
+    Parameters:
+    workspace (str): The workspace name
+    year (int): The projection year
+    targets (dict): Mapping of KPI row name to projected value, None removes the row's target
+
+    Returns:
+    bool: True if successful, False otherwise
+    """
     try:
         conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
+        c.executemany(
+            'DELETE FROM kpi_targets WHERE workspace = ? AND year = ? AND kpi = ?',
+            [(workspace, int(year), kpi) for kpi, value in targets.items() if value is None]
+        )
+        c.executemany(
+            'INSERT OR REPLACE INTO kpi_targets (workspace, year, kpi, projected) VALUES (?, ?, ?, ?)',
+            [(workspace, int(year), kpi, safe_float(value)) for kpi, value in targets.items() if value is not None]
+        )
+        bump_data_version(c, "kpi_targets", workspace)
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        return False
 
-        if table_name == "posts":
-            date_column = "created_date"
-        else:
-            date_column = "date"
 
-        c.execute(f"SELECT COUNT(*) FROM {table_name} WHERE workspace = ? AND {date_column} BETWEEN ? AND ?",
-                  (workspace, start_date, end_date))
-        count = c.fetchone()[0]
+@timed
+def claim_file(content_hash, path, workspace):
+    """
+    Record a file as taken before it is ingested, so no file content is ever processed twice
+
+    The content hash is the primary key, so of several watchers or restarts
+    seeing the same bytes only the first claim succeeds. Files that failed
+    can be claimed again, so a fixed database or a new copy gets another try,
+    and so can claims older than CLAIM_TIMEOUT_MINUTES that were never
+    finished, whose watcher died while parsing or saving them.
 
-        c.execute(f"DELETE FROM {table_name} WHERE workspace = ? AND {date_column} BETWEEN ? AND ?",
-                  (workspace, start_date, end_date))
+    Parameters:
+    content_hash (str): SHA-256 of the file content
+    path (str): Where the file was found
+    workspace (str): The workspace it is saved to
 
+    Returns:
+    bool: True when the file was claimed, False when it was ingested or claimed before,
+          None when the claim could not be recorded
+    """
+    now = datetime.now()
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        # ingested_at is the claim time, finish_file leaves it alone
+        c.execute(
+            '''INSERT INTO ingested_files (content_hash, path, workspace, ingested_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT (content_hash) DO UPDATE SET path = excluded.path, workspace = excluded.workspace,
+                   kind = NULL, error = NULL, ingested_at = excluded.ingested_at
+               WHERE ingested_files.error IS NOT NULL
+                  OR (ingested_files.kind IS NULL AND ingested_files.ingested_at < ?)''',
+            (content_hash, path, workspace, now.isoformat(timespec="seconds"), _claim_cutoff(now))
+        )
+        claimed = c.rowcount == 1
         conn.commit()
         conn.close()
-        return count
-    except Exception as e:
+        return claimed
+    except sqlite3.Error:
         if 'conn' in locals():
             conn.close()
-        return 0
\ No newline at end of file
+        return None
+
+
+def _claim_cutoff(now=None):
+    """Claim time before which an unfinished claim is abandoned, in the format of ingested_at"""
+    return ((now or datetime.now()) - timedelta(minutes=CLAIM_TIMEOUT_MINUTES)).isoformat(timespec="seconds")
+
+
+@timed
+def finish_file(content_hash, kind, error=None):
+    """Record the export kind of a claimed file once it is saved, or why it could not be"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute("UPDATE ingested_files SET kind = ?, error = ? WHERE content_hash = ?", (kind, error, content_hash))
+        conn.commit()
+        conn.close()
+        return True
+    except sqlite3.Error:
+        if 'conn' in locals():
+            conn.close()
+        return False
+
+
+@timed
+def get_ingested_hashes():
+    """Get the content hashes of every file claimed so far, leaving out the files that failed or were abandoned"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute("SELECT content_hash FROM ingested_files WHERE error IS NULL AND (kind IS NOT NULL OR ingested_at >= ?)",
+                  (_claim_cutoff(),))
+        hashes = {row[0] for row in c.fetchall()}
+        conn.close()
+        return hashes
+    except sqlite3.Error:
+        if 'conn' in locals():
+            conn.close()
+        return set()
+
+
+@timed
+def vacuum_database():
+    """
+    Rewrite the database file to reclaim the space of deleted rows and refresh the query planner statistics
+
+    VACUUM needs exclusive access, so it waits for other connections and fails while a session is writing.
+
+    Returns:
+    tuple: File size in bytes before and after
+    """
+    size_before = os.path.getsize(DB_PATH)
+    conn = sqlite3.connect(DB_PATH)
+    # Files created before incremental vacuum was enabled switch over with the rewrite
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.execute("ANALYZE")
+    # In WAL mode the rewritten pages only reach the database file with a checkpoint
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return size_before, os.path.getsize(DB_PATH)
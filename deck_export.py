@@ -0,0 +1,152 @@
+import streamlit as st
+import datetime as dt
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import database as db
+from instrumentation import timed
+from beatrice_helpers import create_follower_chart, create_unique_visitors_chart, create_total_impressions_chart
+from beatrice_helpers import create_total_clicks_chart, create_reposts_chart
+from kpi_generator import build_kpi_table, new_presentation, add_kpi_slide, add_chart_slide, save_presentation
+
+EXPORT_PERIODS = ["LTD", "YTD", "QTD", "MTD"]
+
+# Chart slides added for every period: (title, chart builder, source table)
+DECK_CHARTS = [
+    ("New Followers", create_follower_chart, "followers"),
+    ("Unique Visitors", create_unique_visitors_chart, "visitors"),
+    ("Unique Impressions", create_total_impressions_chart, "content"),
+    ("Total Clicks", create_total_clicks_chart, "content"),
+    ("Reposts", create_reposts_chart, "content")
+]
+
+CHART_IMAGE_WIDTH = 1200
+CHART_IMAGE_HEIGHT = 560
+
+
+def render_workspace_slides(workspace, current_year, periods, db_path=None):
+    """
+    Gather everything needed to build the slides for one workspace
+
+    Parameters:
+    workspace (str): The workspace name
+    current_year (int): The year used for the KPI table
+    periods (list): Time horizons to add chart slides for
+    db_path (str): Database path, for worker processes that do not share the caller's settings
+
+    Returns:
+    dict: The KPI table rows and a list of (slide title, png bytes) chart images
+    """
+    if db_path:
+        db.DB_PATH = db_path
+
+    frames = {
+        "followers": db.load_followers_data(workspace),
+        "visitors": db.load_visitor_metrics(workspace),
+        "content": db.load_content_metrics(workspace)
+    }
+
+    charts = []
+    for period in periods:
+        for title, create_chart, source in DECK_CHARTS:
+            if frames[source].empty:
+                continue
+            fig = create_chart(frames[source], period=period)
+            image = fig.to_image(format="png", width=CHART_IMAGE_WIDTH, height=CHART_IMAGE_HEIGHT, scale=1.5)
+            charts.append((f"{workspace} - {title} {period}", image))
+
+    return {
+        "workspace": workspace,
+        "current_year": current_year,
+        "table_data": build_kpi_table(workspace, current_year, current_year + 1),
+        "charts": charts
+    }
+
+
+def add_workspace_slides(prs, slide_set):
+    current_year = slide_set["current_year"]
+    add_kpi_slide(prs, current_year, current_year + 1, slide_set["table_data"],
+                  title=f"{slide_set['workspace']} - {current_year} Performance and {current_year + 1} Projections")
+    for title, image in slide_set["charts"]:
+        add_chart_slide(prs, title, image)
+
+
+def build_workspace_deck(workspace, current_year, periods, db_path=None):
+    """Build a complete deck for one workspace and return it as bytes"""
+    prs = new_presentation()
+    add_workspace_slides(prs, render_workspace_slides(workspace, current_year, periods, db_path))
+    return workspace, save_presentation(prs).getvalue()
+
+
+@timed
+def export_decks(workspaces, current_year, periods, combined=False, max_workers=None):
+    """
+    Build decks for many workspaces in parallel worker processes
+
+    Parameters:
+    workspaces (list): Workspace names to export
+    current_year (int): The year used for the KPI tables
+    periods (list): Time horizons to add chart slides for
+    combined (bool): Return one multi-workspace deck instead of a zip with one deck per workspace
+    max_workers (int): Number of worker processes, defaults to one per CPU
+
+    Returns:
+    BytesIO: The .pptx deck when combined, otherwise a .zip of decks
+    """
+    if not workspaces:
+        raise ValueError("No workspaces selected for export")
+
+    max_workers = max_workers or min(len(workspaces), os.cpu_count() or 1)
+    count = len(workspaces)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        if combined:
+            # Workers render the data and chart images, the slides are assembled here in workspace order
+            slide_sets = executor.map(render_workspace_slides, workspaces, [current_year] * count,
+                                      [periods] * count, [db.DB_PATH] * count)
+            prs = new_presentation()
+            for slide_set in slide_sets:
+                add_workspace_slides(prs, slide_set)
+            return save_presentation(prs)
+
+        decks = executor.map(build_workspace_deck, workspaces, [current_year] * count,
+                             [periods] * count, [db.DB_PATH] * count)
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for workspace, deck in decks:
+                zf.writestr(f"{workspace.lower().replace(' ', '_')}_{current_year}.pptx", deck)
+        zip_buffer.seek(0)
+        return zip_buffer
+
+
+def display_batch_export():
+    """Display the controls for exporting decks for several workspaces at once"""
+    with st.expander("Batch Export"):
+        all_workspaces = db.get_workspaces()
+        workspaces = st.multiselect("Workspaces", all_workspaces, default=all_workspaces, key="batch_workspaces")
+        current_year = st.number_input("Performance Year", min_value=2000, max_value=2100,
+                                       value=dt.date.today().year, step=1, key="batch_year")
+        periods = st.multiselect("Chart Periods", EXPORT_PERIODS, default=["YTD", "QTD"], key="batch_periods")
+        output = st.radio("Output", ["Single Deck", "Zip of Decks"], horizontal=True, key="batch_output")
+
+        if st.button("Build Decks", key="batch_build"):
+            if not workspaces:
+                st.error("Select at least one workspace")
+                return
+            with st.spinner(f"Building decks for {len(workspaces)} workspaces..."):
+                export = export_decks(workspaces, int(current_year), periods, combined=output == "Single Deck")
+
+            if output == "Single Deck":
+                st.download_button(
+                    label="Download Deck",
+                    data=export,
+                    file_name=f"performance_projections_{current_year}.pptx",
+                    mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+                )
+            else:
+                st.download_button(
+                    label="Download Decks",
+                    data=export,
+                    file_name=f"performance_projections_{current_year}.zip",
+                    mime="application/zip"
+                )
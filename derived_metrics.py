@@ -0,0 +1,202 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import database as db
+import workspace_cache
+from workspace_cache import GAP_COLUMN, align_to_calendar
+from instrumentation import timed, record_cache_hit
+
+# Trailing windows in days for the rolling sums and averages
+ROLLING_WINDOWS = (7, 28, 90)
+
+# Growth rates compare a trailing window with the window right before it
+GROWTH_WINDOW = 28
+
+# Columns holding a daily rate, these are averaged but never summed. Every other column is a count,
+# also when it is read back as float because of a blank value.
+RATE_COLUMNS = ["Engagement rate (total)"]
+
+# Derived frames kept, each one tied to the data version it was computed from
+DERIVED_CACHE_ENTRIES = 16
+
+# Overlay names offered on the charts and the derived column suffix each one maps to
+OVERLAYS = {
+    "7-day average": "7d avg",
+    "28-day average": "28d avg",
+    "90-day average": "90d avg",
+    "Cumulative": "cumulative"
+}
+
+# (workspace, table_name, data version) -> derived frame, least recently used first
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _prefix_sum(values):
+    prefix = np.zeros(len(values) + 1)
+    np.cumsum(values, out=prefix[1:])
+    return prefix
+
+
+def rolling_sum(values, window):
+    """
+    Trailing sums over a fixed number of rows from one prefix sum
+
+    Parameters:
+    values (ndarray): Daily values on a regular calendar, gaps as 0
+    window (int): Rows per window
+
+    Returns:
+    ndarray: The sum ending at each row, NaN until the first full window
+    """
+    sums = np.full(len(values), np.nan)
+    if len(values) >= window:
+        prefix = _prefix_sum(values)
+        sums[window - 1:] = prefix[window:] - prefix[:-window]
+    return sums
+
+
+def rolling_mean(values, window, valid=None):
+    """
+    Trailing averages over the rows of each window that have data
+
+    Parameters:
+    values (ndarray): Daily values on a regular calendar
+    window (int): Rows per window
+    valid (ndarray): True for rows with data, all rows when None
+
+    Returns:
+    ndarray: The average ending at each row, NaN until the first full window or when a window has no data
+    """
+    if valid is None:
+        valid = np.ones(len(values), dtype=bool)
+    totals = rolling_sum(np.where(valid, values, 0.0), window)
+    counts = rolling_sum(valid.astype(np.float64), window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan)
+
+
+def cumulative(values):
+    """Running total of daily values"""
+    return np.cumsum(values, dtype=np.float64)
+
+
+def growth_rate(values, window=GROWTH_WINDOW):
+    """
+    Change of each trailing window sum against the window before it
+
+    Returns:
+    ndarray: 0.1 for 10% growth, NaN until two full windows or when the earlier window sums to 0
+    """
+    sums = rolling_sum(values, window)
+    growth = np.full(len(values), np.nan)
+    if len(values) > window:
+        earlier = sums[:-window]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            growth[window:] = np.where(earlier > 0, sums[window:] / earlier - 1, np.nan)
+    return growth
+
+
+@timed
+def derive_metrics(df):
+    """
+    Rolling, cumulative and growth series for every metric column of a daily frame
+
+    Count columns get '<column> <n>d sum', '<column> <n>d avg', '<column> cumulative'
+    and '<column> growth' columns, the RATE_COLUMNS only the rolling averages. Days
+    missing from the source count as 0 in sums and are left out of averages.
+
+    Parameters:
+    df (DataFrame): A daily metrics frame, aligned to the calendar if it is not already
+
+    Returns:
+    DataFrame: The derived float32 series on the frame's calendar index
+    """
+    df = align_to_calendar(df)
+    if df.empty:
+        return pd.DataFrame(index=df.index)
+
+    valid = ~df[GAP_COLUMN].to_numpy() if GAP_COLUMN in df.columns else np.ones(len(df), dtype=bool)
+    derived = {}
+    for column in df.columns:
+        if column == GAP_COLUMN:
+            continue
+        values = df[column].to_numpy(dtype=np.float64, na_value=0.0)
+        is_rate = column in RATE_COLUMNS
+        for window in ROLLING_WINDOWS:
+            if not is_rate:
+                derived[f"{column} {window}d sum"] = rolling_sum(values, window)
+            derived[f"{column} {window}d avg"] = rolling_mean(values, window, valid)
+        if not is_rate:
+            derived[f"{column} cumulative"] = cumulative(values)
+            derived[f"{column} growth"] = growth_rate(values)
+
+    return pd.DataFrame(derived, index=df.index).astype(np.float32)
+
+
+def get_derived_frame(workspace, table_name, version=None):
+    """
+    Derived series of a table for a workspace, computed once per data version
+
+    Parameters:
+    workspace (str): The workspace name
+    table_name (str): One of workspace_cache.CALENDAR_TABLES
+    version (int): The table's current data version, looked up when not given
+
+    Returns:
+    DataFrame: The cached derived frame, not to be modified in place
+    """
+    if version is None:
+        version = db.get_data_versions(workspace).get(table_name, 0)
+
+    key = (workspace, table_name, version)
+    with _lock:
+        derived = _cache.get(key)
+        if derived is not None:
+            _cache.move_to_end(key)
+    record_cache_hit(f"derived_metrics.{table_name}", derived is not None)
+    if derived is not None:
+        return derived
+
+    derived = derive_metrics(workspace_cache.get_frame(workspace, table_name, version))
+    with _lock:
+        # Results of older versions can never be hit again
+        for stale_key in [k for k in _cache if k[:2] == key[:2]]:
+            del _cache[stale_key]
+        _cache[key] = derived
+        while len(_cache) > DERIVED_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return derived
+
+
+def load_derived_workspace(workspace):
+    """
+    Get the derived frames of the three daily tables of a workspace through the cache
+
+    Returns:
+    tuple: The derived followers, visitor metrics and content metrics frames
+    """
+    versions = db.get_data_versions(workspace)
+    return tuple(get_derived_frame(workspace, table_name, versions.get(table_name, 0))
+                 for table_name in workspace_cache.CALENDAR_TABLES)
+
+
+def select_overlays(derived_df, column, overlays):
+    """
+    Pick the derived series of a column for the chosen overlays
+
+    Parameters:
+    derived_df (DataFrame): A frame from derive_metrics or get_derived_frame
+    column (str): The source column, e.g. 'Total followers'
+    overlays (list): Names from OVERLAYS
+
+    Returns:
+    DataFrame: One column per overlay that exists for the source column, named after the overlay
+    """
+    selected = {}
+    for overlay in overlays or []:
+        derived_column = f"{column} {OVERLAYS[overlay]}"
+        if derived_column in derived_df.columns:
+            selected[overlay] = derived_df[derived_column]
+    return pd.DataFrame(selected, index=derived_df.index)
@@ -0,0 +1,247 @@
+import csv
+import datetime as dt
+import io
+import sqlite3
+import tempfile
+import zipfile
+import streamlit as st
+from openpyxl import Workbook
+import database as db
+from instrumentation import timed
+
+# Rows fetched from SQLite per round trip, the most an export holds in memory at once
+EXPORT_CHUNK_ROWS = 5000
+# Exports are kept in memory up to this size and spill to a temporary file beyond it
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+# Rows per worksheet including the header, longer tables continue on another sheet
+EXCEL_MAX_ROWS = 1048576
+
+EXPORT_TABLES = {
+    "new_followers": {
+        "label": "New followers",
+        "header": ["Date", "Total followers"],
+        "date_column": 0,
+        "query": '''SELECT date(day * 86400, 'unixepoch'), total_followers
+                    FROM new_followers WHERE workspace = ? ORDER BY day'''
+    },
+    "visitor_metrics": {
+        "label": "Visitor metrics",
+        "header": ["Date", "Total unique visitors (total)", "Total page views (total)"],
+        "date_column": 0,
+        "query": '''SELECT date(day * 86400, 'unixepoch'), total_unique_visitors, total_page_views
+                    FROM visitor_metrics WHERE workspace = ? ORDER BY day'''
+    },
+    "content_metrics": {
+        "label": "Content metrics",
+        "header": ["Date", "Unique impressions (organic)", "Clicks (total)", "Reactions (total)",
+                   "Reposts (total)", "Engagement rate (total)"],
+        "date_column": 0,
+        "query": '''SELECT date(day * 86400, 'unixepoch'), unique_impressions, clicks_total, reactions_total,
+                           reposts_total, engagement_rate
+                    FROM content_metrics WHERE workspace = ? ORDER BY day'''
+    },
+    "posts": {
+        "label": "All posts",
+        "header": ["Post title", "Post link", "Created date", "Impressions", "Clicks", "Click through rate (CTR)",
+                   "Likes", "Comments", "Reposts", "Follows", "Engagement rate"],
+        "date_column": 2,
+        "query": '''SELECT post_title, post_link, date(created_day * 86400, 'unixepoch'), impressions, clicks,
+                           click_through_rate, likes, comments, reposts, follows, engagement_rate
+                    FROM posts WHERE workspace = ? ORDER BY created_day, post_title'''
+    }
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "zip": "application/zip"
+}
+
+
+def iter_chunks(table_name, workspace, chunk_size=EXPORT_CHUNK_ROWS):
+    """
+    Stream the rows of a table for a workspace from SQLite
+
+    Parameters:
+    table_name (str): One of the EXPORT_TABLES keys
+    workspace (str): The workspace name
+    chunk_size (int): Rows per fetchmany call
+
+    Yields:
+    list: Row tuples in export column order, dates as 'YYYY-MM-DD' text
+    """
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        cursor = conn.execute(EXPORT_TABLES[table_name]["query"], (workspace,))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def write_csv(table_name, workspace, target):
+    """
+    Write a table for a workspace as CSV
+
+    Parameters:
+    table_name (str): One of the EXPORT_TABLES keys
+    workspace (str): The workspace name
+    target (file): A binary file object, left open
+
+    Returns:
+    int: Number of rows written
+    """
+    # utf-8-sig so Excel opens post titles with non-ASCII characters correctly
+    text = io.TextIOWrapper(target, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_TABLES[table_name]["header"])
+    count = 0
+    for rows in iter_chunks(table_name, workspace):
+        writer.writerows(rows)
+        count += len(rows)
+    text.flush()
+    text.detach()
+    return count
+
+
+def _excel_rows(table_name, workspace):
+    """Rows of a table with the date column converted so Excel stores real dates"""
+    date_column = EXPORT_TABLES[table_name]["date_column"]
+    for rows in iter_chunks(table_name, workspace):
+        for row in rows:
+            row = list(row)
+            if row[date_column] is not None:
+                row[date_column] = dt.date.fromisoformat(row[date_column])
+            yield row
+
+
+def write_xlsx(table_names, workspace, target):
+    """
+    Write tables for a workspace as one workbook with a sheet per table
+
+    The workbook is written in openpyxl's write-only mode, which keeps every
+    sheet in a temporary file instead of building cells in memory.
+
+    Parameters:
+    table_names (list): EXPORT_TABLES keys, one sheet each
+    workspace (str): The workspace name
+    target (file): A binary file object, left open
+
+    Returns:
+    int: Number of rows written across all sheets
+    """
+    workbook = Workbook(write_only=True)
+    count = 0
+    for table_name in table_names:
+        label = EXPORT_TABLES[table_name]["label"]
+        header = EXPORT_TABLES[table_name]["header"]
+        sheet_number = 1
+        sheet = workbook.create_sheet(label)
+        sheet.append(header)
+        sheet_rows = 1
+        for row in _excel_rows(table_name, workspace):
+            if sheet_rows == EXCEL_MAX_ROWS:
+                sheet_number += 1
+                sheet = workbook.create_sheet(f"{label} ({sheet_number})")
+                sheet.append(header)
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+            count += 1
+    workbook.save(target)
+    return count
+
+
+def _spooled_file():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+b")
+
+
+@timed
+def export_table(table_name, workspace, file_format="csv"):
+    """
+    Export one table for a workspace
+
+    Parameters:
+    table_name (str): One of the EXPORT_TABLES keys
+    workspace (str): The workspace name
+    file_format (str): 'csv' or 'xlsx'
+
+    Returns:
+    SpooledTemporaryFile: The export, rewound to the start
+    """
+    export = _spooled_file()
+    if file_format == "csv":
+        write_csv(table_name, workspace, export)
+    else:
+        write_xlsx([table_name], workspace, export)
+    export.seek(0)
+    return export
+
+
+@timed
+def export_workspace(workspace, file_format="csv"):
+    """
+    Export every table for a workspace as one bundle
+
+    Parameters:
+    workspace (str): The workspace name
+    file_format (str): 'csv' for a zip with one CSV per table, 'xlsx' for one workbook
+
+    Returns:
+    SpooledTemporaryFile: The bundle, rewound to the start
+    """
+    export = _spooled_file()
+    if file_format == "csv":
+        with zipfile.ZipFile(export, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            for table_name in EXPORT_TABLES:
+                # Each CSV is compressed as it is written instead of being built first
+                with bundle.open(f"{table_name}.csv", "w", force_zip64=True) as entry:
+                    write_csv(table_name, workspace, entry)
+    else:
+        write_xlsx(list(EXPORT_TABLES), workspace, export)
+    export.seek(0)
+    return export
+
+
+def export_file_name(workspace, table_name=None, file_format="csv"):
+    """File name for an export, bundles of CSVs are zipped"""
+    workspace_key = "".join(ch if ch.isalnum() else "_" for ch in workspace.lower())
+    if table_name is None:
+        extension = "zip" if file_format == "csv" else file_format
+        return f"{workspace_key}_linkedin_data.{extension}"
+    return f"{workspace_key}_{table_name}.{file_format}"
+
+
+def display_data_export(workspace, key_prefix="export"):
+    """Display the controls for downloading a workspace's data as CSV or Excel"""
+    options = [None] + list(EXPORT_TABLES)
+    table_name = st.selectbox(
+        "Table", options,
+        format_func=lambda option: "All Tables" if option is None else EXPORT_TABLES[option]["label"],
+        key=f"{key_prefix}_table"
+    )
+    file_format = st.radio("Format", ["csv", "xlsx"], format_func=lambda option: option.upper(), horizontal=True,
+                           key=f"{key_prefix}_format")
+
+    if st.button("Prepare Export", key=f"{key_prefix}_prepare"):
+        with st.spinner("Exporting data..."):
+            if table_name is None:
+                export = export_workspace(workspace, file_format)
+            else:
+                export = export_table(table_name, workspace, file_format)
+
+            # download_button only takes bytes, so the finished file is read in once here
+            with export:
+                data = export.read()
+
+        file_name = export_file_name(workspace, table_name, file_format)
+        st.download_button(
+            label="Download Export",
+            data=data,
+            file_name=file_name,
+            mime=EXPORT_FORMATS[file_name.rsplit(".", 1)[1]],
+            key=f"{key_prefix}_download"
+        )
@@ -0,0 +1,226 @@
+import datetime as dt
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import database as db
+import workspace_cache
+from workspace_cache import GAP_COLUMN, align_to_calendar
+from instrumentation import timed, record_cache_hit
+
+# Daily series the KPI table projects, by the KPI keys of db.get_kpi_actuals
+FORECAST_KPIS = {
+    "new_followers": ("new_followers", "Total followers"),
+    "unique_visitors": ("visitor_metrics", "Total unique visitors (total)"),
+    "page_views": ("visitor_metrics", "Total page views (total)")
+}
+
+# Trailing calendar days a model is fitted on, long enough for a trend and short enough to follow changes in it
+FIT_DAYS = 365
+# Observed days needed before a series is forecast at all
+MIN_FIT_DAYS = 28
+# Days ahead shown on the charts
+CHART_HORIZON_DAYS = 90
+# Two-sided 95% normal quantile for the confidence bands
+BAND_Z = 1.96
+
+# Fitted models kept, each one tied to the data version it was fitted at
+FORECAST_CACHE_ENTRIES = 32
+
+# (workspace, table_name, column, data version) -> model, least recently used first
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def design_matrix(days, origin):
+    """
+    Regressors of the trend plus weekly seasonality model
+
+    Parameters:
+    days (ndarray): Day numbers, as stored in the database
+    origin (int): Day number the trend is measured from
+
+    Returns:
+    ndarray: An intercept, the trend in years and one indicator per weekday except Monday
+    """
+    days = np.asarray(days, dtype=np.int64)
+    # Day 0 (1970-01-01) was a Thursday, so this gives Monday = 0
+    weekdays = (days + 3) % 7
+    columns = [np.ones(len(days)), (days - origin) / 365.0]
+    columns += [(weekdays == weekday).astype(np.float64) for weekday in range(1, 7)]
+    return np.column_stack(columns)
+
+
+def fit_series(days, values):
+    """
+    Fit a linear trend with weekday offsets by least squares
+
+    Parameters:
+    days (ndarray): Day numbers of the observed days
+    values (ndarray): The values of those days
+
+    Returns:
+    dict: Coefficients, their unscaled covariance, the residual standard deviation,
+          the trend origin and the last observed day, or None when there are too few days
+    """
+    if len(days) < MIN_FIT_DAYS:
+        return None
+    origin = int(days[0])
+    X = design_matrix(days, origin)
+    coef, _, rank, _ = np.linalg.lstsq(X, values, rcond=None)
+    residuals = values - X @ coef
+    dof = max(len(days) - rank, 1)
+    return {
+        "coef": coef,
+        # pinv copes with weekdays that never occur in the fitted days
+        "cov": np.linalg.pinv(X.T @ X),
+        "sigma": float(np.sqrt(residuals @ residuals / dof)),
+        "origin": origin,
+        "last_day": int(days[-1]),
+        "observed_days": len(days)
+    }
+
+
+@timed
+def fit_frame(df, column):
+    """
+    Fit the model to the last FIT_DAYS of a column of a daily frame
+
+    Parameters:
+    df (DataFrame): A daily metrics frame, aligned to the calendar if it is not already
+    column (str): The column to model
+
+    Returns:
+    dict: The model from fit_series, or None when the column has too little data
+    """
+    df = align_to_calendar(df)
+    if df.empty or column not in df.columns:
+        return None
+    df = df.iloc[-FIT_DAYS:]
+    df = df[~df[GAP_COLUMN]]
+    days = df.index.values.astype("datetime64[D]").astype(np.int64)
+    return fit_series(days, df[column].to_numpy(dtype=np.float64, na_value=0.0))
+
+
+def forecast_frame(model, horizon=CHART_HORIZON_DAYS):
+    """
+    Daily forecasts after the last observed day with a prediction band
+
+    Returns:
+    DataFrame: 'Forecast', 'Lower' and 'Upper' columns indexed by date, empty without a model
+    """
+    if model is None:
+        return pd.DataFrame(columns=["Forecast", "Lower", "Upper"])
+    days = np.arange(model["last_day"] + 1, model["last_day"] + 1 + horizon)
+    X = design_matrix(days, model["origin"])
+    mean = X @ model["coef"]
+    # Noise of the day itself plus the uncertainty of the fitted coefficients
+    spread = model["sigma"] * np.sqrt(1 + np.einsum("ij,jk,ik->i", X, model["cov"], X))
+    index = pd.to_datetime(days, unit="D")
+    # Counts cannot go below zero
+    return pd.DataFrame({
+        "Forecast": np.maximum(mean, 0),
+        "Lower": np.maximum(mean - BAND_Z * spread, 0),
+        "Upper": np.maximum(mean + BAND_Z * spread, 0)
+    }, index=index)
+
+
+def forecast_total(model, start_day, end_day):
+    """
+    Forecast of the sum over a range of days with a confidence band
+
+    Parameters:
+    model (dict): A model from fit_series
+    start_day (int): First day number of the range
+    end_day (int): Last day number of the range, inclusive
+
+    Returns:
+    tuple: (total, lower, upper), all 0 for an empty range
+    """
+    if end_day < start_day:
+        return 0.0, 0.0, 0.0
+    days = np.arange(start_day, end_day + 1)
+    x = design_matrix(days, model["origin"]).sum(axis=0)
+    total = float(x @ model["coef"])
+    # Independent daily noise adds up per day, coefficient uncertainty through the summed regressors
+    spread = model["sigma"] * np.sqrt(len(days) + x @ model["cov"] @ x)
+    return max(total, 0.0), max(total - BAND_Z * spread, 0.0), max(total + BAND_Z * spread, 0.0)
+
+
+def get_model(workspace, table_name, column, version=None):
+    """
+    Fitted model of a stored series, refitted only when the table's data version changes
+
+    Parameters:
+    workspace (str): The workspace name
+    table_name (str): One of workspace_cache.CALENDAR_TABLES
+    column (str): The column to model
+    version (int): The table's current data version, looked up when not given
+
+    Returns:
+    dict: The cached model, or None when the series has too little data
+    """
+    if version is None:
+        version = db.get_data_versions(workspace).get(table_name, 0)
+
+    key = (workspace, table_name, column, version)
+    with _lock:
+        hit = key in _cache
+        model = _cache.get(key)
+        if hit:
+            _cache.move_to_end(key)
+    record_cache_hit(f"forecasting.{table_name}", hit)
+    if hit:
+        return model
+
+    model = fit_frame(workspace_cache.get_frame(workspace, table_name, version), column)
+    with _lock:
+        # Models of older versions can never be hit again
+        for stale_key in [k for k in _cache if k[:3] == key[:3]]:
+            del _cache[stale_key]
+        _cache[key] = model
+        while len(_cache) > FORECAST_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return model
+
+
+@timed
+def project_year(workspace, year, today=None):
+    """
+    Projected yearly totals of the database-backed KPIs
+
+    Days of the year up to the last stored day count with their actual values,
+    the remaining days with the forecast. Years that are over are their actual totals.
+
+    Parameters:
+    workspace (str): The workspace name
+    year (int): The year to project
+    today (date): Reference date, defaults to today
+
+    Returns:
+    dict: Mapping of KPI key to a (projected, lower, upper) tuple, KPIs without enough data are left out
+    """
+    year = int(year)
+    today = today or dt.date.today()
+    start_day = db.to_day(dt.date(year, 1, 1))
+    end_day = db.to_day(dt.date(year, 12, 31))
+
+    versions = db.get_data_versions(workspace)
+    projections = {}
+    for kpi, (table_name, column) in FORECAST_KPIS.items():
+        version = versions.get(table_name, 0)
+        df = workspace_cache.get_frame(workspace, table_name, version)
+        if df.empty:
+            continue
+        in_year = df[(df.index >= pd.Timestamp(year, 1, 1)) & (df.index <= pd.Timestamp(year, 12, 31))]
+        actual = float(in_year[column].sum()) if not in_year.empty else 0.0
+        if year < today.year:
+            projections[kpi] = (actual, actual, actual)
+            continue
+
+        model = get_model(workspace, table_name, column, version)
+        if model is None:
+            continue
+        total, lower, upper = forecast_total(model, max(start_day, model["last_day"] + 1), end_day)
+        projections[kpi] = (actual + total, actual + lower, actual + upper)
+    return projections
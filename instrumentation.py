@@ -0,0 +1,158 @@
+import contextvars
+import datetime as dt
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Local JSON-lines log with one entry per logged rerun, set to None to disable
+METRICS_LOG_PATH = './metrics_log.jsonl'
+# Size at which the log is moved to METRICS_LOG_PATH + '.1', replacing the previous one
+METRICS_LOG_MAX_BYTES = 10 * 2 ** 20
+
+# Records of the current rerun. Each Streamlit session runs its script in its own thread, so the
+# context variable keeps sessions apart
+_rerun = contextvars.ContextVar("instrumentation_rerun", default=None)
+_log_lock = threading.Lock()
+
+
+def start_rerun(page=None):
+    """Start collecting records for a new rerun, discarding the previous one"""
+    rerun = {"page": page, "started": time.perf_counter(), "records": []}
+    _rerun.set(rerun)
+    return rerun
+
+
+def record(name, seconds, rows=None, cache_hit=None):
+    """Add a timing record to the current rerun, does nothing outside of a rerun"""
+    rerun = _rerun.get()
+    if rerun is None:
+        return
+    # list.append is atomic, so records from worker threads need no lock
+    rerun["records"].append({"name": name, "seconds": seconds, "rows": rows, "cache_hit": cache_hit})
+
+
+def record_cache_hit(name, hit):
+    """Record whether a cache lookup was served from the cache"""
+    record(name, 0.0, cache_hit=hit)
+
+
+def _count_rows(args, result):
+    """Best-effort count of the rows a call touched"""
+    if hasattr(result, "shape") or isinstance(result, list):
+        return len(result)
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    if args and hasattr(args[0], "shape"):
+        return len(args[0])
+    return None
+
+
+@contextmanager
+def span(name, rows=None):
+    """
+    Time a block of code
+
+    The yielded dict can be updated with 'rows' or 'cache_hit' before the block ends.
+    """
+    info = {"rows": rows, "cache_hit": None}
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        record(name, time.perf_counter() - start, info["rows"], info["cache_hit"])
+
+
+def timed(fn=None, *, name=None, rows=None):
+    """
+    Decorator recording the wall time and rows touched of every call
+
+    Parameters:
+    name (str): Record name, defaults to module.function
+    rows (callable): Takes (args, kwargs, result) and returns the rows touched, overriding the default guess
+    """
+    def decorator(func):
+        record_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _rerun.get() is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            try:
+                touched = rows(args, kwargs, result) if rows else _count_rows(args, result)
+            except Exception:
+                touched = None
+            record(record_name, elapsed, touched)
+            return result
+
+        return wrapper
+
+    if fn is not None:
+        return decorator(fn)
+    return decorator
+
+
+def summarize(records):
+    """
+    Aggregate records by name
+
+    Returns:
+    list: One dict per name with calls, total and max seconds, rows and cache hits/misses, slowest first
+    """
+    summary = {}
+    for rec in records:
+        entry = summary.setdefault(rec["name"], {
+            "name": rec["name"], "calls": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+            "rows": 0, "cache_hits": 0, "cache_misses": 0
+        })
+        entry["calls"] += 1
+        entry["total_seconds"] += rec["seconds"]
+        entry["max_seconds"] = max(entry["max_seconds"], rec["seconds"])
+        entry["rows"] += rec["rows"] or 0
+        if rec["cache_hit"] is True:
+            entry["cache_hits"] += 1
+        elif rec["cache_hit"] is False:
+            entry["cache_misses"] += 1
+    return sorted(summary.values(), key=lambda entry: entry["total_seconds"], reverse=True)
+
+
+def _append_to_log(result):
+    try:
+        with _log_lock:
+            if os.path.exists(METRICS_LOG_PATH) and os.path.getsize(METRICS_LOG_PATH) >= METRICS_LOG_MAX_BYTES:
+                os.replace(METRICS_LOG_PATH, METRICS_LOG_PATH + ".1")
+            with open(METRICS_LOG_PATH, "a") as log:
+                log.write(json.dumps(result) + "\n")
+    except OSError:
+        pass
+
+
+def finish_rerun(log=False):
+    """
+    Close the current rerun and optionally append its summary to the metrics log
+
+    Parameters:
+    log (bool): Append the summary to METRICS_LOG_PATH, reruns are only logged while someone is looking at timings
+
+    Returns:
+    dict: The rerun's page, total seconds and summarized records, or None outside of a rerun
+    """
+    rerun = _rerun.get()
+    if rerun is None:
+        return None
+    _rerun.set(None)
+
+    result = {
+        "timestamp": dt.datetime.now().isoformat(timespec="milliseconds"),
+        "page": rerun["page"],
+        "total_seconds": time.perf_counter() - rerun["started"],
+        "records": summarize(rerun["records"])
+    }
+    if log and METRICS_LOG_PATH:
+        _append_to_log(result)
+    return result
@@ -2,8 +2,16 @@ import streamlit as st
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.dml.color import RGBColor
-from pptx.enum.text import PP_ALIGN, MSO_VERTICAL_ANCHOR
+from pptx.enum.text import PP_ALIGN
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from xml.sax.saxutils import escape
 import io
+import functools
+import datetime as dt
+import database as db
+import forecasting
+from instrumentation import timed
 
 
 def calculate_goal_progress(actual, projected):
@@ -17,21 +25,82 @@ def calculate_goal_progress(actual, projected):
         return "Invalid"
 
 
-def create_presentation(current_performance, projected_performance, table_data):
+@functools.lru_cache(maxsize=1)
+def slide_template():
+    """Serialized empty 16:9 presentation that every deck is built from"""
     prs = Presentation()
     prs.slide_width = Inches(13.33)  # Set slide width to 16:9 width
     prs.slide_height = Inches(7.5)  # Set slide height to 16:9 height
+    template_buffer = io.BytesIO()
+    prs.save(template_buffer)
+    return template_buffer.getvalue()
+
+
+def new_presentation():
+    return Presentation(io.BytesIO(slide_template()))
+
+
+def add_titled_slide(prs, title):
     slide_layout = prs.slide_layouts[5]
     slide = prs.slides.add_slide(slide_layout)
 
     title_shape = slide.shapes.title
-    title_shape.text = f"{current_performance} Performance and {projected_performance} Projections Data"
+    title_shape.text = title
     title_shape.text_frame.paragraphs[0].font.size = Pt(24)
     title_shape.text_frame.paragraphs[0].font.bold = True
     title_shape.text_frame.paragraphs[0].font.color.rgb = RGBColor(16, 4, 90)
     title_shape.text_frame.paragraphs[0].font.name = 'PT Serif'
     title_shape.text_frame.paragraphs[0].alignment = PP_ALIGN.LEFT
+    return slide
+
+
+def add_chart_slide(prs, title, image_bytes):
+    slide = add_titled_slide(prs, title)
+    slide.shapes.add_picture(io.BytesIO(image_bytes), Inches(0.67), Inches(1.5), width=Inches(12))
+    return slide
+
+
+def _table_cell_xml(bold, size, font_color, fill_color):
+    """Pre-built <a:tc> markup split around the cell text"""
+    bold_attr = ' b="1"' if bold else ''
+    prefix = (
+        '<a:tc><a:txBody><a:bodyPr anchor="ctr"/><a:lstStyle/><a:p><a:pPr algn="ctr"/><a:r>'
+        f'<a:rPr lang="en-US" sz="{size}"{bold_attr}><a:solidFill><a:srgbClr val="{font_color}"/></a:solidFill>'
+        '<a:latin typeface="Manrope"/></a:rPr><a:t>'
+    )
+    suffix = (
+        '</a:t></a:r></a:p></a:txBody>'
+        f'<a:tcPr anchor="ctr"><a:solidFill><a:srgbClr val="{fill_color}"/></a:solidFill></a:tcPr></a:tc>'
+    )
+    return prefix, suffix
 
+
+HEADER_CELL_XML = _table_cell_xml(True, 1400, "FFFFFF", "10045A")
+HEADER_ACCENT_CELL_XML = _table_cell_xml(True, 1400, "FFFFFF", "025139")
+EVEN_ROW_CELL_XML = _table_cell_xml(False, 1200, "000000", "FFFFFF")
+ODD_ROW_CELL_XML = _table_cell_xml(False, 1200, "000000", "D3D3D3")
+
+KPI_ROWS_PER_SLIDE = 12
+
+
+def _table_row_xml(row, row_idx, height):
+    cells = []
+    for col_idx, cell in enumerate(row):
+        if row_idx == 0:
+            prefix, suffix = HEADER_CELL_XML if col_idx < 3 else HEADER_ACCENT_CELL_XML
+        else:
+            prefix, suffix = EVEN_ROW_CELL_XML if row_idx % 2 == 0 else ODD_ROW_CELL_XML
+        cells.append(prefix + escape(str(cell)) + suffix)
+    return f'<a:tr h="{height}">{"".join(cells)}</a:tr>'
+
+
+def add_table(slide, table_data):
+    """
+    Add a styled KPI table to a slide
+
+    The header and zebra-row styling is written as pre-built cell XML and
+    parsed in one pass instead of being set cell by cell through python-pptx.
+    """
     rows, cols = len(table_data), len(table_data[0])
     left = Inches(1)
     top = Inches(1.5)
@@ -41,102 +110,171 @@ def create_presentation(current_performance, projected_performance, table_data):
     table.columns[0].width = Inches(2)
     table.columns[3].width = Inches(2)
 
-    for row_idx, row in enumerate(table_data):
-        for col_idx, cell in enumerate(row):
-            cell_obj = table.cell(row_idx, col_idx)
-            text_frame = cell_obj.text_frame
-
-            # Set vertical anchor
-            text_frame.vertical_anchor = MSO_VERTICAL_ANCHOR.MIDDLE
-
-            # Clear existing paragraphs and add a new one
-            text_frame.clear()
-            p = text_frame.add_paragraph()
-            p.text = str(cell)
-            p.alignment = PP_ALIGN.CENTER  # Horizontal alignment
-
-            # Apply font settings
-            font = p.font
-            font.name = "Manrope"
-
-            if row_idx == 0:
-                font.bold = True
-                font.size = Pt(14)
-                font.color.rgb = RGBColor(255, 255, 255)
-                cell_obj.fill.solid()
-                cell_obj.fill.fore_color.rgb = RGBColor(
-                    16 if col_idx < 3 else 2,
-                    4 if col_idx < 3 else 81,
-                    90 if col_idx < 3 else 57
-                )
-            else:
-                font.size = Pt(12)
-                font.color.rgb = RGBColor(0, 0, 0)
-                cell_obj.fill.solid()
-                cell_obj.fill.fore_color.rgb = (
-                    RGBColor(255, 255, 255) if row_idx % 2 == 0 else RGBColor(211, 211, 211)
-                )
+    tbl = table._tbl
+    row_height = tbl.tr_lst[0].get("h")
+    rows_xml = "".join(_table_row_xml(row, row_idx, row_height) for row_idx, row in enumerate(table_data))
+    new_rows = parse_xml(f'<a:tbl {nsdecls("a")}>{rows_xml}</a:tbl>')
+    for tr in tbl.tr_lst:
+        tbl.remove(tr)
+    tbl.extend(list(new_rows))
+    return table
+
+
+def add_kpi_slide(prs, current_performance, projected_performance, table_data, title=None,
+                  rows_per_slide=KPI_ROWS_PER_SLIDE):
+    """Add the KPI table, continuing on extra slides with a repeated header when it has too many rows"""
+    title = title or f"{current_performance} Performance and {projected_performance} Projections Data"
+    header, body = table_data[0], table_data[1:]
 
+    slides = []
+    for start in range(0, max(len(body), 1), rows_per_slide):
+        slide = add_titled_slide(prs, title if start == 0 else f"{title} (cont.)")
+        add_table(slide, [header] + body[start:start + rows_per_slide])
+        slides.append(slide)
+    return slides[0]
+
+
+def save_presentation(prs):
     pptx_buffer = io.BytesIO()
     prs.save(pptx_buffer)
     pptx_buffer.seek(0)
     return pptx_buffer
 
 
-def display_kpi_generator():
-    row_names = [
-        "LinkedIn Followers",
-        "Email Subscribers",
-        "Website Traffic (Sessions)",
-        "New Client Inquires (Website)",
-        "Website Qualified Leads ($5M Liquid/ $25M Net Worth)",
-        "Press Mentions"
-    ]
+@timed
+def create_presentation(current_performance, projected_performance, table_data):
+    prs = new_presentation()
+    add_kpi_slide(prs, current_performance, projected_performance, table_data)
+    return save_presentation(prs)
 
-    current_year = "2024"
-    projected_year = "2025"
 
-    actual_column_data = ["200", "200", "200", "200"]
-    MTD_column_data = ["10", "10", "10", "10"]
-    projected_column_data = ["100", "100", "100", "100", "100", "100"]
-    goal_progress_column = []
+KPI_ROWS = [
+    "LinkedIn Followers",
+    "LinkedIn Unique Visitors",
+    "LinkedIn Page Views",
+    "Email Subscribers",
+    "Website Traffic (Sessions)",
+    "New Client Inquires (Website)",
+    "Website Qualified Leads ($5M Liquid/ $25M Net Worth)",
+    "Press Mentions"
+]
 
-    for i, row_name in enumerate(row_names):
-        if i >= 4:
-            # Manual input rows
-            actual = st.text_input(f"Enter {row_name} - {current_year} Actual", "")
-            mtd = st.text_input(f"Enter {row_name} - {current_year} MTD", "")
+# KPI rows whose Actual and MTD columns are computed from the database
+DATABASE_KPIS = {
+    "LinkedIn Followers": "new_followers",
+    "LinkedIn Unique Visitors": "unique_visitors",
+    "LinkedIn Page Views": "page_views"
+}
 
-            actual_column_data.append(actual)
-            MTD_column_data.append(mtd)
 
-        # Calculate goal progress
-        if i < len(actual_column_data) and i < len(projected_column_data):
-            goal_progress = calculate_goal_progress(actual_column_data[i], projected_column_data[i])
-            goal_progress_column.append(goal_progress)
+def format_kpi_value(value):
+    if value is None or value == "":
+        return ""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return f"{value:,.0f}" if value.is_integer() else f"{value:,.2f}"
+
 
-    # Ensure all lists have the same length
-    while len(actual_column_data) < len(row_names):
-        actual_column_data.append("")
+@timed
+def build_kpi_table(workspace, current_year, projected_year, manual_values=None):
+    """
+    Build the KPI table rows for a workspace
 
-    while len(MTD_column_data) < len(row_names):
-        MTD_column_data.append("")
+    Parameters:
+    workspace (str): The workspace name
+    current_year (int): The year used for the Actual and MTD columns
+    projected_year (int): The year used for the Projected column, database-backed KPIs without a saved
+                          target are projected from their forecast
+    manual_values (dict): Mapping of KPI row name to an (actual, mtd) tuple for rows not stored in the database
 
-    while len(goal_progress_column) < len(row_names):
-        goal_progress_column.append("")
+    Returns:
+    list: Table rows, header first
+    """
+    manual_values = manual_values or {}
+    actuals = db.get_kpi_actuals(workspace, current_year)
+    targets = db.load_kpi_targets(workspace, projected_year)
+    projections = forecasting.project_year(workspace, projected_year)
 
-    # Build table data
     table_data = [
         ["KPI", f"{current_year} Actual", f"{current_year} MTD", f"{projected_year} Projected", "Goal Progress"]]
-    for i in range(len(row_names)):
-        row = [
-            row_names[i],
-            actual_column_data[i],
-            MTD_column_data[i],
-            projected_column_data[i],
-            goal_progress_column[i]
-        ]
-        table_data.append(row)
+    for row_name in KPI_ROWS:
+        if row_name in DATABASE_KPIS:
+            actual, mtd = actuals[DATABASE_KPIS[row_name]]
+        else:
+            actual, mtd = manual_values.get(row_name, ("", ""))
+        projected = targets.get(row_name, "")
+        if projected == "" and DATABASE_KPIS.get(row_name) in projections:
+            projected = round(projections[DATABASE_KPIS[row_name]][0])
+
+        goal_progress = calculate_goal_progress(actual, projected) if actual != "" and projected != "" else ""
+        table_data.append([
+            row_name,
+            format_kpi_value(actual),
+            format_kpi_value(mtd),
+            format_kpi_value(projected),
+            goal_progress
+        ])
+    return table_data
+
+
+def display_projections(projections, year):
+    """Display the forecast yearly totals of the database-backed KPIs with their 95% bands"""
+    rows = []
+    for row_name, kpi in DATABASE_KPIS.items():
+        if kpi in projections:
+            projected, lower, upper = projections[kpi]
+            rows.append({"KPI": row_name, f"{year} Forecast": format_kpi_value(round(projected)),
+                         "Low": format_kpi_value(round(lower)), "High": format_kpi_value(round(upper))})
+    if not rows:
+        st.caption("Not enough data to forecast the LinkedIn KPIs yet")
+        return
+    st.caption(f"Forecast from the trend and weekly pattern of the last {forecasting.FIT_DAYS} days, with 95% bands")
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+
+
+def display_kpi_generator(workspace):
+    workspace_key = workspace.lower().replace(' ', '_')
+    today = dt.date.today()
+
+    year_options = sorted(set(db.get_data_years(workspace)) | {today.year}, reverse=True)
+    current_year = st.selectbox("Performance Year", year_options, key=f"{workspace_key}_kpi_year")
+    projected_year = current_year + 1
+
+    manual_values = {}
+    for row_name in KPI_ROWS:
+        if row_name not in DATABASE_KPIS:
+            # Manual input rows
+            actual = st.text_input(f"Enter {row_name} - {current_year} Actual", "")
+            mtd = st.text_input(f"Enter {row_name} - {current_year} MTD", "")
+            manual_values[row_name] = (actual, mtd)
+
+    with st.expander(f"{projected_year} Projected Targets"):
+        targets = db.load_kpi_targets(workspace, projected_year)
+        projections = forecasting.project_year(workspace, projected_year)
+        display_projections(projections, projected_year)
+        with st.form(key=f"{workspace_key}_kpi_targets_form"):
+            new_targets = {}
+            for row_name in KPI_ROWS:
+                # Rows without a target stay empty, so saving the form never turns a forecast into a target
+                forecast = projections.get(DATABASE_KPIS.get(row_name))
+                forecast_text = f"Forecast {format_kpi_value(round(forecast[0]))}" if forecast else None
+                new_targets[row_name] = st.number_input(
+                    f"{row_name} - {projected_year} Projected",
+                    min_value=0.0,
+                    value=targets.get(row_name),
+                    placeholder=forecast_text or "No target",
+                    help=f"{forecast_text}, used in the table while no target is set" if forecast_text else None,
+                    key=f"{workspace_key}_kpi_target_{row_name}"
+                )
+            if st.form_submit_button(label="Save Targets"):
+                if db.save_kpi_targets(workspace, projected_year, new_targets):
+                    st.success(f"Saved {projected_year} targets")
+                else:
+                    st.error("Failed to save targets to database")
+
+    table_data = build_kpi_table(workspace, current_year, projected_year, manual_values)
 
     # Generate PowerPoint and provide immediate download
     pptx_buffer = create_presentation(current_year, projected_year, table_data)
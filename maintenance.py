@@ -0,0 +1,332 @@
+"""
+Routine upkeep of the SQLite database
+
+INSERT OR REPLACE and deletes leave free pages behind and scatter the pages
+of a table across the file, so without upkeep the file only grows and scans
+read more pages than they need. run_maintenance checkpoints the write-ahead
+log, hands free pages back with an incremental vacuum, refreshes the query
+planner statistics, checks the file for corruption and takes an online
+backup. The app starts it in the background once every
+MAINTENANCE_INTERVAL_HOURS, cron can run `python -m analytics_hub maintain`.
+Files created before incremental auto_vacuum was turned on need one full
+VACUUM to switch over, which blocks every writer while it rewrites the file,
+so only the command line and the button in the app run it.
+"""
+import datetime as dt
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import database as db
+from instrumentation import timed
+
+BACKUP_DIR = './backups'
+# Backups kept, older ones are removed after each new backup
+BACKUP_KEEP = 7
+# Pages copied per backup step, writers only wait for one step instead of the whole copy
+BACKUP_PAGES_PER_STEP = 1024
+
+# Hours between the runs the app starts on its own
+MAINTENANCE_INTERVAL_HOURS = 24
+
+# Pages of each table and index, their unused bytes and how many of them do not follow the previous page
+# in the file, from the dbstat virtual table. Pages are visited in b-tree order by their path.
+TABLE_STATS_QUERY = '''
+WITH pages AS (
+    SELECT name, pageno, pgsize, unused,
+           LAG(pageno) OVER (PARTITION BY name ORDER BY path) AS previous_pageno
+    FROM dbstat
+)
+SELECT name, COUNT(*) AS pages, SUM(pgsize) AS bytes, SUM(unused) AS unused_bytes,
+       SUM(previous_pageno IS NOT NULL AND pageno != previous_pageno + 1) AS out_of_order
+FROM pages
+GROUP BY name
+ORDER BY bytes DESC
+'''
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+_lock = threading.Lock()
+# Start time of the last run seen by this process, so reruns do not query the run log
+_last_run = None
+_running = False
+
+
+def _pragma(c, name):
+    return c.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _pragma_value(name):
+    conn = sqlite3.connect(db.DB_PATH)
+    value = _pragma(conn.cursor(), name)
+    conn.close()
+    return value
+
+
+@timed
+def database_stats():
+    """
+    Page-level statistics of the database file
+
+    Returns:
+    dict: File and write-ahead log sizes, page size and count, free pages and their share of the file,
+          the auto_vacuum and journal modes, and a 'tables' list with the pages, bytes, unused bytes,
+          fill and fragmentation (share of pages that do not follow the previous one) per table and index
+    """
+    conn = sqlite3.connect(db.DB_PATH)
+    c = conn.cursor()
+    page_count = _pragma(c, "page_count")
+    free_pages = _pragma(c, "freelist_count")
+    stats = {
+        "file_bytes": os.path.getsize(db.DB_PATH),
+        "wal_bytes": os.path.getsize(db.DB_PATH + "-wal") if os.path.exists(db.DB_PATH + "-wal") else 0,
+        "page_size": _pragma(c, "page_size"),
+        "page_count": page_count,
+        "free_pages": free_pages,
+        "free_ratio": free_pages / page_count if page_count else 0.0,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(_pragma(c, "auto_vacuum"), "unknown"),
+        "journal_mode": _pragma(c, "journal_mode")
+    }
+    tables = []
+    try:
+        for name, pages, size, unused, out_of_order in c.execute(TABLE_STATS_QUERY).fetchall():
+            tables.append({
+                "name": name,
+                "pages": pages,
+                "bytes": size,
+                "unused_bytes": unused,
+                "fill": 1 - unused / size if size else 0.0,
+                "fragmentation": out_of_order / (pages - 1) if pages > 1 else 0.0
+            })
+    except sqlite3.OperationalError:
+        # SQLite built without the dbstat virtual table
+        pass
+    conn.close()
+    stats["tables"] = tables
+    return stats
+
+
+@timed
+def checkpoint(mode="TRUNCATE"):
+    """
+    Copy the write-ahead log into the database file
+
+    Parameters:
+    mode (str): PASSIVE, FULL, RESTART or TRUNCATE, TRUNCATE also empties the log file
+
+    Returns:
+    tuple: (busy, log pages, pages checkpointed), busy is 1 when readers or a writer kept it from finishing
+    """
+    conn = sqlite3.connect(db.DB_PATH)
+    result = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    conn.close()
+    return tuple(result)
+
+
+@timed
+def incremental_vacuum(pages=None):
+    """
+    Return free pages to the file system without rewriting the database
+
+    Only works once auto_vacuum is incremental, files created before that
+    switch over with one full db.vacuum_database().
+
+    Parameters:
+    pages (int): Most pages to free, all of them when None
+
+    Returns:
+    int: Number of pages freed
+    """
+    conn = sqlite3.connect(db.DB_PATH)
+    c = conn.cursor()
+    before = _pragma(c, "freelist_count")
+    if _pragma(c, "auto_vacuum") == 2:
+        # Each step of the statement frees one page, execute() would only take the first step
+        limit = "" if pages is None else f"({int(pages)})"
+        conn.executescript(f"PRAGMA incremental_vacuum{limit};")
+    freed = before - _pragma(c, "freelist_count")
+    conn.close()
+    return freed
+
+
+@timed
+def optimize():
+    """Refresh the query planner statistics of the tables whose contents changed enough to matter"""
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+
+@timed
+def integrity_check(full=False):
+    """
+    Look for corruption in the database file
+
+    Parameters:
+    full (bool): Also check that indexes match their tables, which reads every index, instead of the quick check
+
+    Returns:
+    list: Problems found, empty when the file is fine
+    """
+    conn = sqlite3.connect(db.DB_PATH)
+    rows = conn.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check").fetchall()
+    conn.close()
+    problems = [row[0] for row in rows]
+    return [] if problems == ["ok"] else problems
+
+
+@timed
+def backup_database(directory=BACKUP_DIR, keep=BACKUP_KEEP):
+    """
+    Copy the database with the SQLite backup API while the app keeps running
+
+    Parameters:
+    directory (str): Where backups are written, created when missing
+    keep (int): Number of backups kept, the oldest are removed
+
+    Returns:
+    str: Path of the new backup
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(db.DB_PATH))[0]
+    path = os.path.join(directory, f"{name}_{dt.datetime.now():%Y%m%d_%H%M%S}.db")
+
+    source = sqlite3.connect(db.DB_PATH)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target, pages=BACKUP_PAGES_PER_STEP)
+    finally:
+        target.close()
+        source.close()
+
+    # Timestamped names sort by age
+    for old_backup in sorted(glob.glob(os.path.join(directory, f"{name}_*.db")))[:-keep]:
+        os.remove(old_backup)
+    return path
+
+
+def last_run():
+    """
+    Get the most recent maintenance run
+
+    Returns:
+    tuple: (started_at, seconds, report dict), None when maintenance never ran
+    """
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        c = conn.cursor()
+        c.execute("SELECT started_at, seconds, report FROM maintenance_runs ORDER BY run_id DESC LIMIT 1")
+        row = c.fetchone()
+        conn.close()
+    except sqlite3.Error:
+        if 'conn' in locals():
+            conn.close()
+        return None
+    return (row[0], row[1], json.loads(row[2])) if row else None
+
+
+@timed
+def run_maintenance(backup=True, full_check=False, backup_dir=BACKUP_DIR, convert=False):
+    """
+    Run every maintenance task and log the run
+
+    A failing task is noted in the report and does not stop the others.
+
+    Parameters:
+    backup (bool): Take a backup at the end
+    full_check (bool): Run the full integrity check instead of the quick one
+    backup_dir (str): Where the backup is written
+    convert (bool): Switch a file without incremental auto_vacuum over with one full VACUUM,
+                    otherwise its free pages are left for a later run with convert
+
+    Returns:
+    dict: What each task did, plus 'errors' with the tasks that failed
+    """
+    global _last_run
+    started_at = dt.datetime.now().isoformat(timespec="seconds")
+    start = time.perf_counter()
+    report = {"errors": {}}
+
+    def run(task, function, *args):
+        try:
+            report[task] = function(*args)
+        except (sqlite3.Error, OSError) as e:
+            report["errors"][task] = str(e)
+
+    run("free_pages_before", _pragma_value, "freelist_count")
+    run("checkpoint", checkpoint)
+    run("auto_vacuum", _pragma_value, "auto_vacuum")
+    if report.get("auto_vacuum") == 2:
+        run("incremental_vacuum", incremental_vacuum)
+    elif convert and "auto_vacuum" in report:
+        run("vacuum", db.vacuum_database)
+    run("optimize", optimize)
+    run("integrity_problems", integrity_check, full_check)
+    if backup:
+        run("backup", backup_database, backup_dir)
+    run("free_pages_after", _pragma_value, "freelist_count")
+    seconds = time.perf_counter() - start
+
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.execute("INSERT INTO maintenance_runs (started_at, seconds, report) VALUES (?, ?, ?)",
+                     (started_at, seconds, json.dumps(report)))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        if 'conn' in locals():
+            conn.close()
+        report["errors"]["log"] = str(e)
+    with _lock:
+        _last_run = started_at
+    return report
+
+
+def maintenance_due(now=None):
+    """Whether the last run started more than MAINTENANCE_INTERVAL_HOURS ago, or there was none"""
+    global _last_run
+    with _lock:
+        started_at = _last_run
+    if started_at is None:
+        run_info = last_run()
+        if run_info is None:
+            return True
+        started_at = run_info[0]
+        with _lock:
+            _last_run = started_at
+    now = now or dt.datetime.now()
+    return now - dt.datetime.fromisoformat(started_at) >= dt.timedelta(hours=MAINTENANCE_INTERVAL_HOURS)
+
+
+def start_scheduled_maintenance():
+    """
+    Start a maintenance run in a background thread when one is due
+
+    Cheap enough to call on every rerun, the run log is read once per process.
+
+    Returns:
+    bool: True when a run was started
+    """
+    global _running
+    with _lock:
+        if _running:
+            return False
+    if not db.db_exists() or not maintenance_due():
+        return False
+    with _lock:
+        if _running:
+            return False
+        _running = True
+
+    def run():
+        global _running
+        try:
+            run_maintenance()
+        finally:
+            with _lock:
+                _running = False
+
+    threading.Thread(target=run, name="maintenance", daemon=True).start()
+    return True
@@ -0,0 +1,106 @@
+import glob
+import hashlib
+import os
+import threading
+import time
+import pyarrow as pa
+import pyarrow.ipc
+
+
+def snapshot_dir(db_path):
+    """Snapshots live next to the database file they were taken from"""
+    return os.path.splitext(db_path)[0] + "_snapshots"
+
+
+def _snapshot_prefix(db_path, table_name, workspace):
+    # The readable part alone would map "Beatrice Advisors" and "beatrice_advisors" to the same
+    # files, the hash of the exact name keeps every workspace apart
+    readable = "".join(ch if ch.isalnum() else "_" for ch in workspace.lower())
+    digest = hashlib.sha1(workspace.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(snapshot_dir(db_path), f"{table_name}__{readable}_{digest}")
+
+
+def _snapshot_files(prefix):
+    # File names end in the data version and a nanosecond timestamp, both of equal width,
+    # so they sort by version and then by age
+    return sorted(glob.glob(f"{glob.escape(prefix)}.*.*.arrow"))
+
+
+def snapshot_version(path):
+    """Data version of the table the snapshot at path was read at"""
+    return int(os.path.basename(path).split(".")[-3])
+
+
+def latest_snapshot(db_path, table_name, workspace):
+    """Path of the snapshot with the highest data version for a table and workspace, or None"""
+    files = _snapshot_files(_snapshot_prefix(db_path, table_name, workspace))
+    return files[-1] if files else None
+
+
+def write_snapshot(db_path, table_name, workspace, df, version):
+    """
+    Write a DataFrame as an Arrow IPC snapshot
+
+    Every refresh goes to a new file, so readers that still have an older
+    snapshot memory-mapped are never affected. Files are named by the data
+    version the rows were read at, so a refresh that read the table before a
+    concurrent write never replaces the snapshot of that write. Older files
+    are removed when the operating system allows it.
+
+    Parameters:
+    db_path (str): The database the data was read from
+    table_name (str): The source table
+    workspace (str): The workspace name
+    df (DataFrame): The rows to snapshot, with dates already converted to datetime64
+    version (int): The table's data version for the workspace when the rows were read
+
+    Returns:
+    str: Path of the new snapshot
+    """
+    prefix = _snapshot_prefix(db_path, table_name, workspace)
+    os.makedirs(os.path.dirname(prefix), exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    path = f"{prefix}.{version:020d}.{time.time_ns():020d}.arrow"
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    for old_path in _snapshot_files(prefix)[:-1]:
+        try:
+            os.remove(old_path)
+        except OSError:
+            # Still mapped by a reader on Windows, a later refresh will remove it
+            pass
+    return path
+
+
+def read_snapshot(db_path, table_name, workspace, min_version=0):
+    """
+    Memory-map the newest snapshot into a DataFrame
+
+    Numeric and datetime columns reference the mapped file instead of being
+    copied, so the DataFrame is built without parsing any rows.
+
+    Parameters:
+    db_path (str): The database the snapshot was taken from
+    table_name (str): The source table
+    workspace (str): The workspace name
+    min_version (int): Oldest data version accepted, older snapshots count as missing
+
+    Returns:
+    DataFrame: The snapshot rows, or None when there is no snapshot of at least min_version
+    """
+    path = latest_snapshot(db_path, table_name, workspace)
+    if path is None or snapshot_version(path) < min_version:
+        return None
+    try:
+        source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        # Removed by a concurrent refresh or only partly written
+        return None
+    return table.to_pandas(split_blocks=True)
+
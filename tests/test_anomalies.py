@@ -0,0 +1,54 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+import anomalies
+import analytics_hub
+import database as db
+import workspace_cache
+
+WORKSPACE = "Test Workspace"
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """A database with daily rows and spikes but no data_versions rows, like one created before versions existed"""
+    path = str(tmp_path / "legacy.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    workspace_cache.invalidate()
+    anomalies._checked_versions.clear()
+    db.init_db()
+
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2024-01-01", periods=120, freq="D")
+    followers = rng.integers(5, 15, len(days))
+    followers[[60, 90]] = 200
+    db.save_followers_data(pd.DataFrame({"Total followers": followers}, index=days), WORKSPACE)
+
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM data_versions")
+    conn.execute("DELETE FROM data_changes")
+    conn.commit()
+    conn.close()
+    workspace_cache.invalidate()
+    yield path
+    workspace_cache.invalidate()
+    anomalies._checked_versions.clear()
+
+
+def _flag_count(path):
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM anomaly_flags WHERE workspace = ?", (WORKSPACE,)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_rebuild_scores_tables_without_data_versions(legacy_db):
+    assert analytics_hub.main(["--db", legacy_db, "--nice", "0", "rebuild"]) == 0
+    assert _flag_count(legacy_db) >= 2
+
+
+def test_update_scores_tables_without_watermark(legacy_db):
+    assert anomalies.update_anomalies(WORKSPACE) >= 2
+    # The watermark now matches the version, so nothing is scored again
+    assert anomalies.update_anomalies(WORKSPACE) == 0
@@ -0,0 +1,242 @@
+"""
+Watch a shared folder for LinkedIn exports and ingest them as they arrive
+
+The folder is polled, so it works the same on local disks and network
+shares. A file is read once its size and modification time stop changing,
+identified by the SHA-256 of its content and claimed in the ingested_files
+table before anything is saved, so the same export is never processed twice,
+whether it is copied again, renamed or seen by a restarted watcher. Files
+that fail are tried again when a new copy arrives or the watcher restarts,
+files whose claim could not be recorded on the next scan, and files left
+half done by a watcher that died once their claim is older than
+db.CLAIM_TIMEOUT_MINUTES. Files are classified by their sheets like the
+upload page does and handed to a single writer thread, which saves them in
+batches and updates the rollups of each workspace once per batch.
+
+Files go to the workspace named by their first directory below the watched
+folder, e.g. shared/Beatrice Advisors/followers.xlsx, unless one workspace is
+given for all of them.
+
+Usage (from the repository root):
+    python -m analytics_hub watch shared/
+    python -m analytics_hub watch downloads/ --workspace "Christina Lewis" --once
+"""
+import hashlib
+import os
+import queue
+import sys
+import threading
+import time
+import database as db
+from analytics_hub import EXPORT_KINDS, find_exports, parse_export, rebuild_rollups
+
+# Seconds between scans of the folder
+POLL_SECONDS = 5
+# Seconds a file's size and modification time must stay the same before it is read, so copies in progress are not
+DEBOUNCE_SECONDS = 10
+# Files saved together by the writer, rollups are updated once per batch
+BATCH_SIZE = 20
+# Seconds the writer waits for more files before it saves what it has
+BATCH_WAIT_SECONDS = 2
+
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def file_hash(path):
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def folder_workspace(root, path, workspace=None):
+    """
+    Map a file to its workspace
+
+    Parameters:
+    root (str): The watched folder
+    path (str): A file below it
+    workspace (str): Workspace of every file, overrides the directory name
+
+    Returns:
+    str: The workspace, None for files directly in the watched folder when no workspace is given
+    """
+    if workspace:
+        return workspace
+    parts = os.path.relpath(path, root).split(os.sep)
+    return parts[0] if len(parts) > 1 else None
+
+
+def scan_folder(root, files, state, known_hashes, workspace=None, debounce=DEBOUNCE_SECONDS, now=None,
+                released=None):
+    """
+    Queue the files of the folder that are complete and have not been seen before
+
+    Parameters:
+    root (str): The watched folder
+    files (Queue): Receives (path, content hash, workspace) tuples for the writer
+    state (dict): path -> (size, mtime, stable since, handled), kept between scans
+    known_hashes (set): Hashes claimed or queued so far, updated in place
+    workspace (str): Workspace of every file, by default the directory name
+    debounce (float): Seconds a file must stay unchanged
+    now (float): Current time, defaults to time.time()
+    released (Queue): (path, content hash, retry) tuples from the writer for files that were not ingested.
+                      Their hashes are forgotten, so a new copy is queued again, and with retry the
+                      file itself is read again on this scan.
+
+    Returns:
+    int: Number of files queued
+    """
+    now = time.time() if now is None else now
+    while released is not None:
+        try:
+            path, content_hash, retry = released.get_nowait()
+        except queue.Empty:
+            break
+        known_hashes.discard(content_hash)
+        if retry:
+            state.pop(path, None)
+
+    queued = 0
+    found = set()
+    for path in find_exports([root]):
+        found.add(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature = (stat.st_size, stat.st_mtime_ns)
+        size, mtime, stable_since, handled = state.get(path, (None, None, None, False))
+        if (size, mtime) != signature:
+            # Files that already sit there unchanged count as stable since they were last modified
+            state[path] = (*signature, min(now, stat.st_mtime), False)
+            size, mtime, stable_since, handled = state[path]
+        if handled or now - stable_since < debounce:
+            continue
+
+        file_workspace = folder_workspace(root, path, workspace)
+        if file_workspace is None:
+            print(f"skipped {path}: not in a workspace directory", file=sys.stderr)
+        else:
+            try:
+                content_hash = file_hash(path)
+            except OSError:
+                # Locked or removed while reading, tried again on the next scan
+                continue
+            if content_hash in known_hashes:
+                print(f"skipped {path}: already ingested")
+            else:
+                known_hashes.add(content_hash)
+                files.put((path, content_hash, file_workspace))
+                queued += 1
+        state[path] = (size, mtime, stable_since, True)
+
+    for path in set(state) - found:
+        del state[path]
+    return queued
+
+
+def save_batch(batch, released=None):
+    """
+    Claim, parse and save a batch of files, then update the rollups of their workspaces
+
+    Parameters:
+    batch (list): (path, content hash, workspace) tuples
+    released (Queue): Receives (path, content hash, retry) for files that were not ingested,
+                      retry is True when the claim itself failed, see scan_folder
+
+    Returns:
+    tuple: Number of files saved and a list of (path, error) for files that failed
+    """
+    saved = 0
+    failed = []
+    touched = set()
+    for path, content_hash, workspace in batch:
+        claimed = db.claim_file(content_hash, path, workspace)
+        if claimed is None:
+            print(f"retry   {path}: could not be recorded in the database", file=sys.stderr)
+            if released is not None:
+                released.put((path, content_hash, True))
+            continue
+        if not claimed:
+            print(f"skipped {path}: already ingested")
+            continue
+        _, kind, df, posts, error = parse_export(path)
+        if error is None:
+            try:
+                EXPORT_KINDS[kind][1](df, workspace)
+                if posts is not None and not posts.empty:
+                    db.save_posts_data(posts, workspace)
+            except Exception as e:
+                error = str(e)
+        db.finish_file(content_hash, kind, error)
+        if error is not None:
+            failed.append((path, error))
+            print(f"failed  {path}: {error}", file=sys.stderr)
+            if released is not None:
+                released.put((path, content_hash, False))
+            continue
+        touched.add(workspace)
+        saved += 1
+        print(f"saved   {path}: {len(df)} {kind} rows to {workspace}")
+
+    for workspace in sorted(touched):
+        # The rows are saved, so a failed update only leaves the rollups behind until the next write
+        try:
+            rebuild_rollups(workspace, full=False)
+        except Exception as e:
+            print(f"failed  rollups {workspace}: {e}", file=sys.stderr)
+    return saved, failed
+
+
+def _writer(files, released):
+    """Save queued files in batches until None is queued"""
+    while True:
+        batch = [files.get()]
+        while batch[-1] is not None and len(batch) < BATCH_SIZE:
+            try:
+                batch.append(files.get(timeout=BATCH_WAIT_SECONDS))
+            except queue.Empty:
+                break
+        stop = batch[-1] is None
+        if stop:
+            batch.pop()
+        if batch:
+            save_batch(batch, released)
+        if stop:
+            return
+
+
+def watch(root, workspace=None, poll=POLL_SECONDS, debounce=DEBOUNCE_SECONDS, once=False):
+    """
+    Watch a folder and ingest new exports until interrupted
+
+    Parameters:
+    root (str): The folder to watch
+    workspace (str): Workspace of every file, by default the directory each file is in
+    poll (float): Seconds between scans
+    debounce (float): Seconds a file must stay unchanged before it is read
+    once (bool): Scan once, ingest what is complete and return
+    """
+    db.init_db()
+    known_hashes = db.get_ingested_hashes()
+    files = queue.Queue()
+    released = queue.Queue()
+    writer = threading.Thread(target=_writer, args=(files, released), name="ingest-writer")
+    writer.start()
+
+    state = {}
+    try:
+        while True:
+            scan_folder(root, files, state, known_hashes, workspace, debounce, released=released)
+            if once:
+                break
+            time.sleep(poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # The writer finishes the files already queued first
+        files.put(None)
+        writer.join()
@@ -0,0 +1,257 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+import database as db
+from instrumentation import timed, record, record_cache_hit
+
+# Upper bound for the memory of all cached workspace frames together, shared by every session
+MEMORY_BUDGET_BYTES = 256 * 1024 * 1024
+
+TABLE_LOADERS = {
+    "new_followers": db.load_followers_data,
+    "visitor_metrics": db.load_visitor_metrics,
+    "content_metrics": db.load_content_metrics,
+    "posts": db.load_posts_data
+}
+
+# Tables with one row per day, aligned to a complete calendar before they are cached
+CALENDAR_TABLES = ["new_followers", "visitor_metrics", "content_metrics"]
+
+# Boolean column of aligned frames marking days that were missing from the source
+GAP_COLUMN = "Missing day"
+
+# Threads reading the missing tables of a workspace at the same time, 1 reads them one after the other.
+# Every read opens its own SQLite connection, and SQLite and Arrow release the GIL while they wait for storage.
+LOAD_WORKERS = 4
+
+# (workspace, table_name) -> (frame, bytes, data version), least recently used first
+_cache = OrderedDict()
+_lock = threading.Lock()
+# Thread pool of load_workspace, created on first use with LOAD_WORKERS threads
+_executor = {"pool": None, "workers": 0}
+
+
+class WorkspaceFrames(NamedTuple):
+    """The four frames of a workspace, unpacks like the tuple load_workspace used to return"""
+    followers: pd.DataFrame
+    visitors: pd.DataFrame
+    content: pd.DataFrame
+    posts: pd.DataFrame
+
+
+def frame_bytes(df):
+    """Memory used by a frame including its index and the contents of string columns"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _compact_values(values):
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return values
+    if pd.api.types.is_integer_dtype(values.dtype) and len(values):
+        low, high = values.min(), values.max()
+        if low >= 0 and high <= np.iinfo(np.uint32).max:
+            return values.astype(np.uint32)
+        if low >= np.iinfo(np.int32).min and high <= np.iinfo(np.int32).max:
+            return values.astype(np.int32)
+        return values
+    if pd.api.types.is_float_dtype(values.dtype):
+        return values.astype(np.float32)
+    if values.dtype == object:
+        return values.astype("string[pyarrow]")
+    return values
+
+
+def compact_frame(df):
+    """
+    Downcast a loaded frame to compact dtypes
+
+    Counters become uint32 (int32 when negative), rates float32, and titles
+    and links Arrow-backed strings. Dates are left as datetime64. The result
+    never shares memory with the input, so it is safe to keep after a
+    memory-mapped snapshot has been replaced.
+
+    Parameters:
+    df (DataFrame): A frame returned by one of the database load_* functions
+
+    Returns:
+    DataFrame: The compacted copy
+    """
+    if df.empty:
+        return df
+    compact = pd.DataFrame({column: _compact_values(df[column]) for column in df.columns}, copy=True)
+    if compact.index.dtype == object:
+        compact.index = compact.index.astype("string[pyarrow]")
+    return compact
+
+
+def align_to_calendar(df):
+    """
+    Reindex a daily frame to every day between its first and last date
+
+    Days missing from the source are added with zeros, so counter dtypes and
+    totals stay the same, and are flagged in GAP_COLUMN so charts and averages
+    can leave them out.
+
+    Parameters:
+    df (DataFrame): A daily frame indexed by date
+
+    Returns:
+    DataFrame: The aligned copy, or df itself when it is empty or already aligned
+    """
+    if df.empty or GAP_COLUMN in df.columns:
+        return df
+    df = df[df.index.notna()]
+    df.index = df.index.normalize()
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+
+    calendar = pd.date_range(df.index[0], df.index[-1], freq="D", name=df.index.name)
+    aligned = df.reindex(calendar, fill_value=0)
+    aligned[GAP_COLUMN] = ~calendar.isin(df.index)
+    return aligned
+
+
+def _enforce_budget():
+    """Evict least recently used frames until the cache fits the budget, the caller holds the lock"""
+    total = sum(size for _, size, _ in _cache.values())
+    while total > MEMORY_BUDGET_BYTES and _cache:
+        _, (_, size, _) = _cache.popitem(last=False)
+        total -= size
+
+
+def _cached_frame(workspace, table_name, version):
+    """The cached frame of a table when it was loaded at version, None on a miss"""
+    key = (workspace, table_name)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[2] != version:
+            del _cache[key]
+            entry = None
+        if entry is not None:
+            _cache.move_to_end(key)
+    record_cache_hit(f"workspace_cache.{table_name}", entry is not None)
+    return None if entry is None else entry[0]
+
+
+def _cache_frame(workspace, table_name, version, df):
+    """Compact and align a loaded frame and cache it under the data version it was loaded at"""
+    df = compact_frame(df)
+    if table_name in CALENDAR_TABLES:
+        df = align_to_calendar(df)
+    size = frame_bytes(df)
+    # A frame larger than the whole budget is returned without being cached
+    if size <= MEMORY_BUDGET_BYTES:
+        with _lock:
+            _cache[(workspace, table_name)] = (df, size, version)
+            _enforce_budget()
+    return df
+
+
+@timed
+def get_frame(workspace, table_name, version=None):
+    """
+    Get the compacted frame of a table for a workspace, loading it on a cache miss
+
+    Cached frames are tagged with the data version they were loaded at, so a
+    write from any session or process makes the next lookup reload that table.
+
+    Parameters:
+    workspace (str): The workspace name
+    table_name (str): One of new_followers, visitor_metrics, content_metrics or posts
+    version (int): The table's current data version, looked up when not given
+
+    Returns:
+    DataFrame: The cached frame, shared between sessions and not to be modified in place
+    """
+    if version is None:
+        version = db.get_data_versions(workspace).get(table_name, 0)
+
+    df = _cached_frame(workspace, table_name, version)
+    if df is not None:
+        return df
+
+    # The version was read before loading, so a concurrent write can only make the
+    # frame newer than its tag and cause one extra reload, never a stale hit. The loader
+    # skips snapshots older than the version, which lag behind when a refresh has not run yet.
+    return _cache_frame(workspace, table_name, version, TABLE_LOADERS[table_name](workspace, version))
+
+
+def _load_pool():
+    with _lock:
+        if _executor["pool"] is None or _executor["workers"] != LOAD_WORKERS:
+            if _executor["pool"] is not None:
+                _executor["pool"].shutdown(wait=False)
+            _executor.update(pool=ThreadPoolExecutor(max_workers=LOAD_WORKERS, thread_name_prefix="workspace-load"),
+                             workers=LOAD_WORKERS)
+        return _executor["pool"]
+
+
+def _timed_load(table_name, workspace, version):
+    start = time.perf_counter()
+    df = TABLE_LOADERS[table_name](workspace, version)
+    return df, time.perf_counter() - start
+
+
+@timed
+def load_workspace(workspace):
+    """
+    Get all four frames of a workspace through the cache, reloading only the tables that changed
+
+    With LOAD_WORKERS above 1 the tables missing from the cache are read at
+    the same time on the load threads, each with its own SQLite connection,
+    so a cold load waits for the slowest read instead of the sum of all four.
+    The frames are compacted and cached on the calling thread afterwards. The
+    load threads are outside of the caller's rerun, so each read is recorded
+    here as a workspace_cache.read.<table> record.
+
+    Returns:
+    WorkspaceFrames: The followers, visitor metrics, content metrics and posts frames
+    """
+    versions = db.get_data_versions(workspace)
+    frames = {table_name: _cached_frame(workspace, table_name, versions.get(table_name, 0))
+              for table_name in TABLE_LOADERS}
+    missing = [table_name for table_name, df in frames.items() if df is None]
+
+    if LOAD_WORKERS > 1 and len(missing) > 1:
+        pool = _load_pool()
+        reads = {table_name: pool.submit(_timed_load, table_name, workspace, versions.get(table_name, 0))
+                 for table_name in missing}
+        for table_name, read in reads.items():
+            df, seconds = read.result()
+            record(f"workspace_cache.read.{table_name}", seconds, len(df))
+            frames[table_name] = _cache_frame(workspace, table_name, versions.get(table_name, 0), df)
+    else:
+        for table_name in missing:
+            version = versions.get(table_name, 0)
+            frames[table_name] = _cache_frame(workspace, table_name, version,
+                                              TABLE_LOADERS[table_name](workspace, version))
+    return WorkspaceFrames(*(frames[table_name] for table_name in TABLE_LOADERS))
+
+
+def invalidate(workspace=None, table_name=None):
+    """Drop cached frames of a workspace and/or table, or everything when called without arguments"""
+    with _lock:
+        for key in list(_cache):
+            if (workspace is None or key[0] == workspace) and (table_name is None or key[1] == table_name):
+                del _cache[key]
+
+
+def memory_report():
+    """
+    Report the memory held by the cache
+
+    Returns:
+    dict: Bytes per cached workspace under 'workspaces', plus 'total_bytes' and 'budget_bytes'
+    """
+    with _lock:
+        workspaces = {}
+        for (workspace, _), (_, size, _) in _cache.items():
+            workspaces[workspace] = workspaces.get(workspace, 0) + size
+    return {
+        "workspaces": workspaces,
+        "total_bytes": sum(workspaces.values()),
+        "budget_bytes": MEMORY_BUDGET_BYTES
+    }